@@ -1,15 +1,114 @@
-from flask import Flask, request, jsonify
+import json
+import hashlib
+from flask import Flask, Response, request, jsonify, g
 from flask_cors import CORS
+from vcs.config import (
+    LOG_PAGE_SIZE, LOG_PAGE_MAX, DIFF_ALGORITHM, CACHE_MAX_BYTES, REPOS_DIR, REPO_POOL_SIZE
+)
+from vcs.cache import LRUCache
+from vcs.repository import RepositoryPool, current_repo, enter_repo, leave_repo
+from vcscore.linediff import ALGORITHMS
 from vcs.vcs  import (
-    init_repo, add_file, commit, commit_all, log_commits, log_branch, 
-    status, diff, diff_commits, restore, history, branch, checkout_branch, 
+    init_repo, add_file, commit, commit_all, iter_log, log_page, log_branch,
+    log_branch_page, log_length, list_tree, read_branch, status, diff, diff_commits, diff_file,
+    restore, history, history_page, history_length, branch, checkout_branch, 
     current_branch, rm, reset, tag, list_tags, stash, stash_pop, revert, 
-    merge, push, pull
+    merge, push, pull, gc, resolve_commit
 )
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for frontend requests (React uses port 3000)
 
+# Repositories hosted by this server, opened on first use
+repositories = RepositoryPool(REPOS_DIR, REPO_POOL_SIZE)
+
+@app.before_request
+def select_repository():
+    """Run the request against the repository named by ``X-Repo`` or ``?repo=``, if any."""
+    repo_id = request.headers.get("X-Repo") or request.args.get("repo")
+    if repo_id is None:
+        repository = current_repo()
+    else:
+        try:
+            repository = repositories.get(repo_id)
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        if request.endpoint != "init" and not repository.exists():
+            return jsonify({"success": False, "error": "Repository not found."}), 404
+    error = repository.format_error()
+    if error is not None:
+        return jsonify({"success": False, "error": error}), 409
+    if repo_id is not None:
+        g.repo_token = enter_repo(repository)
+
+@app.teardown_request
+def release_repository(exc):
+    # Server threads are reused, so the next request must not inherit it
+    token = g.pop("repo_token", None)
+    if token is not None:
+        leave_repo(token)
+
+# Entries serialized per chunk of a streamed JSON array
+STREAM_BATCH = 500
+
+def stream_json_array(items):
+    """Serialize an iterable as a JSON array chunk by chunk, without building it in memory."""
+    yield "["
+    batch = []
+    first = True
+    for item in items:
+        batch.append(json.dumps(item))
+        if len(batch) == STREAM_BATCH:
+            yield ("" if first else ",") + ",".join(batch)
+            batch, first = [], False
+    if batch:
+        yield ("" if first else ",") + ",".join(batch)
+    yield "]"
+
+# Responses that only depend on commit IDs never change, since commits are
+# immutable. They are keyed by full IDs, as a prefix that names one commit
+# today may be ambiguous tomorrow. Log, branch log and file history responses
+# are keyed by the ref state they were computed from (log length, branch tip).
+response_cache = LRUCache(CACHE_MAX_BYTES)
+
+def cached_json(key, compute):
+    """Serve ``compute()`` as JSON through the response cache, with an ETag; failures get a 400."""
+    key = (current_repo().root,) + key
+    entry = response_cache.get(key)
+    if entry is None:
+        result = compute()
+        if isinstance(result, dict) and not result.get("success", True):
+            return jsonify(result), 400
+        body = json.dumps(result).encode()
+        entry = (body, hashlib.sha1(body).hexdigest())
+        response_cache.put(key, *entry)
+    body, etag = entry
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    # Let browsers keep the response but revalidate it on every use
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+def bad_request(error):
+    return jsonify({"success": False, "error": str(error)}), 400
+
+def int_arg(name, default=None):
+    """Read an integer query argument, raising ValueError if it is not one."""
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Query argument '{name}' must be an integer.") from None
+
+def page_args():
+    """Read the ``limit`` query argument, clamped to the allowed page sizes."""
+    return max(1, min(int_arg("limit", LOG_PAGE_SIZE), LOG_PAGE_MAX))
+
+def is_paged():
+    return "limit" in request.args or "after" in request.args
+
 # === Basic Operations ===
 
 @app.route("/", methods=["GET"])
@@ -19,7 +118,12 @@ def index():
         "endpoints": [
             "/init (POST)",
             "/status (GET)",
-            "/log (GET)",
+            "/log (GET, ?limit=&after=)",
+            "/log/<branch> (GET, ?limit=&after=)",
+            "/history/<path:filename> (GET, ?limit=&after=)",
+            "/tree/<commit_id> (GET)",
+            "/cache (GET)",
+            "/repos (GET)",
             "/commit (POST)",
             "/add (POST)",
             "/current-branch (GET)",
@@ -30,7 +134,8 @@ def index():
             "/merge (POST)",
             "/revert (POST)",
             "/push (POST)",
-            "/pull (POST)"
+            "/pull (POST)",
+            "/gc (POST)"
         ]
     })
 
@@ -65,11 +170,27 @@ def status_route():
 
 @app.route("/log", methods=["GET"])
 def log_route():
-    return jsonify(log_commits())
+    # With ?limit= or ?after= return one page, newest first; otherwise
+    # stream the full log, oldest first.
+    if is_paged():
+        try:
+            limit, after = page_args(), int_arg("after")
+        except ValueError as e:
+            return bad_request(e)
+        return cached_json(("log", log_length(), limit, after), lambda: log_page(limit, after))
+    return Response(stream_json_array(iter_log()), mimetype="application/json")
 
 @app.route("/log/<branch_name>", methods=["GET"])
 def log_branch_route(branch_name):
-    return jsonify(log_branch(branch_name))
+    tip = read_branch(branch_name)
+    if is_paged():
+        try:
+            limit, after = page_args(), request.args.get("after")
+        except ValueError as e:
+            return bad_request(e)
+        return cached_json(("log_branch", branch_name, tip, limit, after),
+                           lambda: log_branch_page(branch_name, limit, after))
+    return cached_json(("log_branch", branch_name, tip), lambda: log_branch(branch_name))
 
 @app.route("/diff", methods=["POST"])
 def diff_route():
@@ -79,7 +200,37 @@ def diff_route():
 
 @app.route("/diff/<commit1>/<commit2>", methods=["GET"])
 def diff_commits_route(commit1, commit2):
-    return jsonify({"diff": diff_commits(commit1, commit2)})
+    # ?summary=1 lists the changed files without computing any line diffs
+    algorithm = request.args.get("algorithm", DIFF_ALGORITHM)
+    if algorithm not in ALGORITHMS:
+        return jsonify({"success": False, "error": f"Unknown diff algorithm: {algorithm}"}), 400
+    summary = request.args.get("summary") == "1"
+    try:
+        commit1, commit2 = resolve_commit(commit1), resolve_commit(commit2)
+    except ValueError as e:
+        return bad_request(e)
+    return cached_json(("diff", commit1, commit2, algorithm, summary),
+                       lambda: diff_commits(commit1, commit2, algorithm, summary))
+
+@app.route("/diff/<commit1>/<commit2>/<path:filename>", methods=["GET"])
+def diff_file_route(commit1, commit2, filename):
+    algorithm = request.args.get("algorithm", DIFF_ALGORITHM)
+    if algorithm not in ALGORITHMS:
+        return jsonify({"success": False, "error": f"Unknown diff algorithm: {algorithm}"}), 400
+    try:
+        commit1, commit2 = resolve_commit(commit1), resolve_commit(commit2)
+    except ValueError as e:
+        return bad_request(e)
+    return cached_json(("diff_file", commit1, commit2, filename, algorithm),
+                       lambda: diff_file(commit1, commit2, filename, algorithm))
+
+@app.route("/tree/<commit_id>", methods=["GET"])
+def tree_route(commit_id):
+    try:
+        commit_id = resolve_commit(commit_id)
+    except ValueError as e:
+        return bad_request(e)
+    return cached_json(("tree", commit_id), lambda: list_tree(commit_id))
 
 @app.route("/restore", methods=["POST"])
 def restore_route():
@@ -89,9 +240,17 @@ def restore_route():
     result = restore(commit_id, filename)
     return jsonify(result), 400 if not result["success"] else 200
 
-@app.route("/history/<filename>", methods=["GET"])
+@app.route("/history/<path:filename>", methods=["GET"])
 def history_route(filename):
-    return jsonify(history(filename))
+    version = history_length(filename)
+    if is_paged():
+        try:
+            limit, after = page_args(), int_arg("after")
+        except ValueError as e:
+            return bad_request(e)
+        return cached_json(("history", filename, version, limit, after),
+                           lambda: history_page(filename, limit, after))
+    return cached_json(("history", filename, version), lambda: history(filename))
 
 # === Branching ===
 
@@ -171,6 +330,20 @@ def pull_route():
     data = request.json
     return jsonify(pull(data["remote_path"]))
 
+# === Maintenance ===
+
+@app.route("/gc", methods=["POST"])
+def gc_route():
+    return jsonify(gc())
+
+@app.route("/cache", methods=["GET"])
+def cache_route():
+    return jsonify(response_cache.stats())
+
+@app.route("/repos", methods=["GET"])
+def repos_route():
+    return jsonify(repositories.stats())
+
 # === Run ===
 
 if __name__ == "__main__":
@@ -0,0 +1,266 @@
+"""Asyncio variant of the MyVCS API; long operations run as jobs reported on /jobs/<id>.
+
+    python async_app.py --port 8080
+"""
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+from vcs.config import LOG_PAGE_SIZE, LOG_PAGE_MAX, JOBS, REPOS_DIR, REPO_POOL_SIZE
+from vcs.progress import Progress
+from vcs.repository import RepositoryPool, current_repo, using_repo
+from vcs.vcs import (
+    init_repo, add_file, commit, commit_all, checkout, checkout_branch, current_branch,
+    log_page, log_branch_page, status, push, pull
+)
+
+# Threads running repository operations, shared by jobs and quick requests
+WORKERS = 16
+
+# How long finished jobs stay queryable, and how often SSE streams report
+JOB_TTL = 3600
+EVENT_INTERVAL = 0.5
+
+executor = ThreadPoolExecutor(max_workers=WORKERS)
+repositories = RepositoryPool(REPOS_DIR, REPO_POOL_SIZE)
+
+class Job:
+    """A repository operation running in the background."""
+
+    def __init__(self, kind):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.state = "running"
+        self.progress = Progress()
+        self.result = None
+        self.error = None
+        self.started = time.time()
+        self.finished = None
+        self.done = asyncio.Event()
+
+    def to_dict(self):
+        return {"id": self.id, "kind": self.kind, "state": self.state,
+                "progress": self.progress.snapshot(), "result": self.result,
+                "error": self.error, "started": self.started, "finished": self.finished}
+
+jobs = {}
+# Tasks are referenced here so they are not garbage collected while running
+tasks = set()
+
+def prune_jobs():
+    cutoff = time.time() - JOB_TTL
+    for job_id in [job_id for job_id, job in jobs.items() if job.finished and job.finished < cutoff]:
+        del jobs[job_id]
+
+async def run_blocking(fn, *args, **kwargs):
+    # run_in_executor does not carry context variables over on its own, and
+    # the current repository is one
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, context.run, functools.partial(fn, *args, **kwargs))
+
+def start_job(kind, fn, *args, **kwargs):
+    """Run ``fn(*args, progress=..., **kwargs)`` in the thread pool and return its Job."""
+    prune_jobs()
+    job = Job(kind)
+    jobs[job.id] = job
+
+    async def run():
+        try:
+            job.result = await run_blocking(fn, *args, progress=job.progress, **kwargs)
+            failed = isinstance(job.result, dict) and not job.result.get("success", True)
+            job.state = "failed" if failed else "done"
+        except Exception as e:
+            job.state = "failed"
+            job.error = str(e)
+        job.finished = time.time()
+        job.done.set()
+
+    task = asyncio.create_task(run())
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+    return job
+
+def job_response(job):
+    return web.json_response({"success": True, "job": job.id, "status_url": f"/jobs/{job.id}",
+                              "events_url": f"/jobs/{job.id}/events"}, status=202)
+
+def result_response(result):
+    failed = isinstance(result, dict) and not result.get("success", True)
+    return web.json_response(result, status=400 if failed else 200)
+
+def bad_request(error):
+    return web.json_response({"success": False, "error": error}, status=400)
+
+def int_arg(request, name, default=None):
+    """Read an integer query argument, raising ValueError if it is not one."""
+    value = request.query.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Query argument '{name}' must be an integer.") from None
+
+def page_limit(request):
+    """Read the ``limit`` query argument, clamped to the allowed page sizes."""
+    return max(1, min(int_arg(request, "limit", LOG_PAGE_SIZE), LOG_PAGE_MAX))
+
+@web.middleware
+async def cors(request, handler):
+    # The React dev server runs on another port
+    if request.method == "OPTIONS":
+        response = web.Response()
+    else:
+        response = await handler(request)
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    response.headers["Access-Control-Allow-Headers"] = "Content-Type, X-Repo"
+    response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
+    return response
+
+@web.middleware
+async def select_repository(request, handler):
+    """Run the request against the repository named by ``X-Repo`` or ``?repo=``, if any."""
+    repo_id = request.headers.get("X-Repo") or request.query.get("repo")
+    if repo_id is None:
+        repository = current_repo()
+    else:
+        try:
+            repository = repositories.get(repo_id)
+        except ValueError as e:
+            return bad_request(str(e))
+        if request.path != "/init" and not repository.exists():
+            return web.json_response({"success": False, "error": "Repository not found."}, status=404)
+    error = repository.format_error()
+    if error is not None:
+        return web.json_response({"success": False, "error": error}, status=409)
+    with using_repo(repository):
+        return await handler(request)
+
+routes = web.RouteTableDef()
+
+# === Quick operations ===
+
+@routes.post("/init")
+async def init_route(request):
+    await run_blocking(init_repo)
+    return web.json_response({"success": True})
+
+@routes.get("/status")
+async def status_route(request):
+    return web.json_response(await run_blocking(status))
+
+@routes.get("/current-branch")
+async def current_branch_route(request):
+    return web.json_response({"branch": await run_blocking(current_branch)})
+
+@routes.get("/log")
+async def log_route(request):
+    try:
+        limit, after = page_limit(request), int_arg(request, "after")
+    except ValueError as e:
+        return bad_request(str(e))
+    return web.json_response(await run_blocking(log_page, limit, after))
+
+@routes.get("/log/{branch}")
+async def log_branch_route(request):
+    try:
+        limit = page_limit(request)
+    except ValueError as e:
+        return bad_request(str(e))
+    result = await run_blocking(log_branch_page, request.match_info["branch"], limit,
+                                request.query.get("after"))
+    return result_response(result)
+
+@routes.post("/add")
+async def add_route(request):
+    data = await request.json()
+    await run_blocking(add_file, data.get("filename"))
+    return web.json_response({"success": True, "file": data.get("filename")})
+
+# === Long-running operations (background jobs) ===
+
+@routes.post("/commit")
+async def commit_route(request):
+    data = await request.json()
+    if data.get("all", False):
+        return job_response(start_job("commit", commit_all, data.get("message"), JOBS))
+    return result_response(await run_blocking(commit, data.get("message")))
+
+@routes.post("/checkout")
+async def checkout_route(request):
+    data = await request.json()
+    return job_response(start_job("checkout", checkout, data["commit_id"], JOBS))
+
+@routes.post("/checkout-branch")
+async def checkout_branch_route(request):
+    data = await request.json()
+    # Switching branches only moves HEAD, so there is no progress to report
+    return result_response(await run_blocking(checkout_branch, data.get("name")))
+
+@routes.post("/push")
+async def push_route(request):
+    data = await request.json()
+    return job_response(start_job("push", push, data["remote_path"]))
+
+@routes.post("/pull")
+async def pull_route(request):
+    data = await request.json()
+    return job_response(start_job("pull", pull, data["remote_path"]))
+
+# === Jobs ===
+
+@routes.get("/jobs")
+async def jobs_route(request):
+    return web.json_response([job.to_dict() for job in jobs.values()])
+
+@routes.get("/jobs/{job_id}")
+async def job_route(request):
+    job = jobs.get(request.match_info["job_id"])
+    if job is None:
+        return web.json_response({"success": False, "error": "Job not found."}, status=404)
+    return web.json_response(job.to_dict())
+
+@routes.get("/jobs/{job_id}/events")
+async def job_events_route(request):
+    """Stream a job's progress as server-sent events until it finishes."""
+    job = jobs.get(request.match_info["job_id"])
+    if job is None:
+        return web.json_response({"success": False, "error": "Job not found."}, status=404)
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream",
+                                           "Cache-Control": "no-cache",
+                                           "Access-Control-Allow-Origin": "*"})
+    await response.prepare(request)
+    while True:
+        finished = job.done.is_set()
+        event = "done" if finished else "progress"
+        await response.write(f"event: {event}\ndata: {json.dumps(job.to_dict())}\n\n".encode())
+        if finished:
+            break
+        try:
+            await asyncio.wait_for(job.done.wait(), EVENT_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+    await response.write_eof()
+    return response
+
+def create_app():
+    app = web.Application(middlewares=[cors, select_repository])
+    app.add_routes(routes)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the asyncio MyVCS API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+    web.run_app(create_app(), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Concurrent-commit load test for the MyVCS API: checks that no acknowledged commit is lost.
+
+    python loadtest.py --url http://127.0.0.1:8000 --clients 50 --commits 10
+"""
+import sys
+import json
+import time
+import argparse
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+def request(url, data=None):
+    body = json.dumps(data).encode() if data is not None else None
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=120) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"null")
+
+def client(base, number, commits):
+    acknowledged, failures = [], []
+    for i in range(commits):
+        status, result = request(f"{base}/commit", {"message": f"load test {number}-{i}", "all": True})
+        if status == 200 and result.get("success"):
+            acknowledged.append(result["commit_id"])
+        else:
+            failures.append(result)
+        # Readers interleaved with the writers
+        request(f"{base}/log?limit=20")
+        request(f"{base}/status")
+    return acknowledged, failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that concurrent commits are never lost.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--commits", type=int, default=10, help="commits per client")
+    args = parser.parse_args()
+    base = args.url.rstrip("/")
+
+    _, before = request(f"{base}/log")
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        results = list(pool.map(lambda n: client(base, n, args.commits), range(args.clients)))
+    elapsed = time.time() - start
+
+    acknowledged = [cid for ids, _ in results for cid in ids]
+    failures = [f for _, fs in results for f in fs]
+    _, after = request(f"{base}/log")
+    _, branch = request(f"{base}/current-branch")
+    _, branch_log = request(f"{base}/log/{branch['branch']}")
+
+    logged = {entry["id"] for entry in after}
+    reachable = {entry["id"] for entry in branch_log}
+    problems = []
+    if len(set(acknowledged)) != len(acknowledged):
+        problems.append("duplicate commit IDs were handed out")
+    if len(after) - len(before) != len(acknowledged):
+        problems.append(f"log grew by {len(after) - len(before)}, expected {len(acknowledged)}")
+    missing_log = [cid for cid in acknowledged if cid not in logged]
+    if missing_log:
+        problems.append(f"{len(missing_log)} acknowledged commits missing from the log")
+    missing_branch = [cid for cid in acknowledged if cid not in reachable]
+    if missing_branch:
+        problems.append(f"{len(missing_branch)} acknowledged commits not reachable from {branch['branch']}")
+
+    print(f"{args.clients} clients, {len(acknowledged)} commits acknowledged, "
+          f"{len(failures)} rejected, {elapsed:.1f}s ({len(acknowledged) / elapsed:.1f} commits/s)")
+    if failures:
+        print(f"First rejection: {failures[0]}")
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    if problems:
+        sys.exit(1)
+    print("OK: no lost commits")
+
+if __name__ == "__main__":
+    main()
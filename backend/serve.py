@@ -0,0 +1,18 @@
+"""Production entry point for the MyVCS API, served by waitress on a pool of threads.
+
+    python serve.py --host 0.0.0.0 --port 8000 --threads 16
+"""
+import argparse
+from waitress import serve
+from app import app
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the MyVCS API with waitress.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--threads", type=int, default=16, help="worker threads (default: 16)")
+    args = parser.parse_args()
+    serve(app, host=args.host, port=args.port, threads=args.threads)
+
+if __name__ == "__main__":
+    main()
@@ -5,14 +5,50 @@ VCS_DIR = ".myvcs"
 
 # Subdirectories within .myvcs
 COMMITS_DIR = os.path.join(VCS_DIR, "commits")
-INDEX_DIR = os.path.join(VCS_DIR, "index")
+OBJECTS_DIR = os.path.join(VCS_DIR, "objects")
 BRANCHES_DIR = os.path.join(VCS_DIR, "branches")
 STASH_DIR = os.path.join(VCS_DIR, "stash")
 
 # Metadata files
-LOG_FILE = os.path.join(VCS_DIR, "log.json")
+INDEX_FILE = os.path.join(VCS_DIR, "index.json")
+STAT_CACHE_FILE = os.path.join(VCS_DIR, "stat_cache.json")
+LOG_FILE = os.path.join(VCS_DIR, "log.jsonl")
+LOG_INDEX_FILE = os.path.join(VCS_DIR, "log.idx")
+# Log of the old copy-per-commit format, which is refused (see vcscore/commitlog.py)
+LEGACY_LOG_FILE = os.path.join(VCS_DIR, "log.json")
+COMMIT_GRAPH_FILE = os.path.join(VCS_DIR, "commit-graph")
+COMMIT_IDS_FILE = os.path.join(VCS_DIR, "commit-ids")
+HISTORY_DIR = os.path.join(VCS_DIR, "history")
 TAGS_FILE = os.path.join(VCS_DIR, "tags.json")
 HEAD_FILE = os.path.join(VCS_DIR, "HEAD")
+MERGE_HEAD_FILE = os.path.join(VCS_DIR, "MERGE_HEAD")
+MERGE_CONFLICTS_FILE = os.path.join(VCS_DIR, "MERGE_CONFLICTS")
+LOCK_FILE = os.path.join(VCS_DIR, "lock")
+
+# Socket directory of the workspace monitor (see vcscore/monitor.py)
+MONITOR_DIR = os.path.join(VCS_DIR, "monitor")
 
 # The working directory where user files are
-WORKSPACE_DIR = "workspace"
\ No newline at end of file
+WORKSPACE_DIR = "workspace"
+
+# Recorded as the author of new commits (and hashed into their IDs)
+AUTHOR = os.environ.get("VCS_AUTHOR") or os.environ.get("USER") or os.environ.get("USERNAME") or "unknown"
+
+# Line diff algorithm: "myers" or "patience"
+DIFF_ALGORITHM = "myers"
+
+# Files larger than this are reported as changed without a line diff
+MAX_DIFF_SIZE = 8 * 1024 * 1024
+
+# Worker threads used to hash, store and materialize files
+JOBS = os.cpu_count() or 1
+
+# Upper bound on the memory used by the API response cache
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Commit log pages: default and largest number of entries per request
+LOG_PAGE_SIZE = 50
+LOG_PAGE_MAX = 1000
+# Hosted repositories live in <REPOS_DIR>/<repo id>; this many stay open at once
+REPOS_DIR = "repos"
+REPO_POOL_SIZE = 128
@@ -0,0 +1,47 @@
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+class RepoLock:
+    """Re-entrant reader/writer lock on a repository, shared by threads and processes."""
+
+    def __init__(self, path):
+        self.path = path
+        self._held = threading.local()
+        self._mutex = threading.RLock()
+
+    @contextmanager
+    def _acquire(self, exclusive):
+        held = getattr(self._held, "mode", None)
+        if held is not None:
+            if exclusive and held != "exclusive":
+                raise RuntimeError("cannot upgrade a shared repository lock to exclusive")
+            yield
+            return
+
+        self._held.mode = "exclusive" if exclusive else "shared"
+        try:
+            if fcntl is None:
+                with self._mutex:
+                    yield
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a") as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._held.mode = None
+
+    def shared(self):
+        return self._acquire(exclusive=False)
+
+    def exclusive(self):
+        return self._acquire(exclusive=True)
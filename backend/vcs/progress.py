@@ -0,0 +1,28 @@
+import threading
+
+class Progress:
+    """Thread-safe counters of work done by a long-running operation."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.files_total = None
+        self.files_done = 0
+        self.bytes_total = None
+        self.bytes_done = 0
+
+    def expect(self, files=None, size=None):
+        with self._lock:
+            if files is not None:
+                self.files_total = (self.files_total or 0) + files
+            if size is not None:
+                self.bytes_total = (self.bytes_total or 0) + size
+
+    def advance(self, files=0, size=0):
+        with self._lock:
+            self.files_done += files
+            self.bytes_done += size
+
+    def snapshot(self):
+        with self._lock:
+            return {"files_done": self.files_done, "files_total": self.files_total,
+                    "bytes_done": self.bytes_done, "bytes_total": self.bytes_total}
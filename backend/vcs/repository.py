@@ -0,0 +1,135 @@
+import os
+import re
+import time
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from vcscore.objects import ObjectStore
+from vcscore.commitlog import CommitLog, legacy_format
+from vcscore.filehistory import FileHistory
+from vcscore.commitgraph import CommitGraph
+from vcscore.commitids import CommitIds
+from .config import *
+from .lock import RepoLock
+
+# Files modified this recently are re-read, as their stat may not change on rewrite
+RACY_NS = 1_000_000_000
+
+# Repository IDs become directory names, so they may not contain separators
+# or start with a dot
+REPO_ID = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9._-]{0,99}")
+
+class Repository:
+    """The paths and open handles of one repository under ``root``."""
+
+    def __init__(self, root=""):
+        self.root = root
+        self.vcs_dir = os.path.join(root, VCS_DIR)
+        self.commits_dir = os.path.join(root, COMMITS_DIR)
+        self.objects_dir = os.path.join(root, OBJECTS_DIR)
+        self.branches_dir = os.path.join(root, BRANCHES_DIR)
+        self.stash_dir = os.path.join(root, STASH_DIR)
+        self.index_file = os.path.join(root, INDEX_FILE)
+        self.stat_cache_file = os.path.join(root, STAT_CACHE_FILE)
+        self.log_file = os.path.join(root, LOG_FILE)
+        self.log_index_file = os.path.join(root, LOG_INDEX_FILE)
+        self.legacy_log_file = os.path.join(root, LEGACY_LOG_FILE)
+        self.commit_graph_file = os.path.join(root, COMMIT_GRAPH_FILE)
+        self.commit_ids_file = os.path.join(root, COMMIT_IDS_FILE)
+        self.history_dir = os.path.join(root, HISTORY_DIR)
+        self.tags_file = os.path.join(root, TAGS_FILE)
+        self.head_file = os.path.join(root, HEAD_FILE)
+        self.merge_head_file = os.path.join(root, MERGE_HEAD_FILE)
+        self.merge_conflicts_file = os.path.join(root, MERGE_CONFLICTS_FILE)
+        self.lock_file = os.path.join(root, LOCK_FILE)
+        self.workspace_dir = os.path.join(root, WORKSPACE_DIR)
+        self.monitor_dir = os.path.join(root, MONITOR_DIR)
+
+        self.store = ObjectStore(self.objects_dir)
+        self.commit_log = CommitLog(self.log_file, self.log_index_file)
+        self.file_history = FileHistory(self.history_dir)
+        self.commit_graph = CommitGraph(self.commit_graph_file)
+        self.commit_ids = CommitIds(self.commit_ids_file)
+        self.lock = RepoLock(self.lock_file)
+        # Commit log length the derived files were last brought up to date for
+        self.derived_log_length = None
+        self._files = {}
+        self._files_lock = threading.Lock()
+
+    def exists(self):
+        return os.path.isdir(self.vcs_dir)
+
+    def format_error(self):
+        """Return why this version cannot use the repository, or None."""
+        return legacy_format(self.log_file, self.legacy_log_file, self.commits_dir, self.branches_dir)
+
+    def read_cached(self, path, parse):
+        """Return ``parse(path)``, or None if the file is missing, reused until the file changes."""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._files_lock:
+            cached = self._files.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        value = parse(path)
+        if st.st_mtime_ns < time.time_ns() - RACY_NS:
+            with self._files_lock:
+                self._files[path] = (signature, value)
+        return value
+
+class RepositoryPool:
+    """Repositories under ``root`` opened on demand, keyed by ID, at most ``size`` at a time."""
+
+    def __init__(self, root, size):
+        self.root = root
+        self.size = size
+        self.opened = 0
+        self.evictions = 0
+        self._repos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, repo_id):
+        """Return the repository with this ID, opening it if needed (it may not exist yet)."""
+        if not REPO_ID.fullmatch(repo_id):
+            raise ValueError(f"Invalid repository ID: {repo_id}")
+        with self._lock:
+            repository = self._repos.pop(repo_id, None)
+            if repository is None:
+                repository = Repository(os.path.join(self.root, repo_id))
+                self.opened += 1
+            self._repos[repo_id] = repository
+            while len(self._repos) > self.size:
+                self._repos.popitem(last=False)
+                self.evictions += 1
+            return repository
+
+    def stats(self):
+        with self._lock:
+            return {"open": len(self._repos), "size": self.size,
+                    "opened": self.opened, "evictions": self.evictions}
+
+_current = contextvars.ContextVar("repository", default=Repository())
+
+def current_repo():
+    """Return the repository the current request (or thread) works on."""
+    return _current.get()
+
+def enter_repo(repository):
+    """Make ``repository`` current and return a token for ``leave_repo()``."""
+    return _current.set(repository)
+
+def leave_repo(token):
+    _current.reset(token)
+
+@contextmanager
+def using_repo(repository):
+    """Make ``repository`` current for the duration of a ``with`` block."""
+    token = enter_repo(repository)
+    try:
+        yield repository
+    finally:
+        leave_repo(token)
@@ -1,76 +1,256 @@
 import os
 import shutil
-import hashlib
 import json
+import functools
 from datetime import datetime
+from vcscore.statcache import StatCache
+from vcscore.parallel import run_parallel
+from vcscore.linediff import diff_bytes, oversize_notice
+from vcscore.commitlog import READ_BATCH, walk_history
+from vcscore.sync import sync, commit_graph, resolve_commit as find_commit
+from vcscore.commitids import commit_hash
+from vcscore.atomic import atomic_write, atomic_write_json
+from vcscore import tree
+from vcscore import monitor
+from vcscore.merge import (merge_trees, apply_merge, record_conflicts, read_conflicts,
+                           resolve_conflicts, conflicts_error)
 from .config import *
-import difflib
-
+from .repository import Repository, current_repo
+
+def reads(fn):
+    """Run ``fn`` under the shared repository lock, in parallel with other readers.
+
+    The files derived from the commit log are brought up to date under the
+    exclusive lock first, so that readers never write them.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        repo = current_repo()
+        while True:
+            with repo.lock.shared():
+                if not derived_stale(repo):
+                    return fn(*args, **kwargs)
+            with repo.lock.exclusive():
+                refresh_derived(repo)
+    return wrapper
+
+def writes(fn):
+    """Run ``fn`` under the exclusive repository lock."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with current_repo().lock.exclusive():
+            return fn(*args, **kwargs)
+    return wrapper
+
+def read_json(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+def read_text(path):
+    with open(path, "r") as f:
+        return f.read().strip()
+
+def read_index():
+    """Return the staging area as a mapping of filename to object ID."""
+    repo = current_repo()
+    # A copy, since callers update it and the parsed index is shared
+    return dict(repo.read_cached(repo.index_file, read_json) or {})
+
+def write_index(entries):
+    """Replace the staging area with the given entries."""
+    atomic_write_json(current_repo().index_file, entries)
+
+def write_tree(files):
+    """Store a path -> entry mapping as one tree object per directory; return the root's ID."""
+    return tree.write(current_repo().store, files)
+
+def read_tree(tree_id):
+    """Return the path -> entry mapping of every file under a tree."""
+    return tree.flatten(current_repo().store, tree_id)
+
+def workspace_path(path):
+    """Return where the file with index key ``path`` lives in the workspace."""
+    return os.path.join(current_repo().workspace_dir, *path.split("/"))
+
+def workspace_files():
+    """Return the paths of all files in the workspace, relative to it and separated by "/"."""
+    repo = current_repo()
+    files = monitor.query(repo.monitor_dir)
+    if files is not None:
+        return sorted(files)
+    return tree.list_files(repo.workspace_dir) if os.path.exists(repo.workspace_dir) else []
+
+def workspace_state(cache, jobs=JOBS):
+    """Return path -> tree entry for every workspace file, from the monitor if one is running."""
+    repo = current_repo()
+    files = monitor.query(repo.monitor_dir)
+    if files is not None:
+        return files
+    paths = tree.list_files(repo.workspace_dir) if os.path.exists(repo.workspace_dir) else []
+    return dict(zip(paths, run_parallel(lambda path: cache.entry(workspace_path(path)), paths, jobs)))
+
+def commit_tree(commit_id):
+    """Return the root tree ID of a commit, or None if it does not exist."""
+    commit = read_commit(commit_id)
+    return commit["tree"] if commit is not None else None
+
+def commit_file(commit_id):
+    """Return the path of a commit record."""
+    return os.path.join(current_repo().commits_dir, f"{commit_id}.json")
+
+def commit_exists(commit_id):
+    """Check whether a commit exists."""
+    return os.path.exists(commit_file(commit_id))
+
+def read_commit(commit_id):
+    """Return a commit (id, timestamp, message, parents, tree), or None if it does not exist."""
+    path = commit_file(commit_id)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+@reads
+def resolve_commit(name):
+    """Return the full ID of a commit ID or unique prefix; ValueError if the prefix is ambiguous."""
+    return find_commit(current_repo(), name) or name
+
+def commit_files(commit_id):
+    """Return the filename -> object ID mapping of a commit, or None."""
+    commit = read_commit(commit_id)
+    return read_tree(commit["tree"]) if commit is not None else None
+
+def branch_file(name):
+    """Return the path of a branch ref."""
+    return os.path.join(current_repo().branches_dir, name)
+
+def read_branch(name):
+    """Return the tip commit of a branch, or None if it has no commits."""
+    return current_repo().read_cached(branch_file(name), read_text) or None
+
+def write_branch(name, commit_id):
+    """Point a branch ref at a commit."""
+    atomic_write(branch_file(name), commit_id or "")
+
+def head_commit():
+    """Return the tip of the current branch, or None before the first commit."""
+    return read_branch(get_current_branch())
+
+def ensure_file_history():
+    """Build the per-file history index from the commit log if it is missing."""
+    repo = current_repo()
+    if not repo.file_history.exists():
+        repo.file_history.rebuild((entry, commit_files(entry["id"]) or {}) for entry in repo.commit_log)
+
+def derived_stale(repo):
+    """Check whether the commit graph, commit IDs or file history may lag behind the commit log."""
+    return repo.exists() and (repo.derived_log_length != len(repo.commit_log)
+                              or not repo.file_history.exists())
+
+def refresh_derived(repo):
+    """Bring the commit graph, commit IDs and file history up to date with the commit log."""
+    repo.commit_ids.update(commit_graph(repo))
+    ensure_file_history()
+    repo.derived_log_length = len(repo.commit_log)
+
+def iter_history(tip, after=None, batch=READ_BATCH):
+    """Yield the log entries of the commits reachable from ``tip``, children before parents; ValueError if ``after`` is unknown."""
+    if tip:
+        repo = current_repo()
+        yield from walk_history(repo.commit_log, commit_graph(repo), tip, after, batch)
+
+@writes
 def init_repo():
     """Initialize a new repository."""
-    os.makedirs(WORKSPACE_DIR, exist_ok=True)
-    os.makedirs(VCS_DIR, exist_ok=True)
-    os.makedirs(COMMITS_DIR, exist_ok=True)
-    os.makedirs(INDEX_DIR, exist_ok=True)
-    os.makedirs(BRANCHES_DIR, exist_ok=True)
-    os.makedirs(STASH_DIR, exist_ok=True)
-    if not os.path.exists(LOG_FILE):
-        with open(LOG_FILE, "w") as f:
-            json.dump([], f)
-    if not os.path.exists(TAGS_FILE):
-        with open(TAGS_FILE, "w") as f:
-            json.dump({}, f)
-    if not os.path.exists(HEAD_FILE):
-        with open(HEAD_FILE, "w") as f:
-            f.write("main")
-    main_branch = os.path.join(BRANCHES_DIR, "main.json")
-    if not os.path.exists(main_branch):
-        with open(main_branch, "w") as f:
-            json.dump([], f)
-
+    repo = current_repo()
+    os.makedirs(repo.workspace_dir, exist_ok=True)
+    os.makedirs(repo.vcs_dir, exist_ok=True)
+    os.makedirs(repo.commits_dir, exist_ok=True)
+    os.makedirs(repo.objects_dir, exist_ok=True)
+    os.makedirs(repo.branches_dir, exist_ok=True)
+    os.makedirs(repo.stash_dir, exist_ok=True)
+    os.makedirs(repo.history_dir, exist_ok=True)
+    if not os.path.exists(repo.index_file):
+        write_index({})
+    repo.commit_log.create()
+    if not os.path.exists(repo.tags_file):
+        atomic_write_json(repo.tags_file, {})
+    if not os.path.exists(repo.head_file):
+        atomic_write(repo.head_file, "main")
+    if not os.path.exists(branch_file("main")):
+        write_branch("main", None)
+
+@writes
 def add_file(filename):
-    """Add a file to the staging area."""
-    src = os.path.join(WORKSPACE_DIR, filename)
-    dst = os.path.join(INDEX_DIR, filename)
-    if os.path.exists(src):
-        shutil.copy2(src, dst)
-
+    """Add a file, or every file under a directory, to the staging area."""
+    path = workspace_path(filename)
+    if os.path.isdir(path):
+        prefix = os.path.normpath(filename).replace(os.sep, "/")
+        prefix = "" if prefix == "." else prefix + "/"
+        stage_files([prefix + name for name in tree.list_files(path)])
+    elif os.path.exists(path):
+        stage_files([filename])
+
+@writes
+def stage_files(filenames, jobs=JOBS, progress=None):
+    """Store workspace files as objects and record them in the staging area."""
+    repo = current_repo()
+    index = read_index()
+    cache = StatCache(repo.stat_cache_file)
+    if progress is not None:
+        progress.expect(files=len(filenames))
+
+    def stage(filename):
+        src = workspace_path(filename)
+        entry = cache.entry(src)
+        repo.store.write_file(src, tree.object_id(entry))
+        if progress is not None:
+            progress.advance(files=1, size=os.path.getsize(src))
+        return entry
+
+    for filename, sha in zip(filenames, run_parallel(stage, filenames, jobs)):
+        index[filename] = sha
+    write_index(index)
+    cache.save()
+    resolve_conflicts(repo.merge_conflicts_file, filenames)
+
+@writes
 def commit(message):
     """Commit staged files with a message."""
-    if not os.listdir(INDEX_DIR):
+    repo = current_repo()
+    index = read_index()
+    if not index:
         return {"success": False, "error": "Nothing to commit."}
-
-    timestamp = datetime.utcnow().isoformat()
-    commit_id = hashlib.sha1(f"{timestamp}{message}".encode()).hexdigest()[:6]
-    commit_path = os.path.join(COMMITS_DIR, commit_id)
-    os.makedirs(commit_path)
-
-    for fname in os.listdir(INDEX_DIR):
-        shutil.copy2(os.path.join(INDEX_DIR, fname), os.path.join(commit_path, fname))
-
-    if os.path.exists(LOG_FILE):
-        with open(LOG_FILE, "r") as f:
-            log = json.load(f)
-    else:
-        log = []
-
-    log.append({"id": commit_id, "timestamp": timestamp, "message": message})
-    with open(LOG_FILE, "w") as f:
-        json.dump(log, f, indent=2)
+    unresolved = read_conflicts(repo.merge_conflicts_file)
+    if unresolved:
+        return {"success": False, "error": conflicts_error(unresolved)}
 
     branch = get_current_branch()
-    branch_file = os.path.join(BRANCHES_DIR, f"{branch}.json")
-    if os.path.exists(branch_file):
-        with open(branch_file, "r") as f:
-            branch_log = json.load(f)
-    else:
-        branch_log = []
-    branch_log.append(commit_id)
-    with open(branch_file, "w") as f:
-        json.dump(branch_log, f, indent=2)
+    tip = read_branch(branch)
+    parents = [tip] if tip else []
+    if os.path.exists(repo.merge_head_file):
+        with open(repo.merge_head_file, "r") as f:
+            parents.append(f.read().strip())
 
-    shutil.rmtree(INDEX_DIR)
-    os.makedirs(INDEX_DIR)
+    ensure_file_history()
+    timestamp = datetime.utcnow().isoformat()
+    tree_id = write_tree(index)
+    commit_id = commit_hash(tree_id, parents, AUTHOR, timestamp, message)
+    commit_data = {"id": commit_id, "timestamp": timestamp, "message": message, "author": AUTHOR,
+                   "parents": parents, "generation": commit_graph(repo).next_generation(parents),
+                   "tree": tree_id}
+    atomic_write_json(commit_file(commit_id), commit_data)
+
+    entry = {"id": commit_id, "timestamp": timestamp, "message": message}
+    repo.commit_log.append(entry)
+    commit_graph(repo)
+    repo.file_history.record(index, entry)
+
+    write_branch(branch, commit_id)
+    write_index({})
+    for merge_file in (repo.merge_head_file, repo.merge_conflicts_file):
+        if os.path.exists(merge_file):
+            os.remove(merge_file)
 
     return {
         "success": True,
@@ -79,302 +259,496 @@ def commit(message):
         "message": message
     }
 
-def log_commits():
-    """Return the commit log."""
-    if os.path.exists(LOG_FILE):
-        with open(LOG_FILE, "r") as f:
-            return json.load(f)
-    return []
-
-def hash_file(path):
-    with open(path, "rb") as f:
-        return hashlib.sha1(f.read()).hexdigest()
-
+@reads
+def log_commits(limit=None):
+    """Return the commit log, oldest first; with ``limit`` only the last entries."""
+    repo = current_repo()
+    if limit:
+        return repo.commit_log.tail(limit)
+    return list(repo.commit_log)
+
+def iter_log():
+    """Stream the whole commit log, oldest first."""
+    return iter(current_repo().commit_log)
+
+def page_of(log, limit, after):
+    """Return one page of an append-only log, newest first, ending before position ``after``."""
+    total = len(log)
+    stop = total if after is None else max(0, min(after, total))
+    start = max(0, stop - limit)
+    entries = log.slice(start, stop)
+    entries.reverse()
+    return {"success": True, "commits": entries, "next": start or None, "total": total}
+
+@reads
+def log_page(limit=LOG_PAGE_SIZE, after=None):
+    """Return one page of the commit log, newest first."""
+    return page_of(current_repo().commit_log, limit, after)
+
+def log_length():
+    """Return the number of commits in the log."""
+    return len(current_repo().commit_log)
+
+@reads
 def status():
     """Return the status of files."""
-    workspace_files = set(os.listdir(WORKSPACE_DIR)) if os.path.exists(WORKSPACE_DIR) else set()
-    index_files = set(os.listdir(INDEX_DIR)) if os.path.exists(INDEX_DIR) else set()
+    files = set(workspace_files())
+    index_files = set(read_index())
 
     return {
         "staged": list(index_files),
-        "untracked": list(workspace_files - index_files),
-        "modified": list(workspace_files & index_files)
+        "untracked": list(files - index_files),
+        "modified": list(files & index_files)
     }
 
-def checkout(commit_id):
+@writes
+def checkout(commit_id, jobs=JOBS, progress=None):
     """Replace workspace files with files from a specified commit."""
-    commit_path = os.path.join(COMMITS_DIR, commit_id)
-    if not os.path.exists(commit_path):
+    try:
+        commit_id = resolve_commit(commit_id)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+    tree_id = commit_tree(commit_id)
+    if tree_id is None:
         return {"success": False, "error": "Commit not found"}
 
     if workspace_has_changes():
         return {"success": False, "error": "Uncommitted changes exist"}
 
-    for f in os.listdir(WORKSPACE_DIR):
-        os.remove(os.path.join(WORKSPACE_DIR, f))
-
-    for f in os.listdir(commit_path):
-        shutil.copy2(os.path.join(commit_path, f), os.path.join(WORKSPACE_DIR, f))
-
-    return {"success": True, "commit_id": commit_id}
-
+    os.makedirs(current_repo().workspace_dir, exist_ok=True)
+    written, removed = sync_workspace(tree_id, jobs, progress)
+    return {"success": True, "commit_id": commit_id, "updated": written, "removed": removed}
+
+def sync_workspace(tree_id, jobs=JOBS, progress=None):
+    """Make the workspace hold exactly the files of a tree, touching only files that differ."""
+    repo = current_repo()
+    cache = StatCache(repo.stat_cache_file)
+    # Unchanged files cost one stat() each, unchanged directories are skipped by ID
+    root, trees = tree.build(workspace_state(cache, jobs))
+    changes = list(tree.diff(repo.store, root, tree_id, trees))
+
+    stale = [path for path, _, sha in changes if sha is None]
+    for path in stale:
+        os.remove(workspace_path(path))
+        cache.forget(workspace_path(path))
+        tree.prune_dirs(repo.workspace_dir, path)
+
+    changed = [(path, sha) for path, _, sha in changes if sha is not None]
+    if progress is not None:
+        progress.expect(files=len(changed))
+
+    def materialize(item):
+        path, sha = item
+        dest = workspace_path(path)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tree.checkout_file(repo.store, sha, dest)
+        cache.record(dest, sha)
+        if progress is not None:
+            progress.advance(files=1, size=os.path.getsize(dest))
+
+    run_parallel(materialize, changed, jobs)
+    cache.save()
+    return len(changed), len(stale)
+
+@reads
 def diff(file):
     """Return the diff of a file between workspace and staging area."""
-    workspace_file = os.path.join(WORKSPACE_DIR, file)
-    index_file = os.path.join(INDEX_DIR, file)
-    if not os.path.exists(workspace_file) or not os.path.exists(index_file):
+    repo = current_repo()
+    workspace_file = workspace_path(file)
+    index_sha = read_index().get(file)
+    if not os.path.exists(workspace_file) or index_sha is None:
         return ""
-    with open(workspace_file, "r") as f1, open(index_file, "r") as f2:
-        workspace_lines = f1.readlines()
-        index_lines = f2.readlines()
-    diff_lines = []
-    for line in workspace_lines:
-        if line not in index_lines:
-            diff_lines.append(f"+ {line}")
-    for line in index_lines:
-        if line not in workspace_lines:
-            diff_lines.append(f"- {line}")
-    return "".join(diff_lines)
-
+    cache = StatCache(repo.stat_cache_file)
+    workspace_sha = cache.hash(workspace_file)
+    cache.save()
+    index_sha = tree.object_id(index_sha)
+    if workspace_sha == index_sha:
+        return ""
+    fromfile, tofile = f"index/{file}", f"workspace/{file}"
+    index_size = repo.store.size(index_sha)
+    workspace_size = os.path.getsize(workspace_file)
+    if max(index_size, workspace_size) > MAX_DIFF_SIZE:
+        return oversize_notice(fromfile, tofile, index_size, workspace_size)
+    with open(workspace_file, "rb") as f1:
+        workspace_data = f1.read()
+    return "\n".join(diff_bytes(repo.store.read_bytes(index_sha), workspace_data, fromfile, tofile, DIFF_ALGORITHM))
+
+@writes
 def restore(commit_id, filename):
     """Restore a file from a specific commit."""
-    commit_path = os.path.join(COMMITS_DIR, commit_id)
-    file_path = os.path.join(commit_path, filename)
-    if not os.path.exists(file_path):
+    repo = current_repo()
+    try:
+        commit_id = resolve_commit(commit_id)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+    tree_id = commit_tree(commit_id)
+    sha = tree.lookup(repo.store, tree_id, filename) if tree_id is not None else None
+    if sha is None:
         return {"success": False, "error": "File not found in commit."}
-    shutil.copy2(file_path, os.path.join(WORKSPACE_DIR, filename))
+    destination = workspace_path(filename)
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    tree.checkout_file(repo.store, sha, destination)
+    cache = StatCache(repo.stat_cache_file)
+    cache.record(destination, sha)
+    cache.save()
     return {"success": True, "file": filename}
 
+@reads
 def history(filename):
     """Return the history of a file."""
-    if not os.path.exists(LOG_FILE):
-        return []
-    with open(LOG_FILE, "r") as f:
-        log = json.load(f)
-    history_list = []
-    for entry in log:
-        commit_id = entry["id"]
-        commit_path = os.path.join(COMMITS_DIR, commit_id)
-        if filename in os.listdir(commit_path):
-            history_list.append(entry)
-    return history_list
+    ensure_file_history()
+    return list(current_repo().file_history.log(filename))
+
+@reads
+def history_page(filename, limit=LOG_PAGE_SIZE, after=None):
+    """Return one page of the history of a file, newest first."""
+    ensure_file_history()
+    return page_of(current_repo().file_history.log(filename), limit, after)
+
+@reads
+def history_length(filename):
+    """Return the number of commits that included a file."""
+    ensure_file_history()
+    return len(current_repo().file_history.log(filename))
 
 def get_current_branch():
     """Get the name of the current branch."""
-    if os.path.exists(HEAD_FILE):
-        with open(HEAD_FILE, "r") as f:
-            return f.read().strip()
-    return "main"
+    repo = current_repo()
+    return repo.read_cached(repo.head_file, read_text) or "main"
 
+@writes
 def branch(name):
     """Create a new branch."""
-    branch_file = os.path.join(BRANCHES_DIR, f"{name}.json")
-    if os.path.exists(branch_file):
+    if os.path.exists(branch_file(name)):
         return {"success": False, "error": "Branch already exists."}
-    current_branch = get_current_branch()
-    current_branch_file = os.path.join(BRANCHES_DIR, f"{current_branch}.json")
-    if os.path.exists(current_branch_file):
-        with open(current_branch_file, "r") as f:
-            commits = json.load(f)
-    else:
-        commits = []
-    with open(branch_file, "w") as f:
-        json.dump(commits, f, indent=2)
+    write_branch(name, head_commit())
     return {"success": True, "branch": name}
 
+@writes
 def checkout_branch(name):
     """Switch to a different branch."""
-    branch_file = os.path.join(BRANCHES_DIR, f"{name}.json")
-    if not os.path.exists(branch_file):
+    if not os.path.exists(branch_file(name)):
         return {"success": False, "error": "Branch does not exist."}
-    with open(HEAD_FILE, "w") as f:
-        f.write(name)
+    atomic_write(current_repo().head_file, name)
     return {"success": True, "branch": name}
 
+@reads
 def current_branch():
     """Return the current branch name."""
     return get_current_branch()
 
+@writes
 def rm(filename):
     """Remove a file from the workspace."""
-    file_path = os.path.join(WORKSPACE_DIR, filename)
-    if os.path.exists(file_path):
+    repo = current_repo()
+    file_path = workspace_path(filename)
+    if os.path.isfile(file_path):
         os.remove(file_path)
+        tree.prune_dirs(repo.workspace_dir, filename)
+    # Removing a conflicted file resolves the conflict by leaving it out of the merge
+    if filename in read_conflicts(repo.merge_conflicts_file):
+        index = read_index()
+        index.pop(filename, None)
+        write_index(index)
+        resolve_conflicts(repo.merge_conflicts_file, [filename])
     return {"success": True, "file": filename}
 
+@writes
 def reset():
     """Reset the staging area."""
-    shutil.rmtree(INDEX_DIR)
-    os.makedirs(INDEX_DIR)
+    write_index({})
     return {"success": True}
 
-def commit_all(message):
+@writes
+def commit_all(message, jobs=JOBS, progress=None):
     """Stage all files and commit."""
-    for fname in os.listdir(WORKSPACE_DIR):
-        add_file(fname)
+    stage_files(workspace_files(), jobs, progress)
     return commit(message)
 
+@reads
 def workspace_has_changes():
-    """Check if the current workspace has uncommitted changes."""
-    if not os.path.exists(LOG_FILE):
+    """Check whether a tracked file (in HEAD or the index) differs in the workspace; untracked files do not count."""
+    last_commit_id = head_commit()
+    if last_commit_id is None:
         return False
 
-    with open(LOG_FILE) as f:
-        log = json.load(f)
-    if not log:
-        return False
+    cache = StatCache(current_repo().stat_cache_file)
+    try:
+        files = workspace_state(cache)
+    finally:
+        cache.save()
+    return any(tree.tracked_changes(current_repo().store, commit_tree(last_commit_id), files, read_index()))
+
+def compare_trees(tree1, tree2):
+    """Split the files that differ between two trees into added, removed and modified paths."""
+    added, removed, modified = {}, {}, {}
+    for path, old, new in tree.diff(current_repo().store, tree1, tree2):
+        if old is None:
+            added[path] = new
+        elif new is None:
+            removed[path] = old
+        else:
+            modified[path] = (old, new)
+    return added, removed, modified
+
+def file_diff(commit1, commit2, file, sha1, sha2, algorithm):
+    """Return the unified diff between two versions of a file (either may be None)."""
+    repo = current_repo()
+    if sha1 == sha2:
+        return ""
+    sha1, sha2 = sha1 and tree.object_id(sha1), sha2 and tree.object_id(sha2)
+    fromfile, tofile = f"{commit1}/{file}", f"{commit2}/{file}"
+    size1 = repo.store.size(sha1) if sha1 else 0
+    size2 = repo.store.size(sha2) if sha2 else 0
+    if max(size1, size2) > MAX_DIFF_SIZE:
+        return oversize_notice(fromfile, tofile, size1, size2)
+    old = repo.store.read_bytes(sha1) if sha1 else b""
+    new = repo.store.read_bytes(sha2) if sha2 else b""
+    return "\n".join(diff_bytes(old, new, fromfile, tofile, algorithm))
+
+@reads
+def diff_commits(commit1, commit2, algorithm=DIFF_ALGORITHM, summary=False):
+    """Return the files added, removed and modified between two commits, with diffs unless ``summary``."""
+    try:
+        commit1, commit2 = resolve_commit(commit1), resolve_commit(commit2)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+    tree1 = commit_tree(commit1)
+    tree2 = commit_tree(commit2)
+    if tree1 is None or tree2 is None:
+        return {"success": False, "error": "One or both commits not found."}
+    added, removed, modified = compare_trees(tree1, tree2)
+    result = {"success": True, "added": list(added), "removed": list(removed), "modified": list(modified)}
+    if not summary:
+        result["diff"] = {file: file_diff(commit1, commit2, file, sha1, sha2, algorithm)
+                          for file, (sha1, sha2) in modified.items()}
+    return result
+
+@reads
+def diff_file(commit1, commit2, file, algorithm=DIFF_ALGORITHM):
+    """Return the unified diff of a single file between two commits."""
+    try:
+        commit1, commit2 = resolve_commit(commit1), resolve_commit(commit2)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+    tree1 = commit_tree(commit1)
+    tree2 = commit_tree(commit2)
+    if tree1 is None or tree2 is None:
+        return {"success": False, "error": "One or both commits not found."}
+    store = current_repo().store
+    sha1, sha2 = tree.lookup(store, tree1, file), tree.lookup(store, tree2, file)
+    if sha1 is None and sha2 is None:
+        return {"success": False, "error": "File not found in either commit."}
+    diff = file_diff(commit1, commit2, file, sha1, sha2, algorithm)
+    return {"success": True, "file": file, "diff": diff}
+
+@reads
+def list_tree(commit_id):
+    """Return the files of a commit as a mapping of filename to tree entry."""
+    try:
+        commit_id = resolve_commit(commit_id)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+    files = commit_files(commit_id)
+    if files is None:
+        return {"success": False, "error": "Commit not found."}
+    return {"success": True, "commit": commit_id, "files": files}
 
-    last_commit_id = log[-1]["id"]
-    last_commit_path = os.path.join(COMMITS_DIR, last_commit_id)
-
-    workspace_files = set(os.listdir(WORKSPACE_DIR))
-    committed_files = set(os.listdir(last_commit_path))
-
-    for f in workspace_files:
-        workspace_file = os.path.join(WORKSPACE_DIR, f)
-        committed_file = os.path.join(last_commit_path, f)
-        if f not in committed_files or not os.path.exists(committed_file):
-            return True
-        if hash_file(workspace_file) != hash_file(committed_file):
-            return True
-    return False
-
-def diff_commits(commit1, commit2):
-    """Return the diff between two commits."""
-    commit1_path = os.path.join(COMMITS_DIR, commit1)
-    commit2_path = os.path.join(COMMITS_DIR, commit2)
-    files1 = set(os.listdir(commit1_path))
-    files2 = set(os.listdir(commit2_path))
-    all_files = files1.union(files2)
-    diffs = {}
-    for file in all_files:
-        file1 = os.path.join(commit1_path, file)
-        file2 = os.path.join(commit2_path, file)
-        lines1 = open(file1, "r").readlines() if os.path.exists(file1) else []
-        lines2 = open(file2, "r").readlines() if os.path.exists(file2) else []
-        diff_lines = []
-        for line in lines1:
-            if line not in lines2:
-                diff_lines.append(f"- {line}")
-        for line in lines2:
-            if line not in lines1:
-                diff_lines.append(f"+ {line}")
-        diffs[file] = "".join(diff_lines)
-    return diffs
+def log_entry(commit):
+    """Return the log fields (id, timestamp, message) of a commit."""
+    return {"id": commit["id"], "timestamp": commit["timestamp"], "message": commit["message"]}
 
+@reads
 def log_branch(branch_name):
     """Return the commit log for a specific branch."""
-    branch_file = os.path.join(BRANCHES_DIR, f"{branch_name}.json")
-    if os.path.exists(branch_file):
-        with open(branch_file, "r") as f:
-            commit_ids = json.load(f)
-        with open(LOG_FILE, "r") as f:
-            all_logs = json.load(f)
-        return [entry for entry in all_logs if entry["id"] in commit_ids]
-    return []
-
-def push(remote_path):
-    """Push the local .myvcs metadata to a remote repository location."""
+    if not os.path.exists(branch_file(branch_name)):
+        return []
+    entries = [log_entry(entry) for entry in iter_history(read_branch(branch_name))]
+    entries.reverse()
+    return entries
+
+@reads
+def log_branch_page(branch_name, limit=LOG_PAGE_SIZE, after=None):
+    """Return one page of a branch's history, children before parents, after commit ``after``."""
+    if not os.path.exists(branch_file(branch_name)):
+        return {"success": False, "error": "Branch does not exist."}
+    entries = []
     try:
-        remote_vcs = os.path.join(remote_path, VCS_DIR)
-        shutil.copytree(VCS_DIR, remote_vcs, dirs_exist_ok=True)
-        return {"success": True}
+        # One entry past the page tells whether there is a next one
+        for entry in iter_history(read_branch(branch_name), after=after, batch=limit + 1):
+            if len(entries) == limit:
+                return {"success": True, "commits": entries, "next": entries[-1]["id"]}
+            entries.append(log_entry(entry))
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+    return {"success": True, "commits": entries, "next": None}
+
+def sync_repos(src, dst, progress=None):
+    """Sync ``dst`` from ``src`` under a shared lock on ``src`` and an exclusive one on ``dst``."""
+    if os.path.abspath(src.vcs_dir) == os.path.abspath(dst.vcs_dir):
+        return {"success": False, "error": "Cannot sync a repository with itself."}
+    locks = sorted([(src.lock_file, src.lock.shared), (dst.lock_file, dst.lock.exclusive)],
+                   key=lambda lock: os.path.abspath(lock[0]))
+    with locks[0][1](), locks[1][1]():
+        return sync(src, dst, progress)
+
+def push(remote_path, progress=None):
+    """Send the branches, commits and objects the remote repository lacks."""
+    try:
+        return sync_repos(current_repo(), Repository(remote_path), progress)
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def pull(remote_path):
-    """Pull .vcs metadata from a remote directory into the current repository."""
+def pull(remote_path, progress=None):
+    """Fetch the branches, commits and objects the current repository lacks from a remote."""
+    remote = Repository(remote_path)
+    if not remote.exists():
+        return {"success": False, "error": "Remote repository not found."}
     try:
-        remote_vcs = os.path.join(remote_path, VCS_DIR)
-        shutil.copytree(remote_vcs, VCS_DIR, dirs_exist_ok=True)
-        return {"success": True}
+        return sync_repos(remote, current_repo(), progress)
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+@writes
 def merge(branch_name):
-    """Merge the latest commit from the specified branch into the current index."""
-    target_file = os.path.join(BRANCHES_DIR, f"{branch_name}.json")
-    if not os.path.exists(target_file):
+    """Three-way merge a branch into the current one, or fast-forward to it."""
+    repo = current_repo()
+    if not os.path.exists(branch_file(branch_name)):
         return {"success": False, "error": "Branch not found"}
 
-    with open(target_file) as f:
-        commits = json.load(f)
-    if not commits:
+    latest_commit = read_branch(branch_name)
+    if latest_commit is None:
         return {"success": False, "error": "Branch has no commits"}
 
-    latest_commit = commits[-1]
-    commit_path = os.path.join(COMMITS_DIR, latest_commit)
-
-    for fname in os.listdir(commit_path):
-        shutil.copy2(os.path.join(commit_path, fname), os.path.join(INDEX_DIR, fname))
-
-    return {"success": True, "merged_from": branch_name}
+    if workspace_has_changes():
+        return {"success": False, "error": "Uncommitted changes exist"}
 
+    branch = get_current_branch()
+    ours = head_commit()
+    base = commit_graph(repo).merge_base(ours, latest_commit) if ours else None
+    if base == latest_commit:
+        return {"success": True, "merged_from": branch_name, "up_to_date": True}
+    if ours is None or base == ours:
+        os.makedirs(repo.workspace_dir, exist_ok=True)
+        sync_workspace(commit_tree(latest_commit))
+        write_branch(branch, latest_commit)
+        return {"success": True, "merged_from": branch_name, "fast_forward": True, "commit": latest_commit}
+
+    ours_tree = commit_tree(ours)
+    updates, conflicts = merge_trees(repo.store, commit_tree(base) if base else None, ours_tree,
+                                     commit_tree(latest_commit), labels=(branch, branch_name),
+                                     algorithm=DIFF_ALGORITHM)
+
+    index = read_tree(ours_tree)
+    cache = StatCache(repo.stat_cache_file)
+    apply_merge(repo.store, repo.workspace_dir, cache, index, updates, conflicts)
+    cache.save()
+    write_index(index)
+
+    # The next commit records the merged branch as its second parent.
+    atomic_write(repo.merge_head_file, latest_commit)
+    if conflicts:
+        record_conflicts(repo.merge_conflicts_file, conflicts)
+
+    return {"success": True, "merged_from": branch_name, "base": base,
+            "updated": sorted(updates), "conflicts": sorted(conflicts)}
+
+@writes
 def revert(commit_id):
     """Revert the changes introduced by a specific commit."""
-    commit_path = os.path.join(COMMITS_DIR, commit_id)
-    if not os.path.exists(commit_path):
+    repo = current_repo()
+    try:
+        commit_id = resolve_commit(commit_id)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+    files = commit_files(commit_id)
+    if files is None:
         return {"success": False, "error": "Commit not found"}
 
-    for fname in os.listdir(commit_path):
-        committed_file = os.path.join(commit_path, fname)
-        workspace_file = os.path.join(WORKSPACE_DIR, fname)
+    for fname, sha in files.items():
+        workspace_file = workspace_path(fname)
         if os.path.exists(workspace_file):
             os.remove(workspace_file)
-        shutil.copy2(committed_file, workspace_file)
+        os.makedirs(os.path.dirname(workspace_file), exist_ok=True)
+        tree.checkout_file(repo.store, sha, workspace_file)
 
     return commit(f"Revert commit {commit_id}")
 
+@writes
 def stash():
     """Save the current workspace as a stash and clear the workspace."""
-    os.makedirs(STASH_DIR, exist_ok=True)
+    repo = current_repo()
+    os.makedirs(repo.stash_dir, exist_ok=True)
     i = 0
-    while os.path.exists(os.path.join(STASH_DIR, f"stash{i}")):
+    while os.path.exists(os.path.join(repo.stash_dir, f"stash{i}")):
         i += 1
-    stash_path = os.path.join(STASH_DIR, f"stash{i}")
-    os.makedirs(stash_path)
+    stash_path = os.path.join(repo.stash_dir, f"stash{i}")
+    shutil.copytree(repo.workspace_dir, stash_path)
 
-    for f in os.listdir(WORKSPACE_DIR):
-        shutil.copy2(os.path.join(WORKSPACE_DIR, f), os.path.join(stash_path, f))
-        os.remove(os.path.join(WORKSPACE_DIR, f))
+    for f in os.listdir(repo.workspace_dir):
+        path = os.path.join(repo.workspace_dir, f)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
 
     return {"success": True, "stash": f"stash{i}"}
 
+@writes
 def stash_pop():
     """Restore the most recent stashed changes into the workspace."""
-    stashes = sorted(os.listdir(STASH_DIR))
+    repo = current_repo()
+    stashes = sorted(os.listdir(repo.stash_dir))
     if not stashes:
         return {"success": False, "error": "No stash to pop"}
 
-    latest = os.path.join(STASH_DIR, stashes[-1])
+    latest = os.path.join(repo.stash_dir, stashes[-1])
 
-    for f in os.listdir(latest):
-        shutil.copy2(os.path.join(latest, f), os.path.join(WORKSPACE_DIR, f))
+    shutil.copytree(latest, repo.workspace_dir, dirs_exist_ok=True)
 
     shutil.rmtree(latest)
     return {"success": True, "restored": stashes[-1]}
 
+@writes
 def tag(name, commit_id):
     """Create a tag for a specific commit."""
-    if not os.path.exists(os.path.join(COMMITS_DIR, commit_id)):
+    repo = current_repo()
+    try:
+        commit_id = resolve_commit(commit_id)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+    if not commit_exists(commit_id):
         return {"success": False, "error": "Commit does not exist."}
-    if os.path.exists(TAGS_FILE):
-        with open(TAGS_FILE, "r") as f:
+    if os.path.exists(repo.tags_file):
+        with open(repo.tags_file, "r") as f:
             tags = json.load(f)
     else:
         tags = {}
     tags[name] = commit_id
-    with open(TAGS_FILE, "w") as f:
-        json.dump(tags, f, indent=2)
+    atomic_write_json(repo.tags_file, tags)
     return {"success": True, "tag": name, "commit": commit_id}
 
+@reads
 def list_tags():
     """List all tags."""
-    if os.path.exists(TAGS_FILE):
-        with open(TAGS_FILE, "r") as f:
+    repo = current_repo()
+    if os.path.exists(repo.tags_file):
+        with open(repo.tags_file, "r") as f:
             return json.load(f)
     return {}
 
+def repack_hints():
+    """Map each object to the path it was committed at and how recently."""
+    repo = current_repo()
+    tree_ids = (commit_tree(entry["id"]) for entry in repo.commit_log.iter_reverse())
+    return tree.repack_hints(repo.store, read_index(), tree_ids)
+
+@writes
+def gc():
+    """Fold loose objects into a single compressed pack, delta-compressing file versions."""
+    result = current_repo().store.repack(repack_hints())
+    return {"success": True, **result}
+
 def help():
     """Print a list of all supported commands with descriptions."""
     print("""
@@ -406,4 +780,5 @@ def help():
     merge <branch>            Merge branch
     push <remote_path>        Sync to remote
     pull <remote_path>        Sync from remote
+    gc                        Pack loose objects
     """)
\ No newline at end of file
@@ -12,17 +12,30 @@ import TagControls from "./components/TagControls";
 import RemoteControls from "./components/RemoteControls";
 import "./App.css";
 
+const LOG_PAGE_SIZE = 50;
+
 function App() {
   const [log, setLog] = useState([]);
+  const [logCursor, setLogCursor] = useState(null);
   const [status, setStatus] = useState({});
   const [branch, setBranch] = useState("");
 
   const refresh = () => {
-    axios.get("/log").then(res => setLog(res.data));
+    axios.get("/log", { params: { limit: LOG_PAGE_SIZE } }).then(res => {
+      setLog(res.data.commits);
+      setLogCursor(res.data.next);
+    });
     axios.get("/status").then(res => setStatus(res.data));
     axios.get("/current-branch").then(res => setBranch(res.data.branch));
   };
 
+  const loadMoreLog = () => {
+    axios.get("/log", { params: { limit: LOG_PAGE_SIZE, after: logCursor } }).then(res => {
+      setLog(prev => [...prev, ...res.data.commits]);
+      setLogCursor(res.data.next);
+    });
+  };
+
   useEffect(() => {
     refresh();
   }, []);
@@ -45,7 +58,7 @@ function App() {
       <TagControls onChange={refresh} />
       <RemoteControls onChange={refresh} />
       <StatusBlock status={status} />
-      <CommitLog log={log} />
+      <CommitLog log={log} hasMore={logCursor !== null} onLoadMore={loadMoreLog} />
     </motion.div>
   );
 }
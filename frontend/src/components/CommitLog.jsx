@@ -1,7 +1,7 @@
 // src/components/CommitLog.jsx
 import { motion } from "framer-motion";
 
-function CommitLog({ log }) {
+function CommitLog({ log, hasMore, onLoadMore }) {
   return (
     <div className="commit-log">
       <h2>Commit Log</h2>
@@ -11,12 +11,13 @@ function CommitLog({ log }) {
             key={entry.id}
             initial={{ opacity: 0, x: -10 }}
             animate={{ opacity: 1, x: 0 }}
-            transition={{ delay: index * 0.05 }}
+            transition={{ delay: Math.min(index, 20) * 0.05 }}
           >
             <strong>{entry.id}</strong>: {entry.message} ({entry.timestamp})
           </motion.li>
         ))}
       </ul>
+      {hasMore && <button onClick={onLoadMore}>Load more</button>}
     </div>
   );
 }
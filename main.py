@@ -1,23 +1,40 @@
 import sys
 from vcs import vcs
 
+def pop_jobs(args):
+    """Strip a `--jobs N` option from args and return N (default: vcs.JOBS)."""
+    if "--jobs" not in args:
+        return vcs.JOBS
+    i = args.index("--jobs")
+    if i + 1 >= len(args) or not args[i + 1].isdigit() or int(args[i + 1]) < 1:
+        print("Usage: --jobs <N> where N is a positive number of worker threads")
+        sys.exit(1)
+    jobs = int(args[i + 1])
+    del args[i:i + 2]
+    return jobs
+
 def main():
-    args = sys.argv
+    args = list(sys.argv)
+    jobs = pop_jobs(args)
     if len(args) < 2:
         print("Usage: python main.py <command> [args]")
         return
 
     cmd = args[1]
+    error = vcs.format_error() if cmd != "help" else None
+    if error is not None:
+        print(error)
+        sys.exit(1)
 
     if cmd == "init":
         vcs.init_repo()
 
     elif cmd == "add" and len(args) == 3:
-        vcs.add_file(args[2])
+        vcs.add_file(args[2], jobs)
 
     elif cmd == "commit":
         if len(args) >= 4 and args[2] == "-a":
-            vcs.commit_all(args[3])
+            vcs.commit_all(args[3], jobs)
         elif len(args) >= 3:
             vcs.commit(args[2])
         else:
@@ -26,6 +43,8 @@ def main():
     elif cmd == "log":
         if len(args) == 4 and args[2] == "--branch":
             vcs.log_branch(args[3])
+        elif len(args) == 4 and args[2] == "-n" and args[3].isdigit():
+            vcs.log_commits(int(args[3]))
         else:
             vcs.log_commits()
 
@@ -33,15 +52,17 @@ def main():
         vcs.status()
 
     elif cmd == "diff":
+        algorithm = vcs.PATIENCE if "--patience" in args else vcs.DIFF_ALGORITHM
+        args = [arg for arg in args if arg != "--patience"]
         if len(args) == 3:
-            vcs.diff(args[2])
+            vcs.diff(args[2], algorithm)
         elif len(args) == 4:
-            vcs.diff_commits(args[2], args[3])
+            vcs.diff_commits(args[2], args[3], algorithm)
         else:
-            print("Usage: python main.py diff <file> OR <commit1> <commit2>")
+            print("Usage: python main.py diff [--patience] <file> OR <commit1> <commit2>")
 
     elif cmd == "checkout" and len(args) == 3:
-        vcs.checkout(args[2])
+        vcs.checkout(args[2], jobs)
 
     elif cmd == "restore":
         if len(args) == 3:
@@ -53,12 +74,14 @@ def main():
 
     elif cmd == "history" and len(args) == 3:
         vcs.history(args[2])
+    elif cmd == "history" and len(args) == 5 and args[3] == "-n" and args[4].isdigit():
+        vcs.history(args[2], int(args[4]))
 
     elif cmd == "branch" and len(args) == 3:
         vcs.branch(args[2])
 
     elif cmd == "checkout-branch" and len(args) == 3:
-        vcs.checkout_branch(args[2])
+        vcs.checkout_branch(args[2], jobs)
 
     elif cmd == "current-branch":
         vcs.current_branch()
@@ -69,6 +92,9 @@ def main():
     elif cmd == "reset":
         vcs.reset()
 
+    elif cmd in ("gc", "repack"):
+        vcs.gc()
+
     elif cmd == "help":
         vcs.help()
 
@@ -100,6 +126,28 @@ def main():
     elif cmd == "pull" and len(args) == 3:
         print(vcs.pull(args[2]))
 
+    elif cmd == "bundle":
+        if len(args) == 5 and args[2] == "create":
+            print(vcs.bundle_create(args[3], args[4]))
+        elif len(args) == 4 and args[2] == "verify":
+            print(vcs.bundle_verify(args[3]))
+        elif len(args) == 4 and args[2] == "unbundle":
+            print(vcs.unbundle(args[3]))
+        else:
+            print("Usage: python main.py bundle create <file> <range> OR bundle verify <file> OR bundle unbundle <file>")
+
+    elif cmd == "monitor" and len(args) == 3:
+        if args[2] == "start":
+            print(vcs.monitor_start())
+        elif args[2] == "stop":
+            print(vcs.monitor_stop())
+        elif args[2] == "status":
+            print(vcs.monitor_status())
+        elif args[2] == "run":
+            vcs.monitor.main([vcs.WORKSPACE_DIR, vcs.MONITOR_DIR, "--stat-cache", vcs.STAT_CACHE_FILE])
+        else:
+            print("Usage: python main.py monitor start|stop|status|run")
+
     else:
         print("Unknown command. Run `python main.py help` for list of commands.")
 
@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vcscore.objects import ObjectStore
+
+@pytest.fixture
+def store(tmp_path):
+    store = ObjectStore(str(tmp_path / "objects"))
+    yield store
+    store.close()
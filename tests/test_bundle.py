@@ -0,0 +1,67 @@
+import hashlib
+import json
+
+import pytest
+
+from test_sync import commit, make_repo
+from vcs import bundle
+from vcs.bundle import MAGIC, BundleWriter, create, unbundle, verify
+from vcscore.sync import read_refs
+
+def test_round_trip(tmp_path):
+    src = make_repo(tmp_path / "src")
+    commit(src, "c1", [], {"a.txt": b"one\n"}, 1)
+    commit(src, "c2", ["c1"], {"a.txt": b"two\n"}, 2)
+    path = str(tmp_path / "all.bundle")
+    assert create(src, path, "main")["commits"] == 2
+    assert verify(path)["tip"] == "c2"
+
+    dst = make_repo(tmp_path / "dst")
+    result = unbundle(dst, path)
+    assert result["success"] and result["commits"] == 2
+    assert read_refs(dst) == {"main": "c2"}
+
+def test_checksum_mismatch_is_rejected(tmp_path):
+    path = tmp_path / "bad.bundle"
+    with open(path, "wb") as f:
+        writer = BundleWriter(f)
+        header = {"refs": {}, "tip": "c1", "prerequisites": [], "commits": 0, "objects": 1}
+        writer.record(b"H", json.dumps(header).encode())
+        writer.record(b"O", b"data\n", hashlib.sha1(b"data\n").hexdigest().encode())
+        writer.write(b"E")
+        f.write(writer.zip.compress(b"\0" * writer.sha.digest_size))
+        f.write(writer.zip.flush())
+    with pytest.raises(ValueError, match="checksum mismatch"):
+        verify(str(path))
+
+def test_damaged_bundle_is_rejected(tmp_path):
+    src = make_repo(tmp_path / "src")
+    commit(src, "c1", [], {"a.txt": b"one\n" * 1000}, 1)
+    path = tmp_path / "all.bundle"
+    create(src, str(path), "main")
+    data = bytearray(path.read_bytes())
+    data[len(MAGIC) + 20] ^= 0xFF
+    path.write_bytes(bytes(data))
+
+    dst = make_repo(tmp_path / "dst")
+    with pytest.raises(ValueError):
+        unbundle(dst, str(path))
+    assert read_refs(dst) == {}
+
+def test_objects_are_streamed_in_pieces(tmp_path, monkeypatch):
+    src = make_repo(tmp_path / "src")
+    data = bytes(range(256)) * 64
+    commit(src, "c1", [], {"big.bin": data, "small.txt": b"s\n"}, 1)
+    path = str(tmp_path / "all.bundle")
+    create(src, path, "main")
+
+    monkeypatch.setattr(bundle, "READ_SIZE", 1000)
+    dst = make_repo(tmp_path / "dst")
+    assert unbundle(dst, path)["success"]
+    assert dst.store.read_bytes(hashlib.sha1(data).hexdigest()) == data
+
+def test_corrupt_object_is_not_stored(store):
+    sha = hashlib.sha1(b"data\n").hexdigest()
+    with pytest.raises(ValueError, match="corrupt"):
+        store.write_chunks(sha, [b"da", b"ta?"])
+    assert not store.exists(sha)
@@ -0,0 +1,48 @@
+from vcscore.commitgraph import CommitGraph
+from vcscore.commitlog import CommitLog
+
+# A - B - D        D merges B and C; E's clock runs behind its parent's
+#   \   /
+#     C - E
+HISTORY = [("A", [], 10), ("B", ["A"], 20), ("C", ["A"], 30), ("D", ["B", "C"], 40), ("E", ["C"], 5)]
+
+def append(log, commits, history):
+    for commit_id, parents, minute in history:
+        commits[commit_id] = {"id": commit_id, "parents": parents,
+                              "timestamp": f"2024-01-01T00:{minute:02d}:00"}
+        log.append({"id": commit_id})
+
+def build(tmp_path, history=HISTORY):
+    log, commits = CommitLog(str(tmp_path / "log.jsonl"), str(tmp_path / "log.idx")), {}
+    append(log, commits, history)
+    graph = CommitGraph(str(tmp_path / "commit-graph"))
+    graph.update(log, commits.get)
+    return graph, log, commits
+
+def test_generation_numbers(tmp_path):
+    graph, _, _ = build(tmp_path)
+    generations = {c: graph.generation(graph.row(c)) for c in "ABCDE"}
+    assert generations == {"A": 1, "B": 2, "C": 2, "D": 3, "E": 3}
+    assert graph.next_generation(["D", "E"]) == 4
+
+def test_merge_base_and_ancestry(tmp_path):
+    graph, _, _ = build(tmp_path)
+    assert graph.merge_base("D", "E") == "C"
+    assert graph.merge_base("B", "E") == "A"
+    assert graph.merge_base("D", "B") == "B"
+    assert graph.is_ancestor("A", "E")
+    assert not graph.is_ancestor("B", "E")
+
+def test_walk_puts_children_before_parents_despite_clock_skew(tmp_path):
+    graph, _, _ = build(tmp_path, HISTORY + [("F", ["D", "E"], 1)])
+    order = [graph.commit_id(row) for row in graph.walk("F")]
+    assert order == ["F", "D", "E", "C", "B", "A"]
+    assert [graph.commit_id(row) for row in graph.walk("F", after="E")] == ["C", "B", "A"]
+
+def test_update_appends_rows_for_new_commits_only(tmp_path):
+    graph, log, commits = build(tmp_path, HISTORY[:2])
+    append(log, commits, HISTORY[2:])
+    graph.update(log, commits.get)
+    assert len(graph) == 5
+    assert [graph.commit_id(row) for row in range(5)] == list("ABCDE")
+    assert graph.parents(graph.row("D")) == [graph.row("B"), graph.row("C")]
@@ -0,0 +1,34 @@
+import pytest
+
+from test_commitgraph import build
+from vcscore.commitids import MIN_PREFIX, CommitIds, commit_hash
+
+IDS = ["abcd" + "0" * 36, "abcd" + "1" * 36, "abce" + "2" * 36, "1234" + "3" * 36]
+
+def build_ids(tmp_path):
+    graph, _, _ = build(tmp_path, [(commit_id, [], i) for i, commit_id in enumerate(IDS)])
+    ids = CommitIds(str(tmp_path / "commit-ids"))
+    ids.update(graph)
+    return ids
+
+def test_commit_hash_covers_the_content():
+    args = ("t" * 40, ["p" * 40], "me", "2024-01-01T00:00:00", "message")
+    assert commit_hash(*args) == commit_hash(*args)
+    assert commit_hash(*args[:4], "other") != commit_hash(*args)
+    assert commit_hash(args[0], [], *args[2:]) != commit_hash(*args)
+
+def test_prefix_lookup(tmp_path):
+    ids = build_ids(tmp_path)
+    assert ids.matches("abc") == sorted(IDS[:3])
+    assert ids.resolve("ABCE") == IDS[2]
+    assert ids.resolve("1234") == IDS[3]
+    assert ids.resolve(IDS[0]) == IDS[0]
+    assert ids.resolve("ffff") is None
+    assert ids.resolve("not-hex") is None
+
+def test_ambiguous_or_short_prefix_is_refused(tmp_path):
+    ids = build_ids(tmp_path)
+    with pytest.raises(ValueError, match="ambiguous"):
+        ids.resolve("abcd")
+    with pytest.raises(ValueError, match="too short"):
+        ids.resolve("123"[:MIN_PREFIX - 1])
@@ -0,0 +1,32 @@
+import pytest
+
+from vcscore.commitlog import CommitLog, legacy_format, walk_history
+
+from test_commitgraph import build
+
+def check(vcs_dir):
+    return legacy_format(str(vcs_dir / "log.jsonl"), str(vcs_dir / "log.json"),
+                         str(vcs_dir / "commits"), str(vcs_dir / "branches"))
+
+def test_current_and_missing_repositories_pass(tmp_path):
+    assert check(tmp_path / ".vcs") is None
+    (tmp_path / ".vcs" / "commits").mkdir(parents=True)
+    CommitLog(str(tmp_path / ".vcs" / "log.jsonl"), str(tmp_path / ".vcs" / "log.idx")).create()
+    assert check(tmp_path / ".vcs") is None
+
+def test_old_format_is_reported(tmp_path):
+    vcs_dir = tmp_path / ".vcs"
+    (vcs_dir / "commits" / "abc123").mkdir(parents=True)
+    assert "commits/abc123/ found" in check(vcs_dir)
+    (vcs_dir / "branches").mkdir()
+    (vcs_dir / "branches" / "main.json").write_text('["abc123"]')
+    assert "branches/main.json found" in check(vcs_dir)
+    (vcs_dir / "log.json").write_text("[]")
+    assert "log.json found" in check(vcs_dir)
+
+def test_walk_history_reads_records_in_batches(tmp_path):
+    graph, log, _ = build(tmp_path)
+    assert [r["id"] for r in walk_history(log, graph, "D", batch=2)] == ["D", "C", "B", "A"]
+    assert [r["id"] for r in walk_history(log, graph, "D", after="C")] == ["B", "A"]
+    with pytest.raises(ValueError):
+        list(walk_history(log, graph, "D", after="X"))
@@ -0,0 +1,77 @@
+import random
+
+import pytest
+
+from vcscore import linediff
+from vcscore.linediff import ALGORITHMS, MYERS, PATIENCE, diff_opcodes, unified_diff
+
+def lcs_length(a, b):
+    row = [0] * (len(b) + 1)
+    for x in a:
+        prev = 0
+        for j, y in enumerate(b):
+            prev, row[j + 1] = row[j + 1], prev + 1 if x == y else max(row[j + 1], row[j])
+    return row[-1]
+
+def apply(a, b, codes):
+    out = []
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == "equal":
+            assert a[i1:i2] == b[j1:j2]
+            out += a[i1:i2]
+        else:
+            out += b[j1:j2]
+    return out
+
+def edits(codes):
+    return sum(i2 - i1 + j2 - j1 for tag, i1, i2, j1, j2 in codes if tag != "equal")
+
+def random_pair(rng, size, alphabet):
+    a = [rng.choice(alphabet) for _ in range(size)]
+    b = list(a)
+    for _ in range(rng.randint(0, size)):
+        op = rng.randrange(3)
+        pos = rng.randrange(len(b) + 1)
+        if op == 0 or not b:
+            b.insert(pos, rng.choice(alphabet))
+        elif op == 1:
+            del b[min(pos, len(b) - 1)]
+        else:
+            b[min(pos, len(b) - 1)] = rng.choice(alphabet)
+    return a, b
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_opcodes_rebuild_the_target(algorithm):
+    rng = random.Random(1)
+    for _ in range(300):
+        a, b = random_pair(rng, rng.randint(0, 40), "abcdefg")
+        assert apply(a, b, diff_opcodes(a, b, algorithm)) == b
+
+def test_myers_is_minimal():
+    rng = random.Random(2)
+    for _ in range(300):
+        a, b = random_pair(rng, rng.randint(0, 40), "abcd")
+        assert edits(diff_opcodes(a, b, MYERS)) == len(a) + len(b) - 2 * lcs_length(a, b)
+
+def test_patience_keeps_a_moved_block_whole():
+    a = ["def f():\n", "    return 1\n", "\n", "def g():\n", "    return 2\n"]
+    b = ["def g():\n", "    return 2\n", "\n", "def f():\n", "    return 1\n"]
+    codes = diff_opcodes(a, b, PATIENCE)
+    assert apply(a, b, codes) == b
+    assert ("equal", 3, 5, 0, 2) in codes
+
+def test_unified_diff_text():
+    a = ["a\n", "b\n", "c\n"]
+    assert list(unified_diff(a, a)) == []
+    assert list(unified_diff(a, ["a\n", "c\n", "d\n"], "x", "y")) == [
+        "--- x", "+++ y", "@@ -1,3 +1,3 @@", " a", "-b", " c", "+d"]
+
+def test_budget_cutoff_stays_correct(monkeypatch):
+    rng = random.Random(3)
+    a, b = random_pair(rng, 2000, "abcdefghij")
+    exact = edits(diff_opcodes(a, b, MYERS))
+    monkeypatch.setattr(linediff, "DIFF_BUDGET", 0)
+    codes = diff_opcodes(a, b, MYERS)
+    # Past the cap the split is only approximate, but the opcodes still apply
+    assert apply(a, b, codes) == b
+    assert edits(codes) > exact
@@ -0,0 +1,76 @@
+import os
+
+from vcscore import tree
+from vcscore.merge import (apply_merge, merge_bytes, merge_lines, merge_trees, read_conflicts,
+                           record_conflicts, resolve_conflicts)
+from vcscore.statcache import StatCache
+
+BASE = b"a\nb\nc\nd\ne\n"
+
+def lines(data):
+    return data.splitlines(keepends=True)
+
+def test_changes_on_both_sides_in_different_regions_merge_cleanly():
+    merged, conflicts = merge_lines(lines(BASE), lines(b"A\nb\nc\nd\ne\n"), lines(b"a\nb\nc\nd\nE\n"))
+    assert (b"".join(merged), conflicts) == (b"A\nb\nc\nd\nE\n", 0)
+
+def test_same_change_on_both_sides_is_taken_once():
+    merged, conflicts = merge_lines(lines(BASE), lines(b"a\nB\nc\nd\ne\n"), lines(b"a\nB\nc\nd\ne\n"))
+    assert (b"".join(merged), conflicts) == (b"a\nB\nc\nd\ne\n", 0)
+
+def test_overlapping_changes_conflict():
+    merged, conflicts = merge_lines(lines(BASE), lines(b"a\nours\nc\nd\ne\n"), lines(b"a\ntheirs\nc\nd\ne\n"),
+                                    labels=("main", "topic"))
+    assert conflicts == 1
+    assert b"".join(merged) == b"a\n<<<<<<< main\nours\n=======\ntheirs\n>>>>>>> topic\nc\nd\ne\n"
+
+def test_conflict_markers_start_on_their_own_line():
+    merged, conflicted = merge_bytes(b"x", b"ours", b"theirs")
+    assert conflicted
+    assert merged == b"<<<<<<< ours\nours\n=======\ntheirs\n>>>>>>> theirs\n"
+
+def test_merge_trees_by_path(store):
+    base = {"same": store.write_bytes(b"s\n"), "src/edit": store.write_bytes(BASE),
+            "src/gone": store.write_bytes(b"g\n"), "both": store.write_bytes(b"x\n")}
+    ours = {**base, "src/edit": store.write_bytes(b"A\nb\nc\nd\ne\n"), "both": store.write_bytes(b"ours\n")}
+    theirs = {**base, "src/edit": store.write_bytes(b"a\nb\nc\nd\nE\n"), "both": store.write_bytes(b"theirs\n"),
+              "new": store.write_bytes(b"n\n")}
+    del theirs["src/gone"]
+    write = lambda files: tree.write(store, files)
+    updates, conflicts = merge_trees(store, write(base), write(ours), write(theirs))
+    assert updates == {"src/edit": store.write_bytes(b"A\nb\nc\nd\nE\n"), "src/gone": None, "new": theirs["new"]}
+    assert list(conflicts) == ["both"]
+
+def test_mode_change_merges_with_a_content_change(store):
+    base = store.write_bytes(BASE)
+    ours = store.write_bytes(b"A\nb\nc\nd\ne\n")
+    theirs = tree.file_entry(store.write_bytes(b"a\nb\nc\nd\nE\n"), True)
+    write = lambda entry: tree.write(store, {"run.sh": entry})
+    updates, conflicts = merge_trees(store, write(base), write(ours), write(theirs))
+    assert not conflicts
+    assert updates == {"run.sh": tree.file_entry(store.write_bytes(b"A\nb\nc\nd\nE\n"), True)}
+
+def test_apply_merge_writes_the_workspace_and_index(store, tmp_path):
+    workspace = tmp_path / "workspace"
+    (workspace / "old").mkdir(parents=True)
+    (workspace / "old" / "gone").write_bytes(b"g\n")
+    (workspace / "both").write_bytes(b"ours\n")
+    index = {"old/gone": store.write_bytes(b"g\n"), "both": store.write_bytes(b"ours\n")}
+    ours = dict(index)
+    new = store.write_bytes(b"n\n")
+    cache = StatCache(str(tmp_path / "cache.json"))
+    apply_merge(store, str(workspace), cache, index, {"old/gone": None, "src/new": new},
+                {"both": b"<<<<<<< ours\n"})
+    assert index == {"both": ours["both"], "src/new": new}
+    assert not os.path.exists(workspace / "old")
+    assert (workspace / "src" / "new").read_bytes() == b"n\n"
+    assert (workspace / "both").read_bytes() == b"<<<<<<< ours\n"
+
+def test_conflicts_stay_listed_until_resolved(tmp_path):
+    conflicts_file = str(tmp_path / "MERGE_CONFLICTS")
+    assert read_conflicts(conflicts_file) == []
+    record_conflicts(conflicts_file, {"b", "a/c"})
+    resolve_conflicts(conflicts_file, ["a/c", "other"])
+    assert read_conflicts(conflicts_file) == ["b"]
+    resolve_conflicts(conflicts_file, ["b"])
+    assert read_conflicts(conflicts_file) == []
@@ -0,0 +1,94 @@
+import hashlib
+import zlib
+
+from vcscore.delta import DeltaIndex, MAX_DELTA_DEPTH, apply_delta, create_delta
+from vcscore.objects import hash_bytes
+from vcscore.pack import OBJ_DELTA, OBJ_FULL, Pack, PackWriter
+
+BASE = b"".join(b"line %d of the base file\n" % i for i in range(200))
+
+def write_pack(store, objects, deltas=()):
+    writer = PackWriter(store.pack_dir)
+    for sha, data in objects.items():
+        writer.add_raw(sha, OBJ_FULL, len(data), zlib.compress(data))
+    for sha, base, data in deltas:
+        writer.add_delta(sha, base, len(data), create_delta(DeltaIndex(objects[base]), data))
+    return Pack(writer.finish())
+
+def delta_depth(pack, sha):
+    depth = 0
+    kind, _, base, _, _ = pack.entry(pack.find(sha))
+    while kind == OBJ_DELTA:
+        depth += 1
+        kind, _, base, _, _ = pack.entry(pack.find(base))
+    return depth
+
+def test_repack_round_trip(store, tmp_path):
+    objects = {store.write_bytes(data): data for data in (b"", b"one\n", BASE)}
+    assert store.repack() == {"objects": 3, "deltas": 0, "loose": 3, "packs": 0}
+    assert list(store.iter_loose()) == []
+    for sha, data in objects.items():
+        assert store.read_bytes(sha) == data
+    dest = tmp_path / "out"
+    store.copy_to(hash_bytes(BASE), str(dest))
+    assert dest.read_bytes() == BASE
+
+def test_repack_folds_packs_together(store):
+    first = store.write_bytes(b"first\n")
+    store.repack()
+    second = store.write_bytes(b"second\n")
+    assert store.repack() == {"objects": 2, "deltas": 0, "loose": 1, "packs": 1}
+    assert len(store.packs()) == 1
+    assert store.read_bytes(first) == b"first\n" and store.read_bytes(second) == b"second\n"
+
+def test_index_fanout_lookup(store):
+    # IDs at both ends of the fanout table and several sharing a first byte
+    names = ["00" + "1" * 38, "00" + "2" * 38, "7f" + "0" * 38, "ff" * 20]
+    names += [hashlib.sha1(b"%d" % i).hexdigest() for i in range(300)]
+    pack = write_pack(store, {name: name.encode() for name in names})
+    try:
+        assert pack.count == len(names)
+        assert sorted(pack.names()) == sorted(names)
+        for name in names:
+            assert pack.read(name) == name.encode()
+        for missing in ["00" * 20, "00" + "3" * 38, "80" + "0" * 38, "fe" + "f" * 38]:
+            assert pack.find(missing) is None
+            assert missing not in pack
+    finally:
+        pack.close()
+
+def test_delta_round_trip():
+    target = BASE.replace(b"line 7 ", b"line seven ") + b"appended\n"
+    delta = create_delta(DeltaIndex(BASE), target)
+    assert len(delta) < len(target) // 4
+    assert apply_delta(BASE, delta) == target
+
+def test_delta_over_max_size_is_dropped():
+    assert create_delta(DeltaIndex(BASE), b"unrelated\n" * 100, max_size=10) is None
+
+def test_pack_delta_entry_round_trip(store):
+    target = BASE + b"tail\n"
+    pack = write_pack(store, {hash_bytes(BASE): BASE}, [(hash_bytes(target), hash_bytes(BASE), target)])
+    try:
+        assert pack.entry(pack.find(hash_bytes(target)))[0] == OBJ_DELTA
+        assert pack.read(hash_bytes(target)) == target
+        assert pack.size(hash_bytes(target)) == len(target)
+        for data in (BASE, target):
+            assert b"".join(pack.iter_chunks(hash_bytes(data))) == data
+    finally:
+        pack.close()
+
+def test_repack_caps_delta_chains(store):
+    # Each version edits one more line, so its closest relative is the next one
+    base_lines = BASE.splitlines(keepends=True)
+    versions = [b"".join(b"edited %d\n" % j if j < i else line for j, line in enumerate(base_lines))
+                for i in range(MAX_DELTA_DEPTH + 20)]
+    # Newest first, as the history walk hints them
+    hints = {store.write_bytes(data): ("file", age) for age, data in enumerate(reversed(versions))}
+    result = store.repack(hints)
+    assert result["objects"] == len(versions) and result["deltas"] > MAX_DELTA_DEPTH
+
+    pack, = store.packs()
+    assert max(delta_depth(pack, hash_bytes(data)) for data in versions) == MAX_DELTA_DEPTH
+    for data in versions:
+        assert store.read_bytes(hash_bytes(data)) == data
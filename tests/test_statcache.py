@@ -0,0 +1,38 @@
+import os
+
+from vcscore.objects import hash_bytes
+from vcscore.statcache import StatCache
+
+def rewrite(path, data, mtime_ns):
+    # Same size and inode; only the content and the chosen mtime differ
+    with open(path, "r+b") as f:
+        f.write(data)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+def test_unchanged_signature_skips_the_read(tmp_path):
+    path = tmp_path / "file"
+    path.write_bytes(b"before\n")
+    old = os.stat(path).st_mtime_ns - 10**9
+    os.utime(path, ns=(old, old))
+    cache = StatCache(str(tmp_path / "cache.json"))
+    assert cache.hash(str(path)) == hash_bytes(b"before\n")
+    cache.save()
+
+    # Older than the cache file, so the stat signature is trusted as-is
+    rewrite(path, b"after!\n", old)
+    assert StatCache(cache.path).hash(str(path)) == hash_bytes(b"before\n")
+
+def test_racy_clean_file_is_rehashed(tmp_path):
+    path = tmp_path / "file"
+    path.write_bytes(b"before\n")
+    cache = StatCache(str(tmp_path / "cache.json"))
+    cache.hash(str(path))
+    stamp = os.stat(path).st_mtime_ns
+    cache.save()
+
+    # Modified within the same mtime tick the cache was saved in
+    os.utime(cache.path, ns=(stamp, stamp))
+    rewrite(path, b"after!\n", stamp)
+    reloaded = StatCache(cache.path)
+    assert reloaded.hash(str(path)) == hash_bytes(b"after!\n")
+    assert reloaded.dirty
@@ -0,0 +1,62 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+from vcs import org_config
+from vcscore.atomic import atomic_write, atomic_write_json
+from vcscore.sync import Endpoint, commit_path, read_refs, sync
+
+START = datetime(2024, 1, 1)
+
+def make_repo(path):
+    side = Endpoint(str(path), org_config)
+    for directory in (side.commits_dir, side.store.root, side.branches_dir):
+        os.makedirs(directory, exist_ok=True)
+    side.commit_log.create()
+    atomic_write(side.head_file, "main")
+    return side
+
+def commit(side, commit_id, parents, files, minutes, branch="main"):
+    tree = {name: side.store.write_bytes(data) for name, data in files.items()}
+    record = {"id": commit_id, "timestamp": (START + timedelta(minutes=minutes)).isoformat(),
+              "message": commit_id, "parents": parents,
+              "tree": side.store.write_bytes(json.dumps(tree).encode())}
+    atomic_write_json(commit_path(side, commit_id), record)
+    side.commit_log.append({key: record[key] for key in ("id", "timestamp", "message")})
+    atomic_write(os.path.join(side.branches_dir, branch), commit_id)
+
+def test_fast_forward_copies_only_the_new_commits(tmp_path):
+    src = make_repo(tmp_path / "src")
+    commit(src, "c1", [], {"a.txt": b"one\n"}, 1)
+    assert sync(src, Endpoint(str(tmp_path / "dst"), org_config))["commits"] == 1
+
+    commit(src, "c2", ["c1"], {"a.txt": b"one\n", "b.txt": b"two\n"}, 2)
+    dst = Endpoint(str(tmp_path / "dst"), org_config)
+    result = sync(src, dst)
+    # Only c2, its tree and b.txt are new on the other side
+    assert result["success"] and result["commits"] == 1 and result["objects"] == 2
+    assert read_refs(dst) == {"main": "c2"}
+
+def test_non_fast_forward_is_rejected(tmp_path):
+    src = make_repo(tmp_path / "src")
+    commit(src, "c1", [], {"a.txt": b"one\n"}, 1)
+    dst = Endpoint(str(tmp_path / "dst"), org_config)
+    sync(src, dst)
+
+    commit(src, "c2", ["c1"], {"a.txt": b"theirs\n"}, 2)
+    commit(dst, "c3", ["c1"], {"a.txt": b"ours\n"}, 3)
+    result = sync(src, dst)
+    assert not result["success"] and result["rejected"] == ["main"]
+    assert read_refs(dst) == {"main": "c3"}
+    assert not os.path.exists(commit_path(dst, "c2"))
+
+def test_behind_destination_is_left_alone(tmp_path):
+    src = make_repo(tmp_path / "src")
+    commit(src, "c1", [], {"a.txt": b"one\n"}, 1)
+    dst = Endpoint(str(tmp_path / "dst"), org_config)
+    sync(src, dst)
+    commit(dst, "c2", ["c1"], {"a.txt": b"two\n"}, 2)
+
+    result = sync(src, dst)
+    assert result["success"] and result["updated"] == {}
+    assert read_refs(dst) == {"main": "c2"}
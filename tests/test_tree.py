@@ -0,0 +1,61 @@
+import os
+import stat
+
+from vcscore import tree
+from vcscore.statcache import StatCache
+
+FILES = {"README": "a" * 40, "src/main.py": "b" * 40, "src/lib/util.py": "c" * 40, "docs/guide.md": "d" * 40}
+
+def test_nested_diff_skips_equal_subtrees(store):
+    old = tree.write(store, FILES)
+    new = tree.write(store, {**FILES, "src/lib/util.py": "e" * 40, "src/lib/new.py": "f" * 40})
+    assert list(tree.diff(store, old, new)) == [("src/lib/new.py", None, "f" * 40),
+                                                ("src/lib/util.py", "c" * 40, "e" * 40)]
+    assert tree.flatten(store, new)["src/lib/new.py"] == "f" * 40
+    assert tree.lookup(store, new, "src/lib/util.py") == "e" * 40
+    assert tree.lookup(store, new, "src/missing/util.py") is None
+
+    # Only the trees on the changed path are read: the root, src/ and src/lib/
+    reads = []
+    real = store.read_bytes
+    store.read_bytes = lambda sha: reads.append(sha) or real(sha)
+    list(tree.diff(store, old, new))
+    assert len(reads) == 6
+
+def test_executable_bit_is_part_of_the_entry(store):
+    plain = tree.write(store, FILES)
+    executable = tree.write(store, {**FILES, "src/main.py": tree.file_entry("b" * 40, True)})
+    path, old, new = next(tree.diff(store, plain, executable))
+    assert path == "src/main.py" and old == "b" * 40
+    assert tree.is_executable(new) and tree.object_id(new) == "b" * 40
+    # Trees without executables keep the IDs they had before modes were tracked
+    assert tree.file_entry("b" * 40, False) == "b" * 40
+
+def test_checkout_sets_and_clears_the_bit(store, tmp_path):
+    sha = store.write_bytes(b"#!/bin/sh\n")
+    dest = str(tmp_path / "run.sh")
+    tree.checkout_file(store, tree.file_entry(sha, True), dest)
+    assert os.stat(dest).st_mode & stat.S_IXUSR
+
+    cache = StatCache(str(tmp_path / "cache.json"))
+    assert cache.entry(dest) == {"id": sha, "mode": tree.EXECUTABLE}
+    tree.checkout_file(store, sha, dest)
+    assert not os.stat(dest).st_mode & stat.S_IXUSR
+    assert cache.entry(dest) == sha
+
+def test_repack_hints_take_the_newest_path(store):
+    old = tree.write(store, FILES)
+    new = tree.write(store, {**FILES, "src/lib/util.py": "e" * 40})
+    hints = tree.repack_hints(store, {"NEWS": "f" * 40}, [new, None, old])
+    assert hints["f" * 40] == ("NEWS", 0)
+    assert hints["e" * 40] == ("src/lib/util.py", 1)
+    assert hints["c" * 40] == ("src/lib/util.py", 3)
+    assert hints["a" * 40] == ("README", 1)
+
+def test_tracked_changes_leave_untracked_files_out(store):
+    head = tree.write(store, FILES)
+    workspace = {**FILES, "src/main.py": "e" * 40, "notes.txt": "f" * 40, "src/new.py": "f" * 40}
+    del workspace["README"]
+    changes = tree.tracked_changes(store, head, workspace, {"src/new.py": "f" * 40})
+    assert list(changes) == ["README", "src/main.py", "src/new.py"]
+    assert not any(tree.tracked_changes(store, head, {**FILES, "notes.txt": "f" * 40}, {}))
@@ -0,0 +1,205 @@
+import os
+import json
+import zlib
+import struct
+import hashlib
+from vcscore.atomic import temp_file
+from vcscore.sync import (
+    read_commit, read_refs, resolve_commit, commit_path, commit_graph, missing_commits, missing_objects,
+    plan_updates, rejection, add_commits, write_refs
+)
+
+# A bundle is one file: the MAGIC line, then a single zlib stream of records
+#   H <len> <json>           header: refs, tip, prerequisites, counts
+#   O <sha> <len> <bytes>    one object per record
+#   C <len> <json>           one commit record per record, parents first
+#   E <sha256>               SHA-256 of every uncompressed byte up to and including "E"
+MAGIC = b"# myvcs bundle v1\n"
+LENGTH = struct.Struct(">Q")
+COMPRESS_LEVEL = 6
+
+# Bytes read, and at most decompressed, per call while unpacking
+READ_SIZE = 1024 * 1024
+
+class BundleWriter:
+    def __init__(self, f):
+        self.f = f
+        self.sha = hashlib.sha256()
+        self.zip = zlib.compressobj(COMPRESS_LEVEL)
+        f.write(MAGIC)
+
+    def write(self, data):
+        self.sha.update(data)
+        self.f.write(self.zip.compress(data))
+
+    def record(self, kind, payload, sha=b""):
+        self.write(kind + sha + LENGTH.pack(len(payload)))
+        self.write(payload)
+
+    def stream(self, kind, size, chunks, sha=b""):
+        """Write a record of ``size`` bytes from ``chunks`` without joining them."""
+        self.write(kind + sha + LENGTH.pack(size))
+        for chunk in chunks:
+            self.write(chunk)
+
+    def close(self):
+        self.write(b"E")
+        self.f.write(self.zip.compress(self.sha.digest()))
+        self.f.write(self.zip.flush())
+
+class BundleReader:
+    def __init__(self, f):
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a bundle file.")
+        self.f = f
+        self.sha = hashlib.sha256()
+        self.unzip = zlib.decompressobj()
+        self.buf = bytearray()
+
+    def _fill(self, n):
+        while len(self.buf) < n:
+            # Output is capped, so a highly compressed object is not inflated whole
+            chunk = self.unzip.unconsumed_tail or self.f.read(READ_SIZE)
+            if not chunk:
+                raise ValueError("Bundle is truncated.")
+            try:
+                self.buf += self.unzip.decompress(chunk, READ_SIZE)
+            except zlib.error as e:
+                raise ValueError(f"Bundle is corrupt: {e}")
+
+    def read(self, n, hashed=True):
+        self._fill(n)
+        data = bytes(self.buf[:n])
+        del self.buf[:n]
+        if hashed:
+            self.sha.update(data)
+        return data
+
+    def length(self):
+        return LENGTH.unpack(self.read(LENGTH.size))[0]
+
+    def payload(self):
+        return self.read(self.length())
+
+    def chunks(self, n):
+        """Yield the next ``n`` bytes in pieces of at most READ_SIZE."""
+        while n:
+            chunk = self.read(min(n, READ_SIZE))
+            n -= len(chunk)
+            yield chunk
+
+    def records(self):
+        """Yield ``("object", sha, chunks)`` and ``("commit", commit)`` records, then check the checksum.
+
+        An object's chunks are read from the bundle as they are consumed; the
+        ones left over are skipped when the next record is read.
+        """
+        while True:
+            kind = self.read(1)
+            if kind == b"O":
+                sha = self.read(40).decode()
+                chunks = self.chunks(self.length())
+                yield "object", sha, chunks
+                for _ in chunks:
+                    pass
+            elif kind == b"C":
+                yield "commit", json.loads(self.payload())
+            elif kind == b"E":
+                expected = self.sha.digest()
+                if self.read(len(expected), hashed=False) != expected:
+                    raise ValueError("Bundle checksum mismatch.")
+                return
+            else:
+                raise ValueError("Bundle is corrupt.")
+
+def resolve(side, name):
+    """Return the commit a branch name or (abbreviated) commit ID refers to."""
+    refs = read_refs(side)
+    if name in refs:
+        if refs[name] is None:
+            raise ValueError(f"Branch {name} has no commits.")
+        return refs[name]
+    commit_id = resolve_commit(side, name)
+    if commit_id is None:
+        raise ValueError(f"Unknown branch or commit: {name}")
+    return commit_id
+
+def ancestors(side, commit_id):
+    """Return ``commit_id`` and every commit reachable from it."""
+    graph = commit_graph(side)
+    return {graph.commit_id(row) for row in graph.walk(commit_id)}
+
+def create(side, path, spec):
+    """Write the commits of ``spec`` (``<tip>`` or ``<base>..<tip>``) with their objects to a bundle at ``path``."""
+    base_name, _, tip_name = spec.rpartition("..")
+    tip = resolve(side, tip_name)
+    base = resolve(side, base_name) if base_name else None
+    have = ancestors(side, base) if base else set()
+
+    commits = missing_commits(side, [tip], have.__contains__)
+    if not commits:
+        return {"success": False, "error": f"Nothing to bundle in {spec}."}
+    objects = missing_objects(side, commits, lambda sha: False)
+    refs = {tip_name: tip} if tip_name in read_refs(side) else {}
+    header = {"refs": refs, "tip": tip, "prerequisites": [base] if base else [],
+              "commits": len(commits), "objects": len(objects)}
+
+    # Written next to the target and renamed, so a failed run leaves no half bundle
+    fd, tmp = temp_file(os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            writer = BundleWriter(f)
+            writer.record(b"H", json.dumps(header).encode())
+            for sha in objects:
+                writer.stream(b"O", side.store.size(sha), side.store.iter_chunks(sha), sha.encode())
+            for commit in commits:
+                writer.record(b"C", json.dumps(commit).encode())
+            writer.close()
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return {"success": True, "bundle": path, "commits": len(commits), "objects": len(objects),
+            "refs": refs, "size": os.path.getsize(path)}
+
+def read_header(reader):
+    if reader.read(1) != b"H":
+        raise ValueError("Bundle is corrupt.")
+    return json.loads(reader.payload())
+
+def verify(path):
+    """Read a bundle through and check its checksum, without applying anything."""
+    with open(path, "rb") as f:
+        reader = BundleReader(f)
+        header = read_header(reader)
+        for record in reader.records():
+            pass
+    return {"success": True, **header}
+
+def unbundle(side, path):
+    """Add the commits and objects of a bundle to ``side`` and fast-forward its branches."""
+    with open(path, "rb") as f:
+        reader = BundleReader(f)
+        header = read_header(reader)
+        missing = [c for c in header["prerequisites"] if read_commit(side, c) is None]
+        if missing:
+            return {"success": False, "error": f"Missing prerequisite commits: {', '.join(missing)}"}
+        commits, objects = [], 0
+        for record in reader.records():
+            if record[0] == "object":
+                _, sha, chunks = record
+                side.store.write_chunks(sha, chunks)
+                objects += 1
+            else:
+                commits.append(record[1])
+
+    new = [commit for commit in commits if not os.path.exists(commit_path(side, commit["id"]))]
+    add_commits(side, new)
+    # Even when a branch is rejected, its commits stay available by ID
+    updates, rejected = plan_updates(header["refs"], side, read_refs(side), side)
+    if rejected:
+        return rejection(rejected)
+    write_refs(side, updates)
+    return {"success": True, "tip": header["tip"], "updated": updates,
+            "commits": len(new), "objects": objects}
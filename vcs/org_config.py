@@ -2,7 +2,34 @@ import os
 
 VCS_DIR = ".vcs"
 COMMITS_DIR = os.path.join(VCS_DIR, "commits")
-INDEX_DIR = os.path.join(VCS_DIR, "index")
-LOG_FILE = os.path.join(VCS_DIR, "log.json")
+OBJECTS_DIR = os.path.join(VCS_DIR, "objects")
+INDEX_FILE = os.path.join(VCS_DIR, "index.json")
+STAT_CACHE_FILE = os.path.join(VCS_DIR, "stat_cache.json")
+LOG_FILE = os.path.join(VCS_DIR, "log.jsonl")
+LOG_INDEX_FILE = os.path.join(VCS_DIR, "log.idx")
+LEGACY_LOG_FILE = os.path.join(VCS_DIR, "log.json")
+COMMIT_GRAPH_FILE = os.path.join(VCS_DIR, "commit-graph")
+COMMIT_IDS_FILE = os.path.join(VCS_DIR, "commit-ids")
+HISTORY_DIR = os.path.join(VCS_DIR, "history")
+TAGS_FILE = os.path.join(VCS_DIR, "tags.json")
 BRANCHES_DIR = os.path.join(VCS_DIR, "branches")
-HEAD_FILE = os.path.join(VCS_DIR, "HEAD")
\ No newline at end of file
+HEAD_FILE = os.path.join(VCS_DIR, "HEAD")
+MERGE_HEAD_FILE = os.path.join(VCS_DIR, "MERGE_HEAD")
+MERGE_CONFLICTS_FILE = os.path.join(VCS_DIR, "MERGE_CONFLICTS")
+MONITOR_DIR = os.path.join(VCS_DIR, "monitor")
+WORKSPACE_DIR = "workspace"
+
+# Metadata directory of a remote repository (laid out like the API server's)
+REMOTE_VCS_DIR = ".myvcs"
+
+# Recorded as the author of new commits (and hashed into their IDs)
+AUTHOR = os.environ.get("VCS_AUTHOR") or os.environ.get("USER") or os.environ.get("USERNAME") or "unknown"
+
+# Line diff algorithm: "myers" or "patience"
+DIFF_ALGORITHM = "myers"
+
+# Files larger than this are reported as changed without a line diff
+MAX_DIFF_SIZE = 8 * 1024 * 1024
+
+# Worker threads used to hash, store and materialize files
+JOBS = os.cpu_count() or 1
\ No newline at end of file
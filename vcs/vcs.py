@@ -1,267 +1,401 @@
 import os
+import sys
+import time
 import shutil
-import hashlib
+import subprocess
 import json
 from datetime import datetime
 from vcs.org_config import *
-import difflib
+from vcscore.objects import ObjectStore
+from vcscore.statcache import StatCache
+from vcscore.parallel import run_parallel
+from vcscore.commitlog import CommitLog, READ_BATCH, legacy_format, walk_history
+from vcscore.filehistory import FileHistory
+from vcscore.commitgraph import CommitGraph
+from vcscore.commitids import CommitIds, commit_hash
+from vcscore.linediff import diff_bytes, oversize_notice, PATIENCE
+from vcscore.sync import Endpoint, sync
+from vcs import bundle, org_config
+from vcscore import tree
+from vcscore import monitor
+from vcscore.merge import (merge_trees, apply_merge, record_conflicts, read_conflicts,
+                           resolve_conflicts, conflicts_error)
+
+store = ObjectStore(OBJECTS_DIR)
+commit_log = CommitLog(LOG_FILE, LOG_INDEX_FILE)
+file_history = FileHistory(HISTORY_DIR)
+commit_graph = CommitGraph(COMMIT_GRAPH_FILE)
+commit_ids = CommitIds(COMMIT_IDS_FILE)
+
+def format_error():
+    """Return why this version cannot use the repository in VCS_DIR, or None."""
+    return legacy_format(LOG_FILE, LEGACY_LOG_FILE, COMMITS_DIR, BRANCHES_DIR)
+
+def read_index():
+    if not os.path.exists(INDEX_FILE):
+        return {}
+    with open(INDEX_FILE, "r") as f:
+        return json.load(f)
+
+def write_index(entries):
+    with open(INDEX_FILE, "w") as f:
+        json.dump(entries, f, indent=2)
+
+def write_tree(files):
+    """Store a path -> entry mapping as one tree object per directory; return the root's ID."""
+    return tree.write(store, files)
+
+def read_tree(tree_id):
+    """Return the path -> entry mapping of every file under a tree."""
+    return tree.flatten(store, tree_id)
+
+def index_path(path):
+    """Return the index key of a file: its path inside the workspace, or its name if it is outside."""
+    rel = os.path.relpath(path, WORKSPACE_DIR)
+    if rel == os.pardir or rel.startswith(os.pardir + os.sep):
+        return os.path.basename(path)
+    return rel.replace(os.sep, "/")
+
+def workspace_path(path):
+    """Return where the file with index key ``path`` lives in the workspace."""
+    return os.path.join(WORKSPACE_DIR, *path.split("/"))
+
+def workspace_state(cache, jobs=JOBS):
+    """Hash every file under the workspace through the stat cache; return path -> tree entry."""
+    files = monitor.query(MONITOR_DIR)
+    if files is not None:
+        return files
+    paths = tree.list_files(WORKSPACE_DIR) if os.path.exists(WORKSPACE_DIR) else []
+    return dict(zip(paths, run_parallel(lambda path: cache.entry(workspace_path(path)), paths, jobs)))
+
+def commit_file(commit_id):
+    return os.path.join(COMMITS_DIR, f"{commit_id}.json")
+
+def commit_exists(commit_id):
+    return os.path.exists(commit_file(commit_id))
+
+def read_commit(commit_id):
+    """Return a commit (id, message, timestamp, parents, tree), or None if it does not exist."""
+    path = commit_file(commit_id)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+def commit_files(commit_id):
+    """Return the filename -> object ID mapping of a commit, or None."""
+    commit = read_commit(commit_id)
+    return read_tree(commit["tree"]) if commit is not None else None
+
+def branch_file(name):
+    return os.path.join(BRANCHES_DIR, name)
+
+def read_branch(name):
+    """Return the tip commit of a branch, or None if it has no commits."""
+    path = branch_file(name)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return f.read().strip() or None
+
+def write_branch(name, commit_id):
+    os.makedirs(BRANCHES_DIR, exist_ok=True)
+    with open(branch_file(name), "w") as f:
+        f.write(commit_id or "")
+
+def head_commit():
+    """Return the tip of the current branch, or None before the first commit."""
+    return read_branch(get_current_branch())
+
+def ensure_file_history():
+    # Repositories created before the per-file index existed get it built
+    # once from the commit log.
+    if not file_history.exists():
+        file_history.rebuild((entry, commit_files(entry["id"]) or {}) for entry in commit_log)
+
+def graph():
+    """Return the commit graph, brought up to date with the commit log."""
+    commit_graph.update(commit_log, read_commit)
+    return commit_graph
+
+def resolve_commit(name):
+    """Return the full ID of a commit ID or unique prefix; ValueError if the prefix is ambiguous."""
+    if commit_exists(name):
+        return name
+    commit_ids.update(graph())
+    return commit_ids.resolve(name) or name
+
+def iter_history(tip, batch=READ_BATCH):
+    """Yield the log entries of the commits reachable from ``tip``, children before parents."""
+    if tip:
+        yield from walk_history(commit_log, graph(), tip, batch=batch)
 
 def init_repo():
     if os.path.exists(VCS_DIR):
         print(".vcs already exists")
         return
     
-    os.makedirs(INDEX_DIR)
     os.makedirs(COMMITS_DIR)
-    with open(LOG_FILE, "w") as f:
-        f.write("[]")
+    os.makedirs(OBJECTS_DIR)
+    os.makedirs(BRANCHES_DIR)
+    os.makedirs(HISTORY_DIR)
+    commit_log.create()
     print("INITIALIZED: empty repo in .vcs")
 
-def add_file(filename):
+def add_file(filename, jobs=JOBS):
     if not os.path.exists(filename):
         print(f"File {filename} not found.")
         return
-    
-    os.makedirs(INDEX_DIR, exist_ok=True)
-    shutil.copy2(filename, os.path.join(INDEX_DIR, os.path.basename(filename)))
-    print(f"STAGED: {filename}")
-
-def commit(message):
-    if not os.path.exists(INDEX_DIR) or not os.listdir(INDEX_DIR):
-        print("Nothing to commit.")
-        return
 
-    with open(LOG_FILE, "r") as f:
-        log = json.load(f)
-
-    timestamp = datetime.utcnow().isoformat()
-    commit_id = hashlib.sha1(f"{timestamp}{message}".encode()).hexdigest()[:6]
-    commit_path = os.path.join(COMMITS_DIR, commit_id)
-    os.makedirs(commit_path)
+    if os.path.isdir(filename):
+        stage_files([os.path.join(filename, *path.split("/")) for path in tree.list_files(filename)], jobs)
+    else:
+        stage_files([filename], jobs)
 
-    for filename in os.listdir(INDEX_DIR):
-        shutil.copy2(os.path.join(INDEX_DIR, filename), os.path.join(commit_path, filename))
+def stage_files(paths, jobs=JOBS):
+    index = read_index()
+    cache = StatCache(STAT_CACHE_FILE)
 
-    log.append({"id": commit_id, "message": message, "timestamp": timestamp})
-    with open(LOG_FILE, "w") as f:
-        json.dump(log, f, indent=2)
+    def stage(path):
+        entry = cache.entry(path)
+        store.write_file(path, tree.object_id(entry))
+        return entry
 
-    branch = get_current_branch()
-    branch_path = os.path.join(BRANCHES_DIR, f"{branch}.json")
+    for path, sha in zip(paths, run_parallel(stage, paths, jobs)):
+        index[index_path(path)] = sha
+        print(f"STAGED: {path}")
+    write_index(index)
+    cache.save()
+    resolve_conflicts(MERGE_CONFLICTS_FILE, [index_path(path) for path in paths])
 
-    if os.path.exists(branch_path):
-        with open(branch_path, "r") as f:
-            branch_log = json.load(f)
-    else:
-        branch_log = []
+def commit(message):
+    index = read_index()
+    if not index:
+        print("Nothing to commit.")
+        return
 
-    branch_log.append(commit_id)
+    unresolved = read_conflicts(MERGE_CONFLICTS_FILE)
+    if unresolved:
+        print(conflicts_error(unresolved))
+        return
 
-    with open(branch_path, "w") as f:
-        json.dump(branch_log, f, indent=2)
+    branch = get_current_branch()
+    tip = read_branch(branch)
+    parents = [tip] if tip else []
+    if os.path.exists(MERGE_HEAD_FILE):
+        with open(MERGE_HEAD_FILE, "r") as f:
+            parents.append(f.read().strip())
 
-    shutil.rmtree(INDEX_DIR)
-    os.makedirs(INDEX_DIR)
+    ensure_file_history()
+    timestamp = datetime.utcnow().isoformat()
+    tree_id = write_tree(index)
+    commit_id = commit_hash(tree_id, parents, AUTHOR, timestamp, message)
+    os.makedirs(COMMITS_DIR, exist_ok=True)
+    commit_data = {"id": commit_id, "message": message, "timestamp": timestamp, "author": AUTHOR,
+                   "parents": parents, "generation": graph().next_generation(parents),
+                   "tree": tree_id}
+    with open(commit_file(commit_id), "w") as f:
+        json.dump(commit_data, f, indent=2)
+
+    entry = {"id": commit_id, "message": message, "timestamp": timestamp}
+    commit_log.append(entry)
+    commit_graph.update(commit_log, read_commit)
+    file_history.record(index, entry)
+
+    write_branch(branch, commit_id)
+    write_index({})
+    for merge_file in (MERGE_HEAD_FILE, MERGE_CONFLICTS_FILE):
+        if os.path.exists(merge_file):
+            os.remove(merge_file)
 
     print(f"COMMITTED: {commit_id}: {message}")
 
-def log_commits():
+def log_commits(limit=None):
     if not os.path.exists(LOG_FILE):
         print("No commits found.")
         return
 
-    with open(LOG_FILE, "r") as f:
-        log = json.load(f)
-
-    if not log:
+    if not len(commit_log):
         print("No commits yet.")
         return
 
-    for entry in reversed(log):  # most recent first
+    # most recent first; with a limit only the last entries are read
+    entries = reversed(commit_log.tail(limit)) if limit else commit_log.iter_reverse()
+    for entry in entries:
         print(f"Commit: {entry['id']}")
         print(f"Date: {entry['timestamp']}")
         print(f"Message: {entry['message']}\n")
 
-def hash_file(path):
-    with open(path, "rb") as f:
-        return hashlib.sha1(f.read()).hexdigest()
-
 def status():
-    workspace_files = set(os.listdir("workspace")) if os.path.exists("workspace") else set()
-    index_files = set(os.listdir(INDEX_DIR)) if os.path.exists(INDEX_DIR) else set()
-
-    # Get last commit ID
-    if os.path.exists(LOG_FILE):
-        import json
-        with open(LOG_FILE) as f:
-            log = json.load(f)
-            last_commit_id = log[-1]['id'] if log else None
-    else:
-        last_commit_id = None
-
-    committed_files = set()
-    committed_hashes = {}
-
-    if last_commit_id:
-        commit_path = os.path.join(COMMITS_DIR, last_commit_id)
-        if os.path.exists(commit_path):
-            committed_files = set(os.listdir(commit_path))
-            for fname in committed_files:
-                committed_hashes[fname] = hash_file(os.path.join(commit_path, fname))
+    index = read_index()
+    index_files = set(index)
+    cache = StatCache(STAT_CACHE_FILE)
+    files = workspace_state(cache)
+    cache.save()
+
+    # Subtrees equal to the last commit's are skipped by ID
+    last_commit_id = head_commit()
+    head_tree = read_commit(last_commit_id)["tree"] if last_commit_id else None
+    root, trees = tree.build(files)
+    committed = {path: old for path, old, _ in tree.diff(store, head_tree, root, trees)}
 
     print("=== Workspace Status ===")
-    for fname in sorted(workspace_files):
+    for fname in sorted(files):
         in_index = fname in index_files
-        in_commit = fname in committed_files
-        file_path = os.path.join("workspace", fname)
+        # Paths missing from the diff are unchanged since the last commit
+        committed_hash = committed.get(fname, files[fname])
+        in_commit = committed_hash is not None
+        current_hash = files[fname]
 
         if not in_index and not in_commit:
             print(f"{fname}: Untracked")
         elif in_index and not in_commit:
             print(f"{fname}: Staged for commit")
-        elif in_commit:
-            current_hash = hash_file(file_path)
-            committed_hash = committed_hashes.get(fname)
-            if in_index:
-                index_hash = hash_file(os.path.join(INDEX_DIR, fname))
-                if index_hash == current_hash:
-                    print(f"{fname}: Staged (Unmodified)")
-                else:
-                    print(f"{fname}: Staged but modified")
-            elif current_hash != committed_hash:
-                print(f"{fname}: Modified but not staged")
+        elif in_index:
+            if index[fname] == current_hash:
+                print(f"{fname}: Staged (Unmodified)")
             else:
-                print(f"{fname}: Unmodified")
+                print(f"{fname}: Staged but modified")
+        elif current_hash != committed_hash:
+            print(f"{fname}: Modified but not staged")
+        else:
+            print(f"{fname}: Unmodified")
 
     # Files staged but deleted from workspace
-    for fname in sorted(index_files - workspace_files):
+    for fname in sorted(index_files - files.keys()):
         print(f"{fname}: Staged but missing in workspace")
 
-def checkout(commit_id):
-    commit_path = os.path.join(COMMITS_DIR, commit_id)
-    workspace_path = "workspace"
+def checkout(commit_id, jobs=JOBS):
+    try:
+        commit_id = resolve_commit(commit_id)
+    except ValueError as e:
+        print(e)
+        return
+    commit = read_commit(commit_id)
 
-    if not os.path.exists(commit_path):
+    if commit is None:
         print(f"Commit {commit_id} does not exist.")
         return
 
-    if not os.path.exists(workspace_path):
-        os.makedirs(workspace_path)
+    os.makedirs(WORKSPACE_DIR, exist_ok=True)
+
+    written, removed = sync_workspace(commit["tree"], jobs)
+    print(f"Checked out commit {commit_id} to workspace ({written} updated, {removed} removed).")
+
+def sync_workspace(tree_id, jobs=JOBS):
+    """Make the workspace hold exactly the files of tree ``tree_id``, rewriting only what differs."""
+    cache = StatCache(STAT_CACHE_FILE)
+    root, trees = tree.build(workspace_state(cache, jobs))
+    changes = list(tree.diff(store, root, tree_id, trees))
 
-    # Clear workspace
-    for fname in os.listdir(workspace_path):
-        fpath = os.path.join(workspace_path, fname)
-        if os.path.isfile(fpath):
-            os.remove(fpath)
+    stale = [path for path, _, sha in changes if sha is None]
+    for path in stale:
+        fpath = workspace_path(path)
+        os.remove(fpath)
+        cache.forget(fpath)
+        tree.prune_dirs(WORKSPACE_DIR, path)
 
-    # Copy files from commit into workspace
-    for fname in os.listdir(commit_path):
-        shutil.copy2(os.path.join(commit_path, fname), os.path.join(workspace_path, fname))
+    changed = [(path, sha) for path, _, sha in changes if sha is not None]
 
-    print(f"Checked out commit {commit_id} to workspace.")
+    def materialize(item):
+        path, sha = item
+        fpath = workspace_path(path)
+        os.makedirs(os.path.dirname(fpath), exist_ok=True)
+        tree.checkout_file(store, sha, fpath)
+        cache.record(fpath, sha)
 
-def diff(filepath):
-    filename = os.path.basename(filepath)
+    run_parallel(materialize, changed, jobs)
+    cache.save()
+    return len(changed), len(stale)
+
+def diff(filepath, algorithm=DIFF_ALGORITHM):
+    filename = index_path(filepath)
 
     if not os.path.exists(filepath):
         print(f"{filename} does not exist in workspace.")
         return
 
     # Find last commit ID
-    if not os.path.exists(LOG_FILE):
-        print("No commits found.")
-        return
-
-    with open(LOG_FILE) as f:
-        log = json.load(f)
-
-    if not log:
+    last_commit_id = head_commit()
+    if last_commit_id is None:
         print("No commits found.")
         return
 
-    last_commit_id = log[-1]["id"]
-    committed_path = os.path.join(COMMITS_DIR, last_commit_id, filename)
+    committed = tree.lookup(store, read_commit(last_commit_id)["tree"], filename)
 
-    if not os.path.exists(committed_path):
+    if committed is None:
         print(f"{filename} was not in the last commit.")
         return
+    committed_sha = tree.object_id(committed)
 
-    with open(committed_path, "r") as f1:
-        committed_lines = f1.readlines()
+    cache = StatCache(STAT_CACHE_FILE)
+    workspace_sha = cache.hash(filepath)
+    cache.save()
+    if workspace_sha == committed_sha:
+        print(f"No changes in {filename}.")
+        return
 
-    with open(filepath, "r") as f2:
-        workspace_lines = f2.readlines()
+    fromfile, tofile = f"committed/{filename}", f"workspace/{filename}"
+    committed_size = store.size(committed_sha)
+    workspace_size = os.path.getsize(filepath)
+    if max(committed_size, workspace_size) > MAX_DIFF_SIZE:
+        print(oversize_notice(fromfile, tofile, committed_size, workspace_size))
+        return
 
-    diff = difflib.unified_diff(
-        committed_lines,
-        workspace_lines,
-        fromfile=f"committed/{filename}",
-        tofile=f"workspace/{filename}",
-        lineterm=""
-    )
-
-    diff_output = list(diff)
-    if diff_output:
-        print("\n".join(diff_output))
-    else:
-        print(f"No changes in {filename}.")
+    with open(filepath, "rb") as f2:
+        workspace_data = f2.read()
+    for line in diff_bytes(store.read_bytes(committed_sha), workspace_data, fromfile, tofile, algorithm):
+        print(line)
 
 def restore(commit_id, filename=None):
     if filename is None:
         filename = commit_id
-        if not os.path.exists(LOG_FILE):
+        commit_id = head_commit()
+        if commit_id is None:
             print("No commits found.")
             return
-        with open(LOG_FILE) as f:
-            log = json.load(f)
-            if not log:
-                print("No commits found.")
-                return
-        commit_id = log[-1]["id"]
-
-    commit_path = os.path.join(COMMITS_DIR, commit_id)
-    source_file = os.path.join(commit_path, filename)
-    destination = os.path.join("workspace", filename)
-
-    if not os.path.exists(commit_path):
+
+    try:
+        commit_id = resolve_commit(commit_id)
+    except ValueError as e:
+        print(e)
+        return
+    commit = read_commit(commit_id)
+    destination = workspace_path(filename)
+
+    if commit is None:
         print(f"Commit {commit_id} does not exist.")
         return
 
-    if not os.path.exists(source_file):
+    sha = tree.lookup(store, commit["tree"], filename)
+    if sha is None:
         print(f"{filename} not found in commit {commit_id}.")
         return
 
-    os.makedirs("workspace", exist_ok=True)
-    shutil.copy2(source_file, destination)
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    tree.checkout_file(store, sha, destination)
+    cache = StatCache(STAT_CACHE_FILE)
+    cache.record(destination, sha)
+    cache.save()
     print(f"Restored {filename} from commit {commit_id} to workspace.")
 
-def history(filename):
-    if not os.path.exists(LOG_FILE):
+def history(filename, limit=None):
+    if not len(commit_log):
         print("No commits found.")
         return
 
-    with open(LOG_FILE, "r") as f:
-        log = json.load(f)
-
-    if not log:
-        print("No commits found.")
+    ensure_file_history()
+    log = file_history.log(filename)
+    if not len(log):
+        print(f"No history found for {filename}.")
         return
 
-    found_any = False
-
-    for entry in reversed(log):  # Newest first
-        commit_id = entry["id"]
-        commit_path = os.path.join(COMMITS_DIR, commit_id)
-        committed_file = os.path.join(commit_path, filename)
-
-        if os.path.exists(committed_file):
-            print(f"Commit: {commit_id}")
-            print(f"Date: {entry['timestamp']}")
-            print(f"Message: {entry['message']}\n")
-            found_any = True
-
-    if not found_any:
-        print(f"No history found for {filename}.")
+    # Newest first; with a limit only the last entries are read
+    entries = reversed(log.tail(limit)) if limit else log.iter_reverse()
+    for entry in entries:
+        print(f"Commit: {entry['id']}")
+        print(f"Date: {entry['timestamp']}")
+        print(f"Message: {entry['message']}\n")
 
 def get_current_branch():
     if os.path.exists(HEAD_FILE):
@@ -272,38 +406,33 @@ def get_current_branch():
 def branch(name):
     os.makedirs(BRANCHES_DIR, exist_ok=True)
     current = get_current_branch()
-    current_path = os.path.join(BRANCHES_DIR, f"{current}.json")
-    new_path = os.path.join(BRANCHES_DIR, f"{name}.json")
+    tip = read_branch(current)
 
-    if os.path.exists(new_path):
+    if os.path.exists(branch_file(name)):
         print(f"Branch {name} already exists.")
         return
 
-    if not os.path.exists(current_path):
+    if tip is None:
         print(f"Current branch {current} has no history.")
         return
 
-    shutil.copy2(current_path, new_path)
+    write_branch(name, tip)
     print(f"Created branch {name} from {current}")
 
-def checkout_branch(name):
-    branch_path = os.path.join(BRANCHES_DIR, f"{name}.json")
-    if not os.path.exists(branch_path):
+def checkout_branch(name, jobs=JOBS):
+    if not os.path.exists(branch_file(name)):
         print(f"Branch {name} does not exist.")
         return
 
     with open(HEAD_FILE, "w") as f:
         f.write(name)
 
-    with open(branch_path, "r") as f:
-        commits = json.load(f)
-
-    if not commits:
+    latest_commit = read_branch(name)
+    if latest_commit is None:
         print(f"Switched to branch {name} (no commits yet)")
         return
 
-    latest_commit = commits[-1]
-    checkout(latest_commit)
+    checkout(latest_commit, jobs)
     print(f"Switched to branch {name}")
 
 def current_branch():
@@ -314,28 +443,44 @@ def current_branch():
         print(f"Current branch: {f.read().strip()}")
 
 def rm(filename):
-    path = os.path.join(INDEX_DIR, os.path.basename(filename))
-    if os.path.exists(path):
-        os.remove(path)
+    index = read_index()
+    resolve_conflicts(MERGE_CONFLICTS_FILE, [index_path(filename)])
+    if index.pop(index_path(filename), None) is not None:
+        write_index(index)
         print(f"Removed {filename} from staging area.")
     else:
         print(f"{filename} is not staged.")
 
 def reset():
-    if os.path.exists(INDEX_DIR):
-        shutil.rmtree(INDEX_DIR)
-        os.makedirs(INDEX_DIR)
+    if os.path.exists(INDEX_FILE):
+        write_index({})
         print("Staging area reset.")
     else:
         print("Nothing to reset.")
 
-def commit_all(message):
-    workspace_files = os.listdir("workspace") if os.path.exists("workspace") else []
-    for fname in workspace_files:
-        add_file(os.path.join("workspace", fname))  # reuse add logic
+def commit_all(message, jobs=JOBS):
+    paths = tree.list_files(WORKSPACE_DIR) if os.path.exists(WORKSPACE_DIR) else []
+    stage_files([workspace_path(path) for path in paths], jobs)
 
     commit(message)
 
+def repack_hints():
+    """Map each object to the path it was committed at and how recently."""
+    commits = (read_commit(entry["id"]) for entry in commit_log.iter_reverse())
+    return tree.repack_hints(store, read_index(), (c and c["tree"] for c in commits))
+
+def gc():
+    if not os.path.exists(VCS_DIR):
+        print("No repository found.")
+        return
+
+    result = store.repack(repack_hints())
+    if not result["loose"] and not result["packs"]:
+        print(f"Nothing to pack ({result['objects']} objects already packed).")
+        return
+    print(f"Packed {result['objects']} objects, {result['deltas']} as deltas "
+          f"({result['loose']} loose, {result['packs']} packs folded).")
+
 def help():
     print("""
     Available commands:
@@ -343,146 +488,254 @@ def help():
     add <file>                Stage a file
     commit "<msg>"            Commit staged files
     commit -a "<msg>"         Auto-stage all workspace files and commit
+    --jobs N                  Worker threads for add, commit, checkout (default: CPU count)
     log                       Show commit history
+    log -n <N>                Show the N most recent commits
     status                    Show file states (modified, staged, etc.)
     diff <file>               Compare file to last commit
+    diff <commit1> <commit2>  Compare the files of two commits
+    diff --patience ...       Use patience diff instead of Myers
     restore <commit> <file>   Restore a file from a commit
     history <file>            Show commit history for a file
+    history <file> -n <N>     Show the N most recent commits of a file
     branch <name>             Create a new branch
     checkout-branch <name>    Switch to a branch and load its latest commit
     current-branch            Show active branch
     checkout <commit>         Restore workspace to a previous commit
     rm <file>                 Remove a file from the staging area
     reset                     Clear the staging area
+    gc                        Pack loose objects into a compressed pack file
+    merge <branch>            Three-way merge a branch into the current one
+    push <path> / pull <path> Sync branches with a repository at <path>
+    bundle create <file> <range>  Write <tip> or <base>..<tip> to a bundle file
+    bundle verify <file>      Check a bundle's checksum
+    bundle unbundle <file>    Import a bundle and fast-forward its branches
+    monitor start|stop|status Keep the workspace status in memory in a background monitor
+    monitor run               Run the monitor in the foreground
     help                      Show this help message
+
+    A <commit> may be abbreviated to any unique prefix of 4 or more characters.
     """)
 
 def workspace_has_changes():
-    workspace_files = set(os.listdir("workspace")) if os.path.exists("workspace") else set()
-    index_files = set(os.listdir(INDEX_DIR)) if os.path.exists(INDEX_DIR) else set()
+    """Check whether a tracked file (in HEAD or the index) differs in the workspace; untracked files do not count."""
+    cache = StatCache(STAT_CACHE_FILE)
+    try:
+        files = workspace_state(cache)
+    finally:
+        cache.save()
+
+    last_commit_id = head_commit()
+    head = read_commit(last_commit_id)["tree"] if last_commit_id else None
+    return any(tree.tracked_changes(store, head, files, read_index()))
+
+def compare_trees(tree1, tree2):
+    """Split the files that differ between two trees into added, removed and modified paths."""
+    added, removed, modified = {}, {}, {}
+    for path, old, new in tree.diff(store, tree1, tree2):
+        if old is None:
+            added[path] = new
+        elif new is None:
+            removed[path] = old
+        else:
+            modified[path] = (old, new)
+    return added, removed, modified
+
+def diff_objects(sha1, sha2, fromfile, tofile, algorithm=DIFF_ALGORITHM):
+    """Yield the diff between the files of two tree entries; None stands for a missing file."""
+    if sha1 == sha2:
+        return
+    sha1, sha2 = sha1 and tree.object_id(sha1), sha2 and tree.object_id(sha2)
+    size1 = store.size(sha1) if sha1 else 0
+    size2 = store.size(sha2) if sha2 else 0
+    if max(size1, size2) > MAX_DIFF_SIZE:
+        yield oversize_notice(fromfile, tofile, size1, size2)
+        return
+    old = store.read_bytes(sha1) if sha1 else b""
+    new = store.read_bytes(sha2) if sha2 else b""
+    yield from diff_bytes(old, new, fromfile, tofile, algorithm)
 
-    if not os.path.exists(LOG_FILE):
-        return bool(workspace_files)
-
-    with open(LOG_FILE, "r") as f:
-        log = json.load(f)
-        if not log:
-            return bool(workspace_files)
-
-    last_commit_id = log[-1]["id"]
-    commit_path = os.path.join(COMMITS_DIR, last_commit_id)
-    committed_files = set(os.listdir(commit_path)) if os.path.exists(commit_path) else set()
-
-    # check untracked or modified files
-    for fname in workspace_files:
-        if fname not in committed_files:
-            return True
-        with open(os.path.join("workspace", fname), "rb") as f1:
-            with open(os.path.join(commit_path, fname), "rb") as f2:
-                if f1.read() != f2.read():
-                    return True
-    return False
-
-def diff_commits(commit1, commit2):
-    path1 = os.path.join(COMMITS_DIR, commit1)
-    path2 = os.path.join(COMMITS_DIR, commit2)
-
-    if not os.path.exists(path1) or not os.path.exists(path2):
-        print("One or both commits not found.")
+def diff_commits(commit1, commit2, algorithm=DIFF_ALGORITHM):
+    try:
+        commit1, commit2 = resolve_commit(commit1), resolve_commit(commit2)
+    except ValueError as e:
+        print(e)
         return
+    c1 = read_commit(commit1)
+    c2 = read_commit(commit2)
 
-    files1 = set(os.listdir(path1))
-    files2 = set(os.listdir(path2))
-    common_files = files1 & files2
+    if c1 is None or c2 is None:
+        print("One or both commits not found.")
+        return
 
-    if not common_files:
-        print("No common files to compare.")
+    added, removed, modified = compare_trees(c1["tree"], c2["tree"])
+    if not (added or removed or modified):
+        print("No differences.")
         return
 
-    for fname in sorted(common_files):
-        with open(os.path.join(path1, fname), "r") as f1, open(os.path.join(path2, fname), "r") as f2:
-            lines1 = f1.readlines()
-            lines2 = f2.readlines()
-            diff = list(difflib.unified_diff(lines1, lines2, fromfile=f"{commit1}/{fname}", tofile=f"{commit2}/{fname}", lineterm=""))
-            if diff:
-                print("\n".join(diff))
+    for fname in added:
+        print(f"A  {fname}")
+    for fname in removed:
+        print(f"D  {fname}")
+    for fname in modified:
+        print(f"M  {fname}")
+
+    # Only modified files are read, and each one only when its turn comes
+    for fname, (sha1, sha2) in modified.items():
+        print()
+        for line in diff_objects(sha1, sha2, f"{commit1}/{fname}", f"{commit2}/{fname}", algorithm):
+            print(line)
 
 def log_branch(branch_name):
-    branch_file = os.path.join(BRANCHES_DIR, f"{branch_name}.json")
-    if not os.path.exists(branch_file):
+    if not os.path.exists(branch_file(branch_name)):
         print(f"Branch {branch_name} does not exist.")
         return
 
-    with open(branch_file) as f:
-        commits = json.load(f)
-
-    with open(LOG_FILE) as f:
-        log = json.load(f)
-
-    for cid in reversed(commits):
-        for entry in log:
-            if entry["id"] == cid:
-                print(f"Commit: {entry['id']}")
-                print(f"Date: {entry['timestamp']}")
-                print(f"Message: {entry['message']}\n")
+    for entry in iter_history(read_branch(branch_name)):
+        print(f"Commit: {entry['id']}")
+        print(f"Date: {entry['timestamp']}")
+        print(f"Message: {entry['message']}\n")
 
 def push(remote_path: str) -> dict:
+    """Send the branches, commits and objects the remote lacks."""
+    remote = Endpoint(os.path.join(remote_path, REMOTE_VCS_DIR), org_config)
     try:
-        shutil.copytree(VCS_DIR, os.path.join(remote_path, ".myvcs"), dirs_exist_ok=True)
-        return {"success": True}
+        return sync(Endpoint(VCS_DIR, org_config), remote)
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 def pull(remote_path: str) -> dict:
+    """Fetch the branches, commits and objects this repository lacks."""
+    remote = Endpoint(os.path.join(remote_path, REMOTE_VCS_DIR), org_config)
+    if not remote.exists():
+        return {"success": False, "error": "Remote repository not found."}
     try:
-        shutil.copytree(os.path.join(remote_path, ".myvcs"), VCS_DIR, dirs_exist_ok=True)
-        return {"success": True}
+        return sync(remote, Endpoint(VCS_DIR, org_config))
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+def bundle_create(path: str, spec: str) -> dict:
+    """Write the commits of ``<tip>`` or ``<base>..<tip>`` and their objects to a bundle file."""
+    try:
+        return bundle.create(Endpoint(VCS_DIR, org_config), path, spec)
+    except (ValueError, OSError) as e:
+        return {"success": False, "error": str(e)}
+
+def bundle_verify(path: str) -> dict:
+    try:
+        return bundle.verify(path)
+    except (ValueError, OSError) as e:
+        return {"success": False, "error": str(e)}
+
+def unbundle(path: str) -> dict:
+    """Import the commits of a bundle file and fast-forward the branches it carries."""
+    try:
+        return bundle.unbundle(Endpoint(VCS_DIR, org_config), path)
+    except (ValueError, OSError) as e:
+        return {"success": False, "error": str(e)}
+
+# How long `monitor start` waits for the new monitor to answer
+MONITOR_START_TIMEOUT = 5
+
+def monitor_start() -> dict:
+    """Start a background monitor that keeps the workspace's status in memory."""
+    if monitor.request(MONITOR_DIR, "ping") is not None:
+        return {"success": False, "error": "A monitor is already running."}
+    # The monitor runs as `python -m vcscore.monitor`, wherever the CLI was started from
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])))
+    subprocess.Popen([sys.executable, "-m", "vcscore.monitor", WORKSPACE_DIR, MONITOR_DIR,
+                      "--stat-cache", STAT_CACHE_FILE],
+                     env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                     stderr=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.monotonic() + MONITOR_START_TIMEOUT
+    while time.monotonic() < deadline:
+        reply = monitor.request(MONITOR_DIR, "ping")
+        if reply is not None:
+            return {"success": True, **reply}
+        time.sleep(0.05)
+    return {"success": False, "error": "The monitor did not start."}
+
+def monitor_stop() -> dict:
+    if monitor.request(MONITOR_DIR, "stop") is None:
+        return {"success": False, "error": "No monitor is running."}
+    return {"success": True}
+
+def monitor_status() -> dict:
+    reply = monitor.request(MONITOR_DIR, "ping")
+    if reply is None:
+        return {"success": True, "running": False}
+    return {"success": True, "running": True, **reply}
+
 def merge(branch_name: str) -> dict:
-    target_file = os.path.join(BRANCHES_DIR, f"{branch_name}.json")
-    if not os.path.exists(target_file):
+    """Three-way merge a branch into the current one, or fast-forward to it."""
+    if not os.path.exists(branch_file(branch_name)):
         return {"success": False, "error": "Branch not found"}
 
-    with open(target_file) as f:
-        target_commits = json.load(f)
-    if not target_commits:
+    target_commit = read_branch(branch_name)
+    if target_commit is None:
         return {"success": False, "error": "Target branch is empty"}
 
-    target_commit = target_commits[-1]
-    target_path = os.path.join(COMMITS_DIR, target_commit)
-
-    for fname in os.listdir(target_path):
-        shutil.copy2(os.path.join(target_path, fname), os.path.join(INDEX_DIR, fname))
+    if workspace_has_changes():
+        return {"success": False, "error": "Uncommitted changes exist"}
 
-    return {"success": True, "merged_from": branch_name}
+    branch = get_current_branch()
+    ours = head_commit()
+    base = graph().merge_base(ours, target_commit) if ours else None
+    if base == target_commit:
+        return {"success": True, "merged_from": branch_name, "up_to_date": True}
+    if ours is None or base == ours:
+        os.makedirs(WORKSPACE_DIR, exist_ok=True)
+        sync_workspace(read_commit(target_commit)["tree"])
+        write_branch(branch, target_commit)
+        return {"success": True, "merged_from": branch_name, "fast_forward": True, "commit": target_commit}
+
+    ours_tree = read_commit(ours)["tree"]
+    base_tree = read_commit(base)["tree"] if base else None
+    updates, conflicts = merge_trees(store, base_tree, ours_tree, read_commit(target_commit)["tree"],
+                                     labels=(branch, branch_name), algorithm=DIFF_ALGORITHM)
+
+    index = read_tree(ours_tree)
+    cache = StatCache(STAT_CACHE_FILE)
+    apply_merge(store, WORKSPACE_DIR, cache, index, updates, conflicts)
+    cache.save()
+    write_index(index)
+
+    # The next commit records the merged branch as its second parent.
+    with open(MERGE_HEAD_FILE, "w") as f:
+        f.write(target_commit)
+    if conflicts:
+        record_conflicts(MERGE_CONFLICTS_FILE, conflicts)
+
+    return {"success": True, "merged_from": branch_name, "base": base,
+            "updated": sorted(updates), "conflicts": sorted(conflicts)}
 
 def revert(commit_id: str) -> dict:
-    commit_path = os.path.join(COMMITS_DIR, commit_id)
-    if not os.path.exists(commit_path):
+    try:
+        commit_id = resolve_commit(commit_id)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+    files = commit_files(commit_id)
+    if files is None:
         return {"success": False, "error": "Commit not found"}
 
-    latest_commit = None
-    if os.path.exists(LOG_FILE):
-        with open(LOG_FILE) as f:
-            log = json.load(f)
-            if log and log[-1]["id"] == commit_id:
-                return {"success": False, "error": "Can't revert HEAD directly"}
-            for i in range(len(log)-1):
-                if log[i]["id"] == commit_id:
-                    latest_commit = log[i+1]["id"]
-                    break
+    if head_commit() == commit_id:
+        return {"success": False, "error": "Can't revert HEAD directly"}
+
+    # The commit that has commit_id as a parent, found on the commit graph
+    # without going below commit_id's generation
+    latest_commit = graph().child_of(commit_id, head_commit()) if head_commit() else None
 
     if latest_commit is None:
         return {"success": False, "error": "No child commit to revert against"}
 
     # Reverse diff: just replace files from parent (crude revert)
-    child_path = os.path.join(COMMITS_DIR, latest_commit)
-    for fname in os.listdir(commit_path):
-        old_file = os.path.join(child_path, fname)
-        if os.path.exists(old_file):
-            shutil.copy2(old_file, os.path.join(INDEX_DIR, fname))
+    child_files = commit_files(latest_commit)
+    index = read_index()
+    for fname in files:
+        if fname in child_files:
+            index[fname] = child_files[fname]
+    write_index(index)
 
     return commit(f"Revert commit {commit_id}")
 
@@ -497,11 +750,14 @@ def stash() -> dict:
     while os.path.exists(os.path.join(STASH_DIR, f"stash{i}")):
         i += 1
     stash_path = os.path.join(STASH_DIR, f"stash{i}")
-    os.makedirs(stash_path)
+    shutil.copytree("workspace", stash_path)
 
     for fname in os.listdir("workspace"):
-        shutil.copy2(os.path.join("workspace", fname), os.path.join(stash_path, fname))
-        os.remove(os.path.join("workspace", fname))
+        path = os.path.join("workspace", fname)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
 
     return {"success": True, "stash": f"stash{i}"}
 
@@ -516,20 +772,18 @@ def stash_pop() -> dict:
     latest = stashes[-1]
     stash_path = os.path.join(STASH_DIR, latest)
 
-    for fname in os.listdir(stash_path):
-        shutil.copy2(os.path.join(stash_path, fname), os.path.join("workspace", fname))
+    shutil.copytree(stash_path, "workspace", dirs_exist_ok=True)
 
     shutil.rmtree(stash_path)
     return {"success": True, "restored": latest}
 
 
-
-
-
-TAGS_FILE = os.path.join(VCS_DIR, "tags.json")
-
 def tag(name: str, commit_id: str) -> dict:
-    if not os.path.exists(os.path.join(COMMITS_DIR, commit_id)):
+    try:
+        commit_id = resolve_commit(commit_id)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+    if not commit_exists(commit_id):
         return {"success": False, "error": "Commit does not exist"}
 
     tags = {}
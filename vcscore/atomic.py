@@ -0,0 +1,48 @@
+import os
+import json
+import stat
+import secrets
+
+def temp_file(directory, suffix=""):
+    """Create a temp file in ``directory`` with the umask's permissions; return its descriptor and path."""
+    while True:
+        path = os.path.join(directory, f".tmp-{secrets.token_hex(8)}{suffix}")
+        try:
+            return os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666), path
+        except FileExistsError:
+            continue
+
+def temp_dir(directory):
+    """Create a temp directory in ``directory`` with default permissions; return its path."""
+    while True:
+        path = os.path.join(directory, f".tmp-{secrets.token_hex(8)}")
+        try:
+            os.mkdir(path, 0o777)
+            return path
+        except FileExistsError:
+            continue
+
+def remove_file(path):
+    """Delete a file, read-only ones included (Windows refuses to delete those)."""
+    if os.name == "nt":
+        os.chmod(path, stat.S_IWRITE)
+    os.remove(path)
+
+def atomic_write(path, text):
+    """Replace the file at ``path`` with ``text`` through a temp file and a rename."""
+    directory = os.path.dirname(path) or "."
+    fd, tmp = temp_file(directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def atomic_write_json(path, data, indent=2):
+    """Atomically replace ``path`` with ``data`` serialized as JSON."""
+    atomic_write(path, json.dumps(data, indent=indent))
@@ -0,0 +1,219 @@
+import os
+import mmap
+import heapq
+import struct
+import threading
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# The commit graph caches the shape of history in one binary file: a header,
+# then one fixed-width row per commit, in commit log order (row i is log
+# record i), so parents always come before their children:
+#   id          40 bytes, ASCII, NUL-padded
+#   parents     2 x 4 bytes: row numbers, NO_PARENT where there is none
+#   generation  4 bytes: 1 for a root commit, else 1 + its highest parent's
+#   timestamp   8 bytes: commit time in seconds, as a double
+# The file is memory-mapped and queried in place. Walks stop once they drop
+# below the generation of the commit they are looking for.
+MAGIC = b"VCSGRAPH"
+VERSION = 1
+HEADER = struct.Struct(">8sI")
+ROW = struct.Struct(">40sIIId")
+NO_PARENT = 0xFFFFFFFF
+
+def commit_time(commit):
+    return datetime.fromisoformat(commit["timestamp"]).timestamp()
+
+class CommitGraph:
+    def __init__(self, path):
+        self.path = path
+        self._map = None
+        self._signature = None
+        self._count = 0
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        """Map the file again if it changed since it was last mapped."""
+        try:
+            st = os.stat(self.path)
+            signature = (st.st_ino, st.st_size)
+        except FileNotFoundError:
+            signature = None
+        with self._lock:
+            if signature == self._signature:
+                return
+            count, rows, data = self._count, self._rows, None
+            if signature is None or self._signature is None or signature[0] != self._signature[0] \
+                    or signature[1] < self._signature[1]:
+                # New, replaced or truncated: index it from the start
+                count, rows = 0, {}
+            if signature is not None and signature[1] >= HEADER.size:
+                with open(self.path, "rb") as f:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if HEADER.unpack_from(data, 0) != (MAGIC, VERSION):
+                    data = None
+            if data is None:
+                count, rows = 0, {}
+            else:
+                rows = dict(rows)
+                for row in range(count, (len(data) - HEADER.size) // ROW.size):
+                    rows[self._id(data, row)] = row
+                count = (len(data) - HEADER.size) // ROW.size
+            # Queries running meanwhile keep using the old map and index
+            self._map, self._rows, self._count, self._signature = data, rows, count, signature
+
+    @staticmethod
+    def _id(data, row):
+        offset = HEADER.size + row * ROW.size
+        return data[offset:offset + 40].rstrip(b"\0").decode()
+
+    def __len__(self):
+        self._refresh()
+        return self._count
+
+    def update(self, log, get):
+        """Append a row for every record of commit log ``log`` that has none yet; ``get(id)`` returns a commit."""
+        self._refresh()
+        if self._count >= len(log):
+            return
+        with self._lock, open(self.path, "ab+") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            f.seek(0)
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size or HEADER.unpack(header) != (MAGIC, VERSION):
+                f.truncate(0)
+                f.write(HEADER.pack(MAGIC, VERSION))
+                count = 0
+            else:
+                # Another process may have appended meanwhile; a torn last row is dropped
+                count = (os.fstat(f.fileno()).st_size - HEADER.size) // ROW.size
+                f.truncate(HEADER.size + count * ROW.size)
+            known = dict(self._rows) if count == self._count else self._scan(f, count)
+            generations = {}
+            rows = []
+            for n, entry in enumerate(log.slice(count, len(log))):
+                commit = get(entry["id"])
+                parents = [known.get(p) for p in commit["parents"]]
+                if None in parents or len(parents) > 2:
+                    break
+                generation = 1 + max((generations.get(p) or self._generation_in(f, p) for p in parents),
+                                     default=0)
+                row = count + n
+                known[commit["id"]] = row
+                generations[row] = generation
+                parents += [NO_PARENT] * (2 - len(parents))
+                rows.append(ROW.pack(commit["id"].encode(), *parents, generation, commit_time(commit)))
+            f.seek(0, os.SEEK_END)
+            f.write(b"".join(rows))
+        self._refresh()
+
+    @staticmethod
+    def _scan(f, count):
+        f.seek(HEADER.size)
+        data = f.read(count * ROW.size)
+        return {data[i * ROW.size:i * ROW.size + 40].rstrip(b"\0").decode(): i for i in range(count)}
+
+    @staticmethod
+    def _generation_in(f, row):
+        f.seek(HEADER.size + row * ROW.size)
+        return ROW.unpack(f.read(ROW.size))[3]
+
+    def row(self, commit_id):
+        """Return the row of a commit, or None if the graph does not have it."""
+        self._refresh()
+        return self._rows.get(commit_id)
+
+    def _unpack(self, row):
+        return ROW.unpack_from(self._map, HEADER.size + row * ROW.size)
+
+    def _require(self, commit_id):
+        row = self.row(commit_id)
+        if row is None:
+            raise KeyError(commit_id)
+        return row
+
+    def commit_id(self, row):
+        return self._unpack(row)[0].rstrip(b"\0").decode()
+
+    def parents(self, row):
+        return [p for p in self._unpack(row)[1:3] if p != NO_PARENT]
+
+    def generation(self, row):
+        return self._unpack(row)[3]
+
+    def timestamp(self, row):
+        return self._unpack(row)[4]
+
+    def next_generation(self, parents):
+        """Return the generation number a new commit with these parents gets."""
+        return 1 + max((self.generation(self._require(p)) for p in parents), default=0)
+
+    def is_ancestor(self, ancestor, tip):
+        """Check whether commit ``ancestor`` is reachable from ``tip`` (a commit is its own ancestor)."""
+        target, start = self.row(ancestor), self.row(tip)
+        if target is None or start is None:
+            return False
+        floor = self.generation(target)
+        seen, stack = {start}, [start]
+        while stack:
+            row = stack.pop()
+            if row == target:
+                return True
+            for parent in self.parents(row):
+                if parent not in seen and self.generation(parent) >= floor:
+                    seen.add(parent)
+                    stack.append(parent)
+        return False
+
+    def merge_base(self, a, b):
+        """Return the best common ancestor of commits ``a`` and ``b``, or None if they share no history."""
+        a, b = self._require(a), self._require(b)
+        reached = {a: 1}
+        reached[b] = reached.get(b, 0) | 2
+        heap = [(-self.generation(row), row) for row in reached]
+        heapq.heapify(heap)
+        while heap:
+            _, row = heapq.heappop(heap)
+            sides = reached[row]
+            if sides == 3:
+                return self.commit_id(row)
+            for parent in self.parents(row):
+                if parent not in reached:
+                    reached[parent] = sides
+                    heapq.heappush(heap, (-self.generation(parent), parent))
+                else:
+                    reached[parent] |= sides
+        return None
+
+    def order(self, row):
+        """Return the sort key of a row in walk(): highest generation, then newest, then by ID."""
+        return -self.generation(row), -self.timestamp(row), self.commit_id(row), row
+
+    def walk(self, tip, floor=0, after=None):
+        """Yield the rows reachable from ``tip`` in order(), skipping up to ``after`` and below generation ``floor``."""
+        start = self._require(tip)
+        cursor = self.order(self._require(after)) if after is not None else None
+        heap, seen = [self.order(start)], {start}
+        while heap:
+            key = heapq.heappop(heap)
+            row = key[3]
+            if cursor is None or key > cursor:
+                yield row
+            for parent in self.parents(row):
+                if parent not in seen and self.generation(parent) >= floor:
+                    seen.add(parent)
+                    heapq.heappush(heap, self.order(parent))
+
+    def child_of(self, commit_id, tip):
+        """Return the newest commit reachable from ``tip`` that has ``commit_id`` as a parent, or None."""
+        target = self._require(commit_id)
+        for row in self.walk(tip, floor=self.generation(target) + 1):
+            if target in self.parents(row):
+                return self.commit_id(row)
+        return None
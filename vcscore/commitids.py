@@ -0,0 +1,115 @@
+import os
+import mmap
+import heapq
+import struct
+import hashlib
+from .atomic import temp_file
+
+# A commit ID is the SHA-1 of the commit's tree, parents, author, time and
+# message. IDs may be abbreviated to any unique prefix of at least MIN_PREFIX
+# hex digits, resolved through the commit ID index: a header with the number
+# of graph rows indexed, then the ID of every commit, sorted, as fixed-width rows
+#   id          40 bytes, ASCII, NUL-padded (commits made before full IDs
+#               have six-digit ones)
+MAGIC = b"VCSIDS\0\0"
+VERSION = 1
+HEADER = struct.Struct(">8sII")
+ROW = struct.Struct(">40s")
+MIN_PREFIX = 4
+HEX_DIGITS = set("0123456789abcdef")
+
+# Candidates listed when a prefix is ambiguous
+MAX_CANDIDATES = 10
+
+def commit_hash(tree_id, parents, author, timestamp, message):
+    """Return the ID of a commit with this content."""
+    lines = [f"tree {tree_id or ''}"]
+    lines += [f"parent {parent}" for parent in parents]
+    lines.append(f"author {author} {timestamp}")
+    content = "\n".join(lines) + "\n\n" + message
+    return hashlib.sha1(content.encode()).hexdigest()
+
+def is_prefix(name):
+    return bool(name) and len(name) <= ROW.size and set(name) <= HEX_DIGITS
+
+class CommitIds:
+    def __init__(self, path):
+        self.path = path
+
+    def _read(self):
+        """Return the mapped file and the number of graph rows it covers, or (None, 0)."""
+        try:
+            with open(self.path, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):  # missing or empty
+            return None, 0
+        if len(data) < HEADER.size:
+            return None, 0
+        magic, version, covered = HEADER.unpack_from(data, 0)
+        if (magic, version) != (MAGIC, VERSION) or len(data) != HEADER.size + covered * ROW.size:
+            return None, 0
+        return data, covered
+
+    @staticmethod
+    def _id(data, row):
+        offset = HEADER.size + row * ROW.size
+        return data[offset:offset + ROW.size]
+
+    def update(self, graph):
+        """Add the commits of ``graph`` that are not in the index yet."""
+        data, covered = self._read()
+        if covered == len(graph):
+            return
+        if covered > len(graph):  # the graph was rebuilt
+            data, covered = None, 0
+        new = sorted(graph.commit_id(row).encode().ljust(ROW.size, b"\0")
+                     for row in range(covered, len(graph)))
+        old = (self._id(data, row) for row in range(covered)) if data is not None else ()
+        fd, tmp = temp_file(os.path.dirname(os.path.abspath(self.path)))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(HEADER.pack(MAGIC, VERSION, len(graph)))
+                for commit_id in heapq.merge(old, new):
+                    f.write(commit_id)
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def matches(self, prefix, limit=MAX_CANDIDATES):
+        """Return up to ``limit`` indexed IDs that start with ``prefix``, in order."""
+        data, count = self._read()
+        if data is None:
+            return []
+        key = prefix.encode()
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._id(data, mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        found = []
+        while lo < count and len(found) < limit:
+            commit_id = self._id(data, lo)
+            if not commit_id.startswith(key):
+                break
+            found.append(commit_id.rstrip(b"\0").decode())
+            lo += 1
+        return found
+
+    def resolve(self, name):
+        """Return the ID of the one commit ``name`` abbreviates, or None; ValueError if ambiguous or too short."""
+        name = name.lower()
+        if not is_prefix(name):
+            return None
+        found = self.matches(name)
+        if name in found:
+            return name
+        if found and len(name) < MIN_PREFIX:
+            raise ValueError(f"Commit ID {name} is too short; use at least {MIN_PREFIX} characters.")
+        if len(found) > 1:
+            shown = ", ".join(found) + (", ..." if len(found) == MAX_CANDIDATES else "")
+            raise ValueError(f"Commit ID {name} is ambiguous: {shown}")
+        return found[0] if found else None
@@ -0,0 +1,130 @@
+import os
+import json
+import struct
+from itertools import islice
+
+# The log is two append-only files:
+#   <log>.jsonl  one JSON record per line
+#   <log>.idx    one 8-byte big-endian offset per record into the .jsonl file
+OFFSET = struct.Struct(">Q")
+
+# Records read per seek when streaming the whole log
+READ_BATCH = 1000
+
+def legacy_format(log_file, legacy_log_file, commits_dir, branches_dir):
+    """Return an error if the repository was written in the old copy-per-commit format, else None.
+
+    That format kept a JSON array log (``legacy_log_file``), a directory of
+    file copies per commit and a JSON list of commit IDs per branch.
+    """
+    marker = None
+    if os.path.exists(legacy_log_file):
+        marker = os.path.basename(legacy_log_file)
+    elif not os.path.exists(log_file):
+        # Only repositories without any log are scanned further
+        if os.path.isdir(branches_dir):
+            marker = next((f"{os.path.basename(branches_dir)}/{name}" for name in sorted(os.listdir(branches_dir))
+                           if name.endswith(".json")), None)
+        if marker is None and os.path.isdir(commits_dir):
+            with os.scandir(commits_dir) as entries:
+                marker = next((f"{os.path.basename(commits_dir)}/{entry.name}/" for entry in entries
+                               if entry.is_dir()), None)
+    if marker is None:
+        return None
+    vcs_dir = os.path.dirname(legacy_log_file)
+    return (f"{vcs_dir} is in the repository format of an older version ({marker} found), which is not "
+            f"supported. Move it aside, run init and commit the workspace again.")
+
+class CommitLog:
+    def __init__(self, path, index_path):
+        self.path = path
+        self.index_path = index_path
+
+    def create(self):
+        for path in (self.path, self.index_path):
+            if not os.path.exists(path):
+                open(path, "wb").close()
+
+    def __len__(self):
+        if not os.path.exists(self.index_path):
+            return 0
+        return os.path.getsize(self.index_path) // OFFSET.size
+
+    def append(self, entry):
+        # The record goes in before its offset: a crash in between leaves an
+        # unindexed line that readers never reach, never a dangling offset.
+        line = (json.dumps(entry, separators=(",", ":")) + "\n").encode()
+        with open(self.path, "ab") as f:
+            f.seek(0, os.SEEK_END)
+            offset = f.tell()
+            f.write(line)
+        with open(self.index_path, "ab") as f:
+            f.write(OFFSET.pack(offset))
+
+    def _offsets(self, start, stop):
+        with open(self.index_path, "rb") as f:
+            f.seek(start * OFFSET.size)
+            data = f.read((stop - start) * OFFSET.size)
+        return [OFFSET.unpack_from(data, i)[0] for i in range(0, len(data), OFFSET.size)]
+
+    def slice(self, start, stop):
+        """Return records ``start`` to ``stop`` (exclusive), oldest first."""
+        count = len(self)
+        start, stop = max(0, start), min(stop, count)
+        if start >= stop:
+            return []
+        records = []
+        with open(self.path, "rb") as f:
+            for offset in self._offsets(start, stop):
+                if f.tell() != offset:
+                    f.seek(offset)
+                records.append(json.loads(f.readline()))
+        return records
+
+    def records(self, rows):
+        """Return the records numbered ``rows``, in that order, opening each file once."""
+        with open(self.index_path, "rb") as f:
+            offsets = {}
+            for row in sorted(set(rows)):
+                f.seek(row * OFFSET.size)
+                offsets[row] = OFFSET.unpack(f.read(OFFSET.size))[0]
+        found = {}
+        with open(self.path, "rb") as f:
+            for row, offset in offsets.items():
+                f.seek(offset)
+                found[row] = json.loads(f.readline())
+        return [found[row] for row in rows]
+
+    def tail(self, n):
+        """Return the last ``n`` records, oldest first."""
+        count = len(self)
+        return self.slice(count - n, count)
+
+    def __iter__(self):
+        """Stream every record, oldest first."""
+        count = len(self)
+        for start in range(0, count, READ_BATCH):
+            yield from self.slice(start, start + READ_BATCH)
+
+    def iter_reverse(self):
+        """Stream every record, newest first."""
+        stop = len(self)
+        while stop > 0:
+            start = max(0, stop - READ_BATCH)
+            yield from reversed(self.slice(start, stop))
+            stop = start
+
+def walk_history(log, graph, tip, after=None, batch=READ_BATCH):
+    """Yield the records of the commits reachable from ``tip``, children before parents, past ``after``.
+
+    ``graph`` is the commit graph of ``log``; ValueError if ``after`` is not in it.
+    Records are read ``batch`` at a time.
+    """
+    if after is not None and graph.row(after) is None:
+        raise ValueError(f"Unknown commit: {after}")
+    rows = graph.walk(tip, after=after)
+    while True:
+        chunk = list(islice(rows, batch))
+        if not chunk:
+            return
+        yield from log.records(chunk)
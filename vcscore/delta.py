@@ -0,0 +1,127 @@
+# Delta encoding between two versions of an object.
+#
+# A delta is   varint(base size) | varint(target size) | ops...
+# where each op is either
+#   COPY    offset, length   -> append base[offset:offset + length]
+#   INSERT  length, bytes    -> append the literal bytes
+# Matching is line based: consecutive target lines found in the base become one copy.
+
+COPY = 0
+INSERT = 1
+
+# Delta bases tried per object, longest delta chain, largest object deltified
+DELTA_WINDOW = 10
+MAX_DELTA_DEPTH = 50
+DELTA_MAX_SIZE = 128 * 1024 * 1024
+
+def _write_varint(out, n):
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+def _read_varint(data, pos):
+    n = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return n, pos
+
+class DeltaIndex:
+    """Line index of a base object, built once and reused for every target."""
+
+    def __init__(self, data):
+        self.data = data
+        self.lines = data.splitlines(keepends=True)
+        self.offsets = []
+        self.first = {}
+        offset = 0
+        for i, line in enumerate(self.lines):
+            self.offsets.append(offset)
+            self.first.setdefault(line, i)
+            offset += len(line)
+
+def create_delta(index, target, max_size=None):
+    """Encode ``target`` against ``index``'s base, or return None if that takes over ``max_size`` bytes."""
+    out = bytearray()
+    _write_varint(out, len(index.data))
+    _write_varint(out, len(target))
+
+    lines, offsets, first = index.lines, index.offsets, index.first
+    copy_offset = copy_length = 0
+    next_line = -1
+    insert_start = pos = 0
+
+    def flush_copy():
+        out.append(COPY)
+        _write_varint(out, copy_offset)
+        _write_varint(out, copy_length)
+
+    def flush_insert(end):
+        if end > insert_start:
+            out.append(INSERT)
+            _write_varint(out, end - insert_start)
+            out.extend(target[insert_start:end])
+
+    for line in target.splitlines(keepends=True):
+        if copy_length and next_line < len(lines) and lines[next_line] == line:
+            copy_length += len(line)
+            next_line += 1
+        else:
+            j = first.get(line)
+            if j is None:
+                if copy_length:
+                    flush_copy()
+                    copy_length = 0
+                    insert_start = pos
+            else:
+                if copy_length:
+                    flush_copy()
+                else:
+                    flush_insert(pos)
+                copy_offset, copy_length, next_line = offsets[j], len(line), j + 1
+        pos += len(line)
+        if max_size is not None and len(out) > max_size:
+            return None
+
+    if copy_length:
+        flush_copy()
+    else:
+        flush_insert(pos)
+    if max_size is not None and len(out) > max_size:
+        return None
+    return bytes(out)
+
+def apply_delta(base, delta):
+    """Rebuild the target object from ``base`` and a delta made by ``create_delta``."""
+    base = memoryview(base)
+    base_size, pos = _read_varint(delta, 0)
+    size, pos = _read_varint(delta, pos)
+    if base_size != len(base):
+        raise ValueError("delta does not apply to this base")
+
+    out = bytearray()
+    while pos < len(delta):
+        op = delta[pos]
+        pos += 1
+        if op == COPY:
+            offset, pos = _read_varint(delta, pos)
+            length, pos = _read_varint(delta, pos)
+            out += base[offset:offset + length]
+        elif op == INSERT:
+            length, pos = _read_varint(delta, pos)
+            out += delta[pos:pos + length]
+            pos += length
+        else:
+            raise ValueError(f"unknown delta opcode {op}")
+
+    if len(out) != size:
+        raise ValueError("delta produced an object of the wrong size")
+    return bytes(out)
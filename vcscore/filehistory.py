@@ -0,0 +1,49 @@
+import os
+import shutil
+import hashlib
+from .commitlog import CommitLog
+from .atomic import temp_dir
+
+class FileHistory:
+    """Per-file commit logs under ``<root>``, keyed by the SHA-1 of the path."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def exists(self):
+        return os.path.isdir(self.root)
+
+    def _log(self, root, path):
+        key = hashlib.sha1(path.encode()).hexdigest()
+        base = os.path.join(root, key[:2], key)
+        return CommitLog(base + ".jsonl", base + ".idx")
+
+    def log(self, path):
+        """Return the ``CommitLog`` of the commits that included ``path``."""
+        return self._log(self.root, path)
+
+    def record(self, paths, entry):
+        """Add the log ``entry`` of a new commit to the history of each path."""
+        self._record(self.root, paths, entry)
+
+    def _record(self, root, paths, entry):
+        for path in paths:
+            log = self._log(root, path)
+            os.makedirs(os.path.dirname(log.path), exist_ok=True)
+            log.append(entry)
+
+    def rebuild(self, commits):
+        """Build the index from ``(entry, paths)`` pairs, oldest commit first."""
+        parent = os.path.dirname(self.root) or "."
+        tmp = temp_dir(parent)
+        try:
+            for entry, paths in commits:
+                self._record(tmp, paths, entry)
+            os.rename(tmp, self.root)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not self.exists():
+                raise
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
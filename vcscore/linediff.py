@@ -0,0 +1,323 @@
+# Line diff engine. Lines are interned to integers, the common prefix and
+# suffix are trimmed and lines found on one side only are marked changed; the
+# rest is compared with
+#   myers     Myers' linear-space O(ND) algorithm
+#   patience  anchored on lines unique to both sides, Myers between anchors
+# into difflib-style opcodes. Content with a NUL byte in its first
+# BINARY_SNIFF_SIZE bytes is binary and only reported as changed.
+from bisect import bisect_left
+
+MYERS = "myers"
+PATIENCE = "patience"
+ALGORITHMS = (MYERS, PATIENCE)
+
+# Edits searched per bisection are capped at DIFF_BUDGET / (lines in the
+# region), but never below MIN_COST; past the cap the split is not minimal.
+DIFF_BUDGET = 1024 * 1024
+MIN_COST = 8
+
+BINARY_SNIFF_SIZE = 8000
+
+def _intern(a, b):
+    ids = {}
+    return ([ids.setdefault(line, len(ids)) for line in a],
+            [ids.setdefault(line, len(ids)) for line in b])
+
+def _trim(a, b, alo, ahi, blo, bhi):
+    while alo < ahi and blo < bhi and a[alo] == b[blo]:
+        alo += 1
+        blo += 1
+    while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+        ahi -= 1
+        bhi -= 1
+    return alo, ahi, blo, bhi
+
+def _bisect(a, b, alo, ahi, blo, bhi):
+    """Return a point ``(x, y)`` to split the region at, or None to treat it as changed whole."""
+    n, m = ahi - alo, bhi - blo
+    max_cost = max(MIN_COST, DIFF_BUDGET // (n + m))
+    max_d = min((n + m + 1) // 2, max_cost + 1)
+    offset = max_d
+    size = 2 * max_d + 2
+    vf = [-1] * size
+    vb = [-1] * size
+    vf[offset + 1] = 0
+    vb[offset + 1] = 0
+    delta = n - m
+    front = delta % 2 != 0
+    # Diagonals that ran off the edge of the grid are not searched again
+    kf_start = kf_end = kb_start = kb_end = 0
+
+    for d in range(max_d):
+        for k in range(-d + kf_start, d + 1 - kf_end, 2):
+            i = offset + k
+            if k == -d or (k != d and vf[i - 1] < vf[i + 1]):
+                x = vf[i + 1]
+            else:
+                x = vf[i - 1] + 1
+            y = x - k
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x += 1
+                y += 1
+            vf[i] = x
+            if x > n:
+                kf_end += 2
+            elif y > m:
+                kf_start += 2
+            elif front:
+                j = offset + delta - k
+                if 0 <= j < size and vb[j] != -1 and x >= n - vb[j]:
+                    return alo + x, blo + y
+
+        for k in range(-d + kb_start, d + 1 - kb_end, 2):
+            i = offset + k
+            if k == -d or (k != d and vb[i - 1] < vb[i + 1]):
+                x = vb[i + 1]
+            else:
+                x = vb[i - 1] + 1
+            y = x - k
+            while x < n and y < m and a[ahi - 1 - x] == b[bhi - 1 - y]:
+                x += 1
+                y += 1
+            vb[i] = x
+            if x > n:
+                kb_end += 2
+            elif y > m:
+                kb_start += 2
+            elif not front:
+                j = offset + delta - k
+                if 0 <= j < size and vf[j] != -1 and vf[j] >= n - x:
+                    xf = vf[j]
+                    return alo + xf, blo + xf - (delta - k)
+
+        if d >= max_cost:
+            best = None
+            for k in range(-d + kf_start, d + 1 - kf_end, 2):
+                x = vf[offset + k]
+                y = x - k
+                if 0 <= x <= n and 0 <= y <= m and (x, y) != (n, m):
+                    if best is None or x + y > best[0] + best[1]:
+                        best = (x, y)
+            if best is not None and best != (0, 0):
+                return alo + best[0], blo + best[1]
+
+    return None
+
+def _myers(a, b, alo, ahi, blo, bhi, ca, cb):
+    stack = [(alo, ahi, blo, bhi)]
+    while stack:
+        alo, ahi, blo, bhi = _trim(a, b, *stack.pop())
+        if alo == ahi or blo == bhi:
+            ca[alo:ahi] = [True] * (ahi - alo)
+            cb[blo:bhi] = [True] * (bhi - blo)
+            continue
+        split = _bisect(a, b, alo, ahi, blo, bhi)
+        if split is None:
+            ca[alo:ahi] = [True] * (ahi - alo)
+            cb[blo:bhi] = [True] * (bhi - blo)
+            continue
+        x, y = split
+        stack.append((x, ahi, y, bhi))
+        stack.append((alo, x, blo, y))
+
+def _unique_anchors(a, b, alo, ahi, blo, bhi):
+    """Longest in-order sequence of ``(i, j)`` pairs of lines unique on both sides."""
+    counts = {}
+    for i in range(alo, ahi):
+        line = a[i]
+        if line in counts:
+            counts[line] = None
+        else:
+            counts[line] = i
+    matches = {}
+    for j in range(blo, bhi):
+        line = b[j]
+        if counts.get(line) is not None:
+            matches[line] = None if line in matches else j
+    pairs = sorted((counts[line], j) for line, j in matches.items() if j is not None)
+    if not pairs:
+        return []
+
+    # Patience sorting: the longest increasing run of b positions
+    tails = []
+    tail_index = []
+    back = [None] * len(pairs)
+    for n, (i, j) in enumerate(pairs):
+        pile = bisect_left(tails, j)
+        if pile == len(tails):
+            tails.append(j)
+            tail_index.append(n)
+        else:
+            tails[pile] = j
+            tail_index[pile] = n
+        back[n] = tail_index[pile - 1] if pile else None
+    anchors = []
+    n = tail_index[-1]
+    while n is not None:
+        anchors.append(pairs[n])
+        n = back[n]
+    anchors.reverse()
+    return anchors
+
+def _patience(a, b, alo, ahi, blo, bhi, ca, cb):
+    stack = [(alo, ahi, blo, bhi)]
+    while stack:
+        alo, ahi, blo, bhi = _trim(a, b, *stack.pop())
+        if alo == ahi or blo == bhi:
+            ca[alo:ahi] = [True] * (ahi - alo)
+            cb[blo:bhi] = [True] * (bhi - blo)
+            continue
+        anchors = _unique_anchors(a, b, alo, ahi, blo, bhi)
+        if not anchors:
+            _myers(a, b, alo, ahi, blo, bhi, ca, cb)
+            continue
+        i0, j0 = alo, blo
+        for i, j in anchors:
+            stack.append((i0, i, j0, j))
+            i0, j0 = i + 1, j + 1
+        stack.append((i0, ahi, j0, bhi))
+
+def _discard(a, b, alo, ahi, blo, bhi, ca, cb):
+    """Drop lines with no counterpart on the other side; return the rest and their positions."""
+    in_a = set(a[alo:ahi])
+    in_b = set(b[blo:bhi])
+    keep_a, keep_b = [], []
+    for i in range(alo, ahi):
+        if a[i] in in_b:
+            keep_a.append(i)
+        else:
+            ca[i] = True
+    for j in range(blo, bhi):
+        if b[j] in in_a:
+            keep_b.append(j)
+        else:
+            cb[j] = True
+    return keep_a, keep_b
+
+def _changes(a, b, algorithm):
+    """Return per-line changed flags for ``a`` and ``b``."""
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"unknown diff algorithm {algorithm!r}")
+    a, b = _intern(a, b)
+    ca = [False] * len(a)
+    cb = [False] * len(b)
+    alo, ahi, blo, bhi = _trim(a, b, 0, len(a), 0, len(b))
+    keep_a, keep_b = _discard(a, b, alo, ahi, blo, bhi, ca, cb)
+
+    sub_a = [a[i] for i in keep_a]
+    sub_b = [b[j] for j in keep_b]
+    sub_ca = [False] * len(sub_a)
+    sub_cb = [False] * len(sub_b)
+    compare = _patience if algorithm == PATIENCE else _myers
+    compare(sub_a, sub_b, 0, len(sub_a), 0, len(sub_b), sub_ca, sub_cb)
+    for i, changed in zip(keep_a, sub_ca):
+        ca[i] = changed
+    for j, changed in zip(keep_b, sub_cb):
+        cb[j] = changed
+    return ca, cb
+
+def diff_opcodes(a, b, algorithm=MYERS):
+    """Return difflib-style ``(tag, i1, i2, j1, j2)`` opcodes turning ``a`` into ``b``."""
+    ca, cb = _changes(a, b, algorithm)
+    n, m = len(ca), len(cb)
+    i = j = 0
+    opcodes = []
+    while i < n or j < m:
+        i0, j0 = i, j
+        if i < n and j < m and not ca[i] and not cb[j]:
+            while i < n and j < m and not ca[i] and not cb[j]:
+                i += 1
+                j += 1
+            opcodes.append(("equal", i0, i, j0, j))
+            continue
+        while i < n and ca[i]:
+            i += 1
+        while j < m and cb[j]:
+            j += 1
+        tag = "replace" if i > i0 and j > j0 else "delete" if i > i0 else "insert"
+        opcodes.append((tag, i0, i, j0, j))
+    return opcodes
+
+def iter_hunks(a, b, context=3, algorithm=MYERS):
+    """Yield the opcodes of each hunk, with up to ``context`` unchanged lines around it."""
+    codes = diff_opcodes(a, b, algorithm)
+    if not any(tag != "equal" for tag, *_ in codes):
+        return
+    if codes[0][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - context), i2, max(j1, j2 - context), j2
+    if codes[-1][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)
+
+    group = []
+    for tag, i1, i2, j1, j2 in codes:
+        # A long unchanged stretch ends one hunk and starts the next
+        if tag == "equal" and i2 - i1 > 2 * context:
+            group.append((tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - context), max(j1, j2 - context)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == "equal"):
+        yield group
+
+def _range(start, length):
+    if length == 1:
+        return f"{start + 1}"
+    if not length:
+        return f"{start},0"
+    return f"{start + 1},{length}"
+
+def _strip(line):
+    return line[:-1] if line.endswith("\n") else line
+
+def unified_diff(a, b, fromfile="", tofile="", context=3, algorithm=MYERS):
+    """Yield the lines of a unified diff between two lists of lines, without line endings."""
+    started = False
+    for group in iter_hunks(a, b, context, algorithm):
+        if not started:
+            yield f"--- {fromfile}"
+            yield f"+++ {tofile}"
+            started = True
+        first, last = group[0], group[-1]
+        old = _range(first[1], last[2] - first[1])
+        new = _range(first[3], last[4] - first[3])
+        yield f"@@ -{old} +{new} @@"
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                for line in a[i1:i2]:
+                    yield " " + _strip(line)
+                continue
+            for line in a[i1:i2]:
+                yield "-" + _strip(line)
+            for line in b[j1:j2]:
+                yield "+" + _strip(line)
+
+def is_binary(data):
+    return b"\0" in data[:BINARY_SNIFF_SIZE]
+
+def format_size(n):
+    for unit in ("B", "KiB", "MiB"):
+        if n < 1024:
+            return f"{n} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GiB"
+
+def binary_notice(fromfile, tofile, old_size, new_size):
+    return f"Binary files {fromfile} and {tofile} differ ({format_size(old_size)} → {format_size(new_size)})"
+
+def oversize_notice(fromfile, tofile, old_size, new_size):
+    return (f"Files {fromfile} and {tofile} differ, too large to diff "
+            f"({format_size(old_size)} → {format_size(new_size)})")
+
+def diff_bytes(old, new, fromfile="", tofile="", algorithm=MYERS):
+    """Yield a unified diff between two versions of a file's content."""
+    if old == new:
+        return
+    if is_binary(old) or is_binary(new):
+        yield binary_notice(fromfile, tofile, len(old), len(new))
+        return
+    yield from unified_diff(old.decode(errors="replace").splitlines(keepends=True),
+                            new.decode(errors="replace").splitlines(keepends=True),
+                            fromfile, tofile, algorithm=algorithm)
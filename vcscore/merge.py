@@ -0,0 +1,155 @@
+import os
+import json
+from . import tree
+from .atomic import atomic_write_json
+from .linediff import diff_opcodes, is_binary, MYERS
+
+# Three-way merge against the merge base from the commit graph: merge_trees()
+# skips subtrees and files by ID, merge_bytes() merges the files both sides
+# changed line by line (diff3).
+#
+# The paths a merge leaves conflicted are listed in a file next to MERGE_HEAD.
+# Each is resolved by staging it again (or removing it), and the merge cannot
+# be committed while any is left.
+
+MARKER_OURS = b"<<<<<<< "
+MARKER_SEP = b"=======\n"
+MARKER_THEIRS = b">>>>>>> "
+
+def _matches(a, b, algorithm):
+    """Map each line of ``a`` that the diff keeps to its line in ``b``."""
+    matches = {}
+    for tag, i1, i2, j1, _ in diff_opcodes(a, b, algorithm):
+        if tag == "equal":
+            for n in range(i2 - i1):
+                matches[i1 + n] = j1 + n
+    return matches
+
+def _terminated(lines):
+    if lines and not lines[-1].endswith(b"\n"):
+        return lines[:-1] + [lines[-1] + b"\n"]
+    return lines
+
+def merge_lines(base, ours, theirs, labels=("ours", "theirs"), algorithm=MYERS):
+    """Three-way merge of three lists of byte lines; return the merged lines and the number of conflicts."""
+    to_ours = _matches(base, ours, algorithm)
+    to_theirs = _matches(base, theirs, algorithm)
+    # Base lines both sides kept split the files into stable and changed regions
+    stable = [i for i in sorted(to_ours) if i in to_theirs]
+    merged, conflicts = [], 0
+    i = j = k = 0
+    s = 0
+    while i < len(base) or j < len(ours) or k < len(theirs):
+        while s < len(stable) and stable[s] < i:
+            s += 1
+        if s < len(stable):
+            i2 = stable[s]
+            j2, k2 = to_ours[i2], to_theirs[i2]
+        else:
+            i2, j2, k2 = len(base), len(ours), len(theirs)
+        if (i2, j2, k2) == (i, j, k):
+            merged.append(base[i])
+            i, j, k = i + 1, j + 1, k + 1
+            continue
+
+        b, o, t = base[i:i2], ours[j:j2], theirs[k:k2]
+        if o == b or o == t:
+            merged.extend(t)
+        elif t == b:
+            merged.extend(o)
+        else:
+            conflicts += 1
+            merged.append(MARKER_OURS + labels[0].encode() + b"\n")
+            merged.extend(_terminated(o))
+            merged.append(MARKER_SEP)
+            merged.extend(_terminated(t))
+            merged.append(MARKER_THEIRS + labels[1].encode() + b"\n")
+        i, j, k = i2, j2, k2
+    return merged, conflicts
+
+def merge_bytes(base, ours, theirs, labels=("ours", "theirs"), algorithm=MYERS):
+    """Three-way merge of file contents; return the merged bytes (None if binary) and whether they conflict."""
+    if is_binary(base) or is_binary(ours) or is_binary(theirs):
+        return None, True
+    merged, conflicts = merge_lines(base.splitlines(keepends=True), ours.splitlines(keepends=True),
+                                    theirs.splitlines(keepends=True), labels, algorithm)
+    return b"".join(merged), conflicts > 0
+
+def changed_files(store, base, ours, theirs, prefix=""):
+    """Yield ``(path, base entry, ours entry, theirs entry)`` for every file theirs changed differently from ours."""
+    if theirs == base or theirs == ours:
+        return
+    b, o, t = tree.entries(store, base), tree.entries(store, ours), tree.entries(store, theirs)
+    for name in sorted(b.keys() | o.keys() | t.keys()):
+        x, y, z = b.get(name), o.get(name), t.get(name)
+        if z == x or z == y:
+            continue
+        if name.endswith("/"):
+            yield from changed_files(store, x, y, z, prefix + name)
+        else:
+            yield prefix + name, x, y, z
+
+def merge_trees(store, base, ours, theirs, labels=("ours", "theirs"), algorithm=MYERS):
+    """Merge tree ``theirs`` into ``ours`` against ``base``; return ``(updates, conflicts)`` by path."""
+    updates, conflicts = {}, {}
+    for path, x, y, z in changed_files(store, base, ours, theirs):
+        if y == x:
+            updates[path] = z
+        elif y is None or z is None:
+            conflicts[path] = None
+        else:
+            read = lambda entry: store.read_bytes(tree.object_id(entry))
+            merged, conflicted = merge_bytes(read(x) if x else b"", read(y), read(z), labels, algorithm)
+            if conflicted:
+                conflicts[path] = merged
+                continue
+            # A mode change made by theirs wins, as a content change would
+            mode_from = z if x is not None and tree.is_executable(z) != tree.is_executable(x) else y
+            entry = tree.file_entry(store.write_bytes(merged), tree.is_executable(mode_from))
+            if entry != y:
+                updates[path] = entry
+    return updates, conflicts
+
+def apply_merge(store, workspace_dir, cache, index, updates, conflicts):
+    """Write the result of merge_trees() to the workspace, and the updates to ``index``.
+
+    Conflicted files get their merged text with markers, and stay as ours in ``index``.
+    """
+    for path, entry in updates.items():
+        dest = os.path.join(workspace_dir, *path.split("/"))
+        if entry is None:
+            index.pop(path, None)
+            if os.path.exists(dest):
+                os.remove(dest)
+                cache.forget(dest)
+                tree.prune_dirs(workspace_dir, path)
+            continue
+        index[path] = entry
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tree.checkout_file(store, entry, dest)
+        cache.record(dest, entry)
+    for path, content in conflicts.items():
+        if content is not None:
+            with open(os.path.join(workspace_dir, *path.split("/")), "wb") as f:
+                f.write(content)
+
+def record_conflicts(conflicts_file, paths):
+    """List the conflicted ``paths`` of a merge as unresolved."""
+    atomic_write_json(conflicts_file, sorted(paths))
+
+def read_conflicts(conflicts_file):
+    """Return the conflicted paths of the merge in progress that are not resolved yet."""
+    if not os.path.exists(conflicts_file):
+        return []
+    with open(conflicts_file, "r") as f:
+        return json.load(f)
+
+def resolve_conflicts(conflicts_file, paths):
+    """Mark ``paths`` resolved, as they have been staged again or removed."""
+    unresolved, paths = read_conflicts(conflicts_file), set(paths)
+    left = [path for path in unresolved if path not in paths]
+    if left != unresolved:
+        record_conflicts(conflicts_file, left)
+
+def conflicts_error(paths):
+    return f"Unresolved merge conflicts in {', '.join(paths)}; add each file once it is resolved."
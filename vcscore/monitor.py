@@ -0,0 +1,382 @@
+import os
+import sys
+import json
+import errno
+import select
+import socket
+import struct
+import argparse
+import threading
+import socketserver
+from .statcache import StatCache
+from .tree import list_files
+
+# A monitor is a process that keeps the tree entries of one workspace in
+# memory, rehashing only the paths its watcher reports. Clients ask it over a
+# Unix socket in its state directory, one JSON request and reply per
+# connection, and scan the workspace themselves when no monitor answers.
+
+try:
+    import ctypes
+    import ctypes.util
+    _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    _libc.inotify_init1
+except (ImportError, OSError, AttributeError):  # not Linux
+    _libc = None
+
+# inotify(7) event bits
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+EVENT = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+
+# How long a client waits for an answer, and a query for the watcher to
+# deliver the events that happened before it
+QUERY_TIMEOUT = 10
+SYNC_TIMEOUT = 5
+
+def socket_path(state_dir):
+    return os.path.join(state_dir, "sock")
+
+class InotifyWatcher:
+    """Report changes under ``root`` through inotify, one watch per directory."""
+
+    kind = "inotify"
+
+    def __init__(self, root, state_dir, mark):
+        if _libc is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.root = root
+        self.state_dir = state_dir
+        self.mark = mark
+        self.fd = _libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.paths = {}
+        self.wds = {}
+        # Directories that could not be watched (e.g. out of watches) are
+        # rescanned on every sync instead
+        self.unwatched = set()
+        self.cookies = {}
+        self.counter = 0
+        self._cookies_lock = threading.Lock()
+        self._wake_r, self._wake_w = os.pipe()
+        self.cookie_wd = self._add_watch(state_dir, IN_CREATE)
+        self._watch_tree("")
+
+    def _add_watch(self, path, mask):
+        wd = _libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"cannot watch {path}")
+        return wd
+
+    def _full(self, path):
+        return os.path.join(self.root, *path.split("/")) if path else self.root
+
+    def _watch_tree(self, path):
+        # The directory is watched before it is listed, so a subdirectory
+        # created in between shows up either in the listing or as an event
+        try:
+            wd = self._add_watch(self._full(path), WATCH_MASK)
+        except OSError:
+            self.unwatched.add(path)
+            return
+        self.unwatched.discard(path)
+        self.paths[wd] = path
+        self.wds[path] = wd
+        try:
+            children = [entry.name for entry in os.scandir(self._full(path))
+                        if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            return
+        for name in children:
+            self._watch_tree(f"{path}/{name}" if path else name)
+
+    def _unwatch_tree(self, path):
+        prefix = path + "/"
+        for known in [p for p in self.wds if p == path or p.startswith(prefix)]:
+            wd = self.wds.pop(known)
+            self.paths.pop(wd, None)
+            _libc.inotify_rm_watch(self.fd, wd)
+        self.unwatched = {p for p in self.unwatched if p != path and not p.startswith(prefix)}
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            ready, _, _ = select.select([self.fd, self._wake_r], [], [])
+            if self._wake_r in ready:
+                return
+            data = os.read(self.fd, READ_SIZE)
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, offset)
+                start = offset + EVENT.size
+                name = os.fsdecode(data[start:start + length].split(b"\0", 1)[0])
+                offset = start + length
+                self._handle(wd, mask, name)
+
+    def _handle(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            # Events were dropped: rescan everything and rewatch new directories
+            self._watch_tree("")
+            self.mark("")
+            return
+        if wd == self.cookie_wd:
+            with self._cookies_lock:
+                done = self.cookies.get(name)
+            if done is not None:
+                done.set()
+            return
+        if mask & IN_IGNORED:
+            self.paths.pop(wd, None)
+            return
+        directory = self.paths.get(wd)
+        if directory is None or not name:
+            return
+        path = f"{directory}/{name}" if directory else name
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                self._watch_tree(path)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self._unwatch_tree(path)
+            else:
+                return
+        self.mark(path)
+
+    def sync(self):
+        # Events arrive in order, so once the cookie's is seen every earlier change has been
+        with self._cookies_lock:
+            self.counter += 1
+            name = f"cookie-{self.counter}"
+            done = self.cookies[name] = threading.Event()
+        path = os.path.join(self.state_dir, name)
+        try:
+            open(path, "w").close()
+            if not done.wait(SYNC_TIMEOUT):
+                raise TimeoutError("The file watcher did not catch up.")
+        finally:
+            with self._cookies_lock:
+                del self.cookies[name]
+            if os.path.exists(path):
+                os.remove(path)
+        for path in list(self.unwatched):
+            self.mark(path)
+
+    def close(self):
+        os.write(self._wake_w, b"x")
+
+class PollingWatcher:
+    """Report changes under ``root`` by comparing stat() results on every sync."""
+
+    kind = "polling"
+
+    def __init__(self, root, state_dir, mark):
+        self.root = root
+        self.mark = mark
+        self.seen = {}
+
+    def _scan(self):
+        signatures = {}
+        if not os.path.isdir(self.root):
+            return signatures
+        for path in list_files(self.root):
+            try:
+                st = os.stat(os.path.join(self.root, *path.split("/")))
+            except FileNotFoundError:
+                continue
+            signatures[path] = (st.st_size, st.st_mtime_ns, st.st_ino, st.st_mode)
+        return signatures
+
+    def start(self):
+        self.seen = self._scan()
+
+    def sync(self):
+        current = self._scan()
+        for path in self.seen.keys() | current.keys():
+            if self.seen.get(path) != current.get(path):
+                self.mark(path)
+        self.seen = current
+
+    def close(self):
+        pass
+
+def make_watcher(root, state_dir, mark):
+    try:
+        return InotifyWatcher(root, state_dir, mark)
+    except OSError:
+        return PollingWatcher(root, state_dir, mark)
+
+class Monitor:
+    """The tree entries of every file under a workspace, kept current by a watcher."""
+
+    def __init__(self, workspace_dir, state_dir, stat_cache_file=None):
+        self.workspace_dir = workspace_dir
+        self.stat_cache_file = stat_cache_file
+        self.files = {}
+        self.dirty = set()
+        self.ready = threading.Event()
+        self._dirty_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._cache_signature = None
+        self.cache = None
+        self.watcher = make_watcher(workspace_dir, state_dir, self.mark)
+
+    def mark(self, path):
+        """Note that ``path`` (a file or a whole directory, "" for everything) may have changed."""
+        with self._dirty_lock:
+            self.dirty.add(path)
+
+    def start(self):
+        """Start watching, then hash the workspace in the background."""
+        self.watcher.start()
+        self.mark("")
+
+        def scan():
+            self.snapshot()
+            self.ready.set()
+
+        threading.Thread(target=scan, daemon=True).start()
+
+    def _load_cache(self):
+        signature = None
+        if self.stat_cache_file and os.path.exists(self.stat_cache_file):
+            st = os.stat(self.stat_cache_file)
+            signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if self.cache is None or signature != self._cache_signature:
+            self.cache = StatCache(self.stat_cache_file or "")
+            self._cache_signature = signature
+
+    def _full(self, path):
+        return os.path.join(self.workspace_dir, *path.split("/")) if path else self.workspace_dir
+
+    def _hash(self, path):
+        try:
+            self.files[path] = self.cache.entry(self._full(path))
+        except (FileNotFoundError, NotADirectoryError):
+            self.files.pop(path, None)
+
+    def _refresh(self, path):
+        full = self._full(path)
+        if path and os.path.isfile(full):
+            self._hash(path)
+            return
+        # Gone, or a directory: forget what was under it and take what is there now
+        prefix = path + "/" if path else ""
+        for known in [p for p in self.files if p == path or p.startswith(prefix)]:
+            del self.files[known]
+        if os.path.isdir(full):
+            for name in list_files(full):
+                self._hash(prefix + name)
+
+    def snapshot(self):
+        """Return ``{path: tree entry}`` for every workspace file as of now."""
+        with self._lock:
+            self.watcher.sync()
+            with self._dirty_lock:
+                dirty, self.dirty = self.dirty, set()
+            self._load_cache()
+            # A directory is refreshed before the paths under it
+            for path in sorted(dirty):
+                self._refresh(path)
+            return dict(self.files)
+
+    def close(self):
+        self.watcher.close()
+
+class MonitorServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class MonitorHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        monitor = self.server.monitor
+        op = json.loads(self.rfile.readline() or "{}").get("op")
+        if op == "ping":
+            reply = {"ready": monitor.ready.is_set(), "watcher": monitor.watcher.kind,
+                     "workspace": monitor.workspace_dir, "files": len(monitor.files)}
+        elif op == "status" and not monitor.ready.is_set():
+            reply = {"ready": False}
+        elif op == "status":
+            try:
+                reply = {"ready": True, "files": monitor.snapshot()}
+            except (OSError, TimeoutError) as e:
+                reply = {"error": str(e)}
+        elif op == "stop":
+            reply = {"stopped": True}
+            threading.Thread(target=self.server.shutdown).start()
+        else:
+            reply = {"error": f"Unknown request: {op}"}
+        self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+def request(state_dir, op, timeout=QUERY_TIMEOUT):
+    """Send ``op`` to the monitor of ``state_dir`` and return its reply, or None if none answers."""
+    path = socket_path(state_dir)
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(timeout)
+            s.connect(path)
+            s.sendall(json.dumps({"op": op}).encode() + b"\n")
+            with s.makefile("rb") as f:
+                line = f.readline()
+    except OSError:
+        return None
+    return json.loads(line) if line else None
+
+def query(state_dir, timeout=QUERY_TIMEOUT):
+    """Return the workspace's ``{path: tree entry}`` from its monitor, or None to scan it yourself."""
+    reply = request(state_dir, "status", timeout)
+    if reply is None or not reply.get("ready"):
+        return None
+    return reply["files"]
+
+def serve(workspace_dir, state_dir, stat_cache_file=None):
+    """Watch ``workspace_dir`` and answer queries on the socket in ``state_dir`` until stopped."""
+    if not hasattr(socket, "AF_UNIX"):
+        raise OSError(errno.ENOTSUP, "The monitor needs Unix domain sockets.")
+    os.makedirs(state_dir, exist_ok=True)
+    if request(state_dir, "ping") is not None:
+        raise RuntimeError(f"A monitor is already running for {workspace_dir}.")
+    path = socket_path(state_dir)
+    if os.path.exists(path):
+        # Left behind by a monitor that was killed
+        os.remove(path)
+
+    monitor = Monitor(workspace_dir, state_dir, stat_cache_file)
+    server = MonitorServer(path, MonitorHandler)
+    server.monitor = monitor
+    try:
+        monitor.start()
+        server.serve_forever()
+    finally:
+        server.server_close()
+        monitor.close()
+        if os.path.exists(path):
+            os.remove(path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Watch a workspace and answer status queries over a local socket.")
+    parser.add_argument("workspace", help="workspace directory to watch")
+    parser.add_argument("state_dir", help="directory for the socket, e.g. .myvcs/monitor")
+    parser.add_argument("--stat-cache", help="the repository's stat cache file")
+    args = parser.parse_args(argv)
+    try:
+        serve(args.workspace, args.state_dir, args.stat_cache)
+    except (OSError, RuntimeError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
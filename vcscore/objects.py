@@ -0,0 +1,248 @@
+import os
+import shutil
+import hashlib
+import threading
+from collections import deque
+from .pack import Pack, PackWriter, CHUNK_SIZE, READ_ONLY
+from .atomic import temp_file, remove_file
+from .delta import DeltaIndex, create_delta, DELTA_WINDOW, MAX_DELTA_DEPTH, DELTA_MAX_SIZE
+
+HASH_BUFFER_SIZE = 1024 * 1024
+
+def hash_file(path):
+    """Return the SHA-1 of a file, reading it in fixed-size chunks."""
+    sha = hashlib.sha1()
+    buf = bytearray(HASH_BUFFER_SIZE)
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            sha.update(view[:n])
+    return sha.hexdigest()
+
+def hash_bytes(data):
+    return hashlib.sha1(data).hexdigest()
+
+class ObjectStore:
+    """Content-addressed blob storage: loose objects under ``<root>``, packs under ``<root>/pack``."""
+
+    def __init__(self, root):
+        self.root = root
+        self.pack_dir = os.path.join(root, "pack")
+        self._packs = None
+        self._lock = threading.Lock()
+
+    def path(self, sha):
+        return os.path.join(self.root, sha[:2], sha[2:])
+
+    def packs(self):
+        with self._lock:
+            if self._packs is None:
+                names = os.listdir(self.pack_dir) if os.path.exists(self.pack_dir) else []
+                self._packs = [Pack(os.path.join(self.pack_dir, name))
+                               for name in sorted(names)
+                               if name.endswith(".idx") and not name.startswith(".tmp-")]
+            return self._packs
+
+    def close(self):
+        for pack in self._packs or []:
+            pack.close()
+        self._packs = None
+
+    def _find_pack(self, sha, reload=True):
+        for pack in self.packs():
+            if sha in pack:
+                return pack
+        if reload:
+            # Another process may have repacked since the packs were opened.
+            # Other threads may still be reading the old packs, so drop them
+            # rather than closing them.
+            self._packs = None
+            return self._find_pack(sha, reload=False)
+        return None
+
+    def exists(self, sha):
+        return os.path.exists(self.path(sha)) or any(sha in pack for pack in self.packs())
+
+    def write_file(self, src, sha=None):
+        """Store the content of ``src`` and return its object ID, ``sha`` if already known."""
+        if sha is None:
+            sha = hash_file(src)
+        if not self.exists(sha):
+            self._install(sha, lambda tmp: shutil.copyfile(src, tmp))
+        return sha
+
+    def write_bytes(self, data):
+        """Store ``data`` and return its object ID."""
+        sha = hash_bytes(data)
+        if not self.exists(sha):
+            def write(tmp):
+                with open(tmp, "wb") as f:
+                    f.write(data)
+            self._install(sha, write)
+        return sha
+
+    def write_chunks(self, sha, chunks):
+        """Store object ``sha`` from ``chunks`` without holding it whole; ValueError if they hash to another ID."""
+        digest = hashlib.sha1()
+
+        def write(tmp):
+            with open(tmp, "wb") as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    f.write(chunk)
+            if digest.hexdigest() != sha:
+                raise ValueError(f"Object {sha} is corrupt.")
+
+        if self.exists(sha):
+            # Still read through, to check it and to move past it in the stream
+            write(os.devnull)
+        else:
+            self._install(sha, write)
+        return sha
+
+    def size(self, sha):
+        """Return the size of object ``sha`` without reading it."""
+        try:
+            return os.path.getsize(self.path(sha))
+        except FileNotFoundError:
+            pack = self._find_pack(sha)
+            if pack is None:
+                raise KeyError(sha)
+            return pack.size(sha)
+
+    def read_bytes(self, sha):
+        try:
+            with open(self.path(sha), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            pack = self._find_pack(sha)
+            if pack is None:
+                raise KeyError(sha)
+            return pack.read(sha)
+
+    def iter_chunks(self, sha):
+        """Yield the content of object ``sha`` in chunks of at most CHUNK_SIZE bytes."""
+        try:
+            f = open(self.path(sha), "rb")
+        except FileNotFoundError:
+            pack = self._find_pack(sha)
+            if pack is None:
+                raise KeyError(sha)
+            yield from pack.iter_chunks(sha)
+            return
+        with f:
+            yield from iter(lambda: f.read(CHUNK_SIZE), b"")
+
+    def copy_to(self, sha, dest):
+        """Materialize object ``sha`` at ``dest``."""
+        try:
+            shutil.copyfile(self.path(sha), dest)
+        except FileNotFoundError:
+            pack = self._find_pack(sha)
+            if pack is None:
+                raise KeyError(sha)
+            pack.copy_to(sha, dest)
+
+    def copy_from(self, other, sha):
+        """Store object ``sha`` from another ObjectStore, unless it is already here."""
+        if not self.exists(sha):
+            self._install(sha, lambda tmp: other.copy_to(sha, tmp))
+
+    def iter_loose(self):
+        """Yield ``(sha, path)`` for every loose object."""
+        if not os.path.exists(self.root):
+            return
+        for prefix in sorted(os.listdir(self.root)):
+            subdir = os.path.join(self.root, prefix)
+            if len(prefix) != 2 or not os.path.isdir(subdir):
+                continue
+            for rest in sorted(os.listdir(subdir)):
+                if not rest.startswith(".tmp-"):
+                    yield prefix + rest, os.path.join(subdir, rest)
+
+    def repack(self, hints=None):
+        """Fold all loose objects and existing packs into one new pack, delta-compressed by ``hints``."""
+        hints = hints or {}
+        loose = dict(self.iter_loose())
+        old_packs = self.packs()
+        if not loose and len(old_packs) <= 1:
+            return {"objects": sum(pack.count for pack in old_packs), "deltas": 0, "loose": 0, "packs": 0}
+
+        sizes = {sha: os.path.getsize(path) for sha, path in loose.items()}
+        packed = {}
+        for pack in old_packs:
+            for sha in pack.names():
+                if sha not in sizes:
+                    sizes[sha] = pack.size(sha)
+                    packed[sha] = pack
+        unknown = (chr(0x10FFFF), 0)
+        order = sorted(sizes, key=lambda sha: (hints.get(sha, unknown), -sizes[sha]))
+
+        window = deque(maxlen=DELTA_WINDOW)
+        depths = {}
+        writer = PackWriter(self.pack_dir)
+        try:
+            for sha in order:
+                size = sizes[sha]
+                if size > DELTA_MAX_SIZE:
+                    if sha in loose:
+                        writer.add_file(sha, loose[sha])
+                    else:
+                        writer.add_raw(sha, *packed[sha].raw(sha))
+                    continue
+
+                data = self.read_bytes(sha)
+                best_base, best_delta = None, None
+                for base, index in window:
+                    if depths[base] >= MAX_DELTA_DEPTH:
+                        continue
+                    limit = len(best_delta) - 1 if best_delta is not None else size // 2
+                    delta = create_delta(index, data, max_size=limit)
+                    if delta is not None:
+                        best_base, best_delta = base, delta
+
+                if best_delta is not None:
+                    writer.add_delta(sha, best_base, size, best_delta)
+                    depths[sha] = depths[best_base] + 1
+                else:
+                    writer.add_bytes(sha, data)
+                    depths[sha] = 0
+                window.append((sha, DeltaIndex(data)))
+            idx_path = writer.finish()
+        except BaseException:
+            writer.abort()
+            raise
+
+        old_paths = [(pack.idx_path, pack.pack_path) for pack in old_packs]
+        self.close()
+        for idx, pack_file in old_paths:
+            if idx != idx_path:
+                remove_file(idx)
+                remove_file(pack_file)
+        for path in loose.values():
+            remove_file(path)
+        for prefix in os.listdir(self.root):
+            subdir = os.path.join(self.root, prefix)
+            if len(prefix) == 2 and os.path.isdir(subdir) and not os.listdir(subdir):
+                os.rmdir(subdir)
+
+        deltas = sum(1 for depth in depths.values() if depth)
+        return {"objects": len(writer), "deltas": deltas, "loose": len(loose), "packs": len(old_paths)}
+
+    def _install(self, sha, write):
+        # Written next to the final path and renamed, so readers never see a partial object
+        final = self.path(sha)
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        fd, tmp = temp_file(os.path.dirname(final))
+        os.close(fd)
+        try:
+            write(tmp)
+            os.chmod(tmp, READ_ONLY)
+            os.replace(tmp, final)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
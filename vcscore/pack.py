@@ -0,0 +1,227 @@
+import os
+import mmap
+import zlib
+import struct
+import hashlib
+from .delta import apply_delta
+from .atomic import temp_file
+
+# Pack layout:
+#   header   "VPAK" | version | object count
+#   entries  kind | uncompressed size | compressed length | [base ID] | zlib data
+#
+# Full entries hold the object itself; delta entries carry the 20-byte ID of
+# their base object (always stored in the same pack) followed by a compressed
+# delta against it.
+#
+# Index layout (sorted by object ID so lookups are a binary search):
+#   header   "VIDX" | version | object count
+#   fanout   256 cumulative counts keyed by the first byte of the ID
+#   names    count * 20-byte object IDs, ascending
+#   offsets  count * 8-byte entry offsets into the pack, same order as names
+PACK_SIGNATURE = b"VPAK"
+INDEX_SIGNATURE = b"VIDX"
+VERSION = 1
+
+OBJ_FULL = 1
+OBJ_DELTA = 2
+
+HEADER = struct.Struct(">4sII")
+ENTRY = struct.Struct(">BQQ")
+OFFSET = struct.Struct(">Q")
+FANOUT = struct.Struct(">256I")
+
+CHUNK_SIZE = 1024 * 1024
+
+# Objects, packs and indexes are never modified once written
+READ_ONLY = 0o444
+
+class Pack:
+    """Read access to a pack file through its memory-mapped index."""
+
+    def __init__(self, idx_path):
+        self.idx_path = idx_path
+        self.pack_path = idx_path[:-len(".idx")] + ".pack"
+        with open(idx_path, "rb") as f:
+            self._idx = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(self.pack_path, "rb") as f:
+            self._pack = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        signature, version, self.count = HEADER.unpack_from(self._idx, 0)
+        if signature != INDEX_SIGNATURE or version != VERSION:
+            raise ValueError(f"{idx_path} is not a pack index")
+        self._fanout = FANOUT.unpack_from(self._idx, HEADER.size)
+        self._names_at = HEADER.size + FANOUT.size
+        self._offsets_at = self._names_at + 20 * self.count
+
+    def _name(self, i):
+        start = self._names_at + 20 * i
+        return self._idx[start:start + 20]
+
+    def _offset(self, i):
+        return OFFSET.unpack_from(self._idx, self._offsets_at + OFFSET.size * i)[0]
+
+    def find(self, sha):
+        """Return the pack offset of ``sha``, or None if it is not in this pack."""
+        key = bytes.fromhex(sha)
+        lo = self._fanout[key[0] - 1] if key[0] else 0
+        hi = self._fanout[key[0]]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            name = self._name(mid)
+            if name < key:
+                lo = mid + 1
+            elif name > key:
+                hi = mid
+            else:
+                return self._offset(mid)
+        return None
+
+    def __contains__(self, sha):
+        return self.find(sha) is not None
+
+    def names(self):
+        for i in range(self.count):
+            yield self._name(i).hex()
+
+    def entry(self, offset):
+        """Return ``(kind, size, base, data_start, data_end)`` for the entry at ``offset``."""
+        kind, size, length = ENTRY.unpack_from(self._pack, offset)
+        start = offset + ENTRY.size
+        base = None
+        if kind == OBJ_DELTA:
+            base = self._pack[start:start + 20].hex()
+            start += 20
+        return kind, size, base, start, start + length
+
+    def size(self, sha):
+        return self.entry(self.find(sha))[1]
+
+    def raw(self, sha):
+        """Return ``(kind, size, data, base)`` for ``sha`` without decompressing it."""
+        kind, size, base, start, end = self.entry(self.find(sha))
+        return kind, size, self._pack[start:end], base
+
+    def read(self, sha):
+        # Walk down to the full object at the bottom of the delta chain, then
+        # apply the deltas back up.
+        chain = []
+        kind, size, base, start, end = self.entry(self.find(sha))
+        while kind == OBJ_DELTA:
+            chain.append(zlib.decompress(self._pack[start:end]))
+            kind, size, base, start, end = self.entry(self.find(base))
+        data = zlib.decompress(self._pack[start:end])
+        for delta in reversed(chain):
+            data = apply_delta(data, delta)
+        return data
+
+    def iter_chunks(self, sha):
+        """Yield the content of ``sha`` piece by piece; deltas are rebuilt whole first."""
+        kind, size, base, start, end = self.entry(self.find(sha))
+        if kind == OBJ_DELTA:
+            yield self.read(sha)
+            return
+        inflater = zlib.decompressobj()
+        for pos in range(start, end, CHUNK_SIZE):
+            yield inflater.decompress(self._pack[pos:min(pos + CHUNK_SIZE, end)])
+        yield inflater.flush()
+
+    def copy_to(self, sha, dest):
+        with open(dest, "wb") as f:
+            for chunk in self.iter_chunks(sha):
+                f.write(chunk)
+
+    def close(self):
+        self._idx.close()
+        self._pack.close()
+
+class PackWriter:
+    """Build a new pack and its index in ``pack_dir``."""
+
+    def __init__(self, pack_dir):
+        self.pack_dir = pack_dir
+        os.makedirs(pack_dir, exist_ok=True)
+        fd, self._tmp = temp_file(pack_dir, ".pack")
+        self._f = os.fdopen(fd, "w+b")
+        self._f.write(HEADER.pack(PACK_SIGNATURE, VERSION, 0))
+        self._offsets = {}
+
+    def __contains__(self, sha):
+        return sha in self._offsets
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def add_file(self, sha, path):
+        """Compress the file at ``path`` into the pack as object ``sha``."""
+        offset = self._f.tell()
+        self._f.write(ENTRY.pack(OBJ_FULL, 0, 0))
+        deflater = zlib.compressobj()
+        size = length = 0
+        with open(path, "rb") as src:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                size += len(chunk)
+                data = deflater.compress(chunk)
+                length += len(data)
+                self._f.write(data)
+        data = deflater.flush()
+        length += len(data)
+        self._f.write(data)
+        end = self._f.tell()
+        self._f.seek(offset)
+        self._f.write(ENTRY.pack(OBJ_FULL, size, length))
+        self._f.seek(end)
+        self._offsets[sha] = offset
+
+    def add_bytes(self, sha, data):
+        """Compress ``data`` into the pack as object ``sha``."""
+        self.add_raw(sha, OBJ_FULL, len(data), zlib.compress(data))
+
+    def add_delta(self, sha, base, size, delta):
+        """Store object ``sha`` of ``size`` bytes as a delta against ``base``."""
+        self.add_raw(sha, OBJ_DELTA, size, zlib.compress(delta), base)
+
+    def add_raw(self, sha, kind, size, data, base=None):
+        """Write an already compressed entry, e.g. one copied from another pack."""
+        self._offsets[sha] = self._f.tell()
+        self._f.write(ENTRY.pack(kind, size, len(data)))
+        if kind == OBJ_DELTA:
+            self._f.write(bytes.fromhex(base))
+        self._f.write(data)
+
+    def finish(self):
+        """Write the index and move the pack into place; return the index path."""
+        names = sorted(self._offsets)
+        self._f.seek(0)
+        self._f.write(HEADER.pack(PACK_SIGNATURE, VERSION, len(names)))
+        self._f.close()
+
+        pack_name = "pack-" + hashlib.sha1("".join(names).encode()).hexdigest()
+        pack_path = os.path.join(self.pack_dir, pack_name + ".pack")
+        idx_path = os.path.join(self.pack_dir, pack_name + ".idx")
+
+        fanout = [0] * 256
+        for name in names:
+            fanout[int(name[:2], 16)] += 1
+        for i in range(1, 256):
+            fanout[i] += fanout[i - 1]
+
+        fd, idx_tmp = temp_file(self.pack_dir, ".idx")
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(INDEX_SIGNATURE, VERSION, len(names)))
+            f.write(FANOUT.pack(*fanout))
+            for name in names:
+                f.write(bytes.fromhex(name))
+            for name in names:
+                f.write(OFFSET.pack(self._offsets[name]))
+
+        os.chmod(self._tmp, READ_ONLY)
+        os.chmod(idx_tmp, READ_ONLY)
+        os.replace(self._tmp, pack_path)
+        os.replace(idx_tmp, idx_path)
+        return idx_path
+
+    def abort(self):
+        self._f.close()
+        if os.path.exists(self._tmp):
+            os.remove(self._tmp)
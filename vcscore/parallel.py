@@ -0,0 +1,13 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+def run_parallel(fn, items, jobs):
+    """Apply ``fn`` to every item on up to ``jobs`` threads, preserving order."""
+    items = list(items)
+    if jobs <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(jobs, len(items))) as pool:
+        # Each call runs in a copy of the caller's context, so context
+        # variables such as the current repository carry over
+        futures = [pool.submit(contextvars.copy_context().run, fn, item) for item in items]
+        return [future.result() for future in futures]
@@ -0,0 +1,67 @@
+import os
+import json
+import stat
+from .objects import hash_file
+from .atomic import atomic_write_json
+from .tree import file_entry, object_id
+
+class StatCache:
+    """Persistent map of file path -> (size, mtime_ns, inode, content hash)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.written_ns = 0
+        self.dirty = False
+        self._fresh = set()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.entries = json.load(f)
+            self.written_ns = os.stat(path).st_mtime_ns
+
+    def _signature(self, st):
+        return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+    def hash(self, path):
+        """Return the content hash of ``path``, reading it only if it changed."""
+        return self._hash(path, os.stat(path))
+
+    def entry(self, path):
+        """Return the tree entry of ``path``: its content hash, and its mode if it is executable."""
+        st = os.stat(path)
+        # Windows has no executable bit; stat() derives one from the extension
+        return file_entry(self._hash(path, st), os.name != "nt" and bool(st.st_mode & stat.S_IXUSR))
+
+    def _hash(self, path, st):
+        key = os.path.normpath(path)
+        signature = self._signature(st)
+        entry = self.entries.get(key)
+        if entry is not None and entry[:3] == signature:
+            # A file modified in the same mtime tick as the cache was saved may look unchanged
+            if key in self._fresh or st.st_mtime_ns < self.written_ns:
+                return entry[3]
+
+        sha = hash_file(path)
+        self.entries[key] = signature + [sha]
+        self._fresh.add(key)
+        self.dirty = True
+        return sha
+
+    def record(self, path, entry):
+        """Remember that ``path`` was just written with the content of tree entry ``entry``."""
+        key = os.path.normpath(path)
+        self.entries[key] = self._signature(os.stat(path)) + [object_id(entry)]
+        self._fresh.add(key)
+        self.dirty = True
+
+    def forget(self, path):
+        if self.entries.pop(os.path.normpath(path), None) is not None:
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        atomic_write_json(self.path, self.entries, indent=None)
+        self.written_ns = os.stat(self.path).st_mtime_ns
+        self._fresh.clear()
+        self.dirty = False
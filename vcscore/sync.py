@@ -0,0 +1,186 @@
+import os
+import json
+from .objects import ObjectStore
+from .commitlog import CommitLog
+from .filehistory import FileHistory
+from .commitgraph import CommitGraph
+from .commitids import CommitIds
+from .atomic import atomic_write, atomic_write_json
+from . import tree
+
+class Endpoint:
+    """The metadata directory of a repository, as one side of a push or pull.
+
+    Paths come from the ``config`` module, taken relative to its VCS_DIR, so
+    a repository with the same layout under another directory name works too.
+    """
+
+    def __init__(self, vcs_dir, config):
+        path = lambda configured: os.path.join(vcs_dir, os.path.relpath(configured, config.VCS_DIR))
+        self.vcs_dir = vcs_dir
+        self.commits_dir = path(config.COMMITS_DIR)
+        self.branches_dir = path(config.BRANCHES_DIR)
+        self.head_file = path(config.HEAD_FILE)
+        self.tags_file = path(config.TAGS_FILE)
+        self.store = ObjectStore(path(config.OBJECTS_DIR))
+        self.commit_log = CommitLog(path(config.LOG_FILE), path(config.LOG_INDEX_FILE))
+        self.file_history = FileHistory(path(config.HISTORY_DIR))
+        self.commit_graph = CommitGraph(path(config.COMMIT_GRAPH_FILE))
+        self.commit_ids = CommitIds(path(config.COMMIT_IDS_FILE))
+
+    def exists(self):
+        return os.path.isdir(self.vcs_dir)
+
+def commit_path(side, commit_id):
+    return os.path.join(side.commits_dir, f"{commit_id}.json")
+
+def read_commit(side, commit_id):
+    path = commit_path(side, commit_id)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+def read_refs(side):
+    """Return every branch of ``side`` mapped to its tip (None for an empty branch)."""
+    if not os.path.isdir(side.branches_dir):
+        return {}
+    refs = {}
+    for name in sorted(os.listdir(side.branches_dir)):
+        if name.startswith(".tmp-"):
+            continue
+        with open(os.path.join(side.branches_dir, name), "r") as f:
+            refs[name] = f.read().strip() or None
+    return refs
+
+def read_tags(side):
+    if not os.path.exists(side.tags_file):
+        return {}
+    with open(side.tags_file, "r") as f:
+        return json.load(f)
+
+def commit_graph(side):
+    """Return the commit graph of ``side``, brought up to date with its commit log."""
+    side.commit_graph.update(side.commit_log, lambda commit_id: read_commit(side, commit_id))
+    return side.commit_graph
+
+def resolve_commit(side, name):
+    """Return the full ID of a commit ID or unique prefix, or None; ValueError if ambiguous."""
+    if os.path.exists(commit_path(side, name)):
+        return name
+    side.commit_ids.update(commit_graph(side))
+    return side.commit_ids.resolve(name)
+
+def is_ancestor(side, ancestor, tip):
+    """Check whether commit ``ancestor`` is reachable from ``tip`` in ``side``."""
+    return commit_graph(side).is_ancestor(ancestor, tip)
+
+def missing_commits(src, tips, have):
+    """Return the commits reachable from ``tips`` in ``src`` that ``have(id)`` rejects, parents first."""
+    order, seen, commits = [], set(), {}
+    stack = [(tip, False) for tip in tips]
+    while stack:
+        commit_id, expanded = stack.pop()
+        if expanded:
+            order.append(commits[commit_id])
+            continue
+        if commit_id in seen or have(commit_id):
+            continue
+        seen.add(commit_id)
+        commits[commit_id] = read_commit(src, commit_id)
+        stack.append((commit_id, True))
+        stack.extend((parent, False) for parent in reversed(commits[commit_id]["parents"]))
+    return order
+
+def missing_objects(src, commits, have):
+    """Return the objects of ``commits`` that ``have(sha)`` rejects, contents before trees."""
+    needed, known = [], {}
+
+    def skip(sha):
+        if sha not in known:
+            known[sha] = have(sha)
+        return known[sha]
+
+    for commit in commits:
+        parents = commit["parents"]
+        base = read_commit(src, parents[0])["tree"] if parents else None
+        for sha in tree.new_objects(src.store, commit["tree"], base, skip):
+            known[sha] = True
+            needed.append(sha)
+    return needed
+
+def plan_updates(refs, src, dst_refs, dst):
+    """Return the branches of ``dst`` to move to the new tips, and those that would not fast-forward."""
+    updates, rejected = {}, []
+    for name, tip in refs.items():
+        old = dst_refs.get(name)
+        if name in dst_refs and (tip is None or tip == old):
+            continue
+        if tip is None:
+            updates[name] = None
+            continue
+        if old is None or is_ancestor(src, old, tip):
+            updates[name] = tip
+        elif is_ancestor(dst, tip, old):
+            continue
+        else:
+            rejected.append(name)
+    return updates, rejected
+
+def rejection(rejected):
+    return {"success": False, "error": f"Rejected non-fast-forward update of {', '.join(rejected)}.",
+            "rejected": rejected}
+
+def add_commits(dst, commits, progress=None):
+    """Write the records and log entries of ``commits`` (parents first) into ``dst``."""
+    record_history = dst.file_history.exists()
+    for commit in commits:
+        atomic_write_json(commit_path(dst, commit["id"]), commit)
+        entry = {"id": commit["id"], "timestamp": commit["timestamp"], "message": commit["message"]}
+        dst.commit_log.append(entry)
+        if record_history:
+            dst.file_history.record(tree.flatten(dst.store, commit["tree"]), entry)
+        if progress is not None:
+            progress.advance(files=1)
+    commit_graph(dst)
+
+def write_refs(dst, updates):
+    for name, tip in updates.items():
+        atomic_write(os.path.join(dst.branches_dir, name), tip or "")
+
+def sync(src, dst, progress=None):
+    """Bring the branches and tags of ``dst`` up to date with ``src``, copying only what it lacks."""
+    updates, rejected = plan_updates(read_refs(src), src, read_refs(dst), dst)
+    if rejected:
+        return rejection(rejected)
+
+    # ``dst`` may be new
+    for directory in (dst.commits_dir, dst.store.root, dst.branches_dir):
+        os.makedirs(directory, exist_ok=True)
+    dst.commit_log.create()
+    if not os.path.exists(dst.head_file) and os.path.exists(src.head_file):
+        with open(src.head_file, "r") as f:
+            atomic_write(dst.head_file, f.read().strip())
+
+    commits = missing_commits(src, [tip for tip in updates.values() if tip],
+                              lambda commit_id: os.path.exists(commit_path(dst, commit_id)))
+    objects = missing_objects(src, commits, dst.store.exists)
+    if progress is not None:
+        progress.expect(files=len(objects) + len(commits))
+
+    for sha in objects:
+        dst.store.copy_from(src.store, sha)
+        if progress is not None:
+            progress.advance(files=1, size=dst.store.size(sha))
+
+    add_commits(dst, commits, progress)
+    write_refs(dst, updates)
+
+    tags = read_tags(dst)
+    new_tags = {name: commit_id for name, commit_id in read_tags(src).items()
+                if name not in tags and os.path.exists(commit_path(dst, commit_id))}
+    if new_tags:
+        atomic_write_json(dst.tags_file, {**tags, **new_tags})
+
+    return {"success": True, "updated": updates, "commits": len(commits),
+            "objects": len(objects), "tags": sorted(new_tags)}
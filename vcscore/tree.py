@@ -0,0 +1,169 @@
+import os
+import json
+import stat
+from .objects import hash_bytes
+
+# A tree object is one directory: a JSON object mapping each name to a file
+# entry, or for subdirectories (names ending in "/") to their tree ID. Paths
+# outside of trees are relative to the workspace and separated by "/".
+#
+# A file entry is the object ID of a regular file, or {"id": ..., "mode":
+# EXECUTABLE} for an executable one. The same entries are used in flat path
+# mappings (the index, workspace states), so a mode change shows up as a
+# change like a content one; objects are looked up through object_id().
+EXECUTABLE = "100755"
+
+def file_entry(sha, executable):
+    return {"id": sha, "mode": EXECUTABLE} if executable else sha
+
+def object_id(entry):
+    """Return the object ID of a file entry."""
+    return entry["id"] if isinstance(entry, dict) else entry
+
+def is_executable(entry):
+    return isinstance(entry, dict) and entry["mode"] == EXECUTABLE
+
+def checkout_file(store, entry, dest):
+    """Write the file of ``entry`` to ``dest`` and set or clear its executable bits to match."""
+    store.copy_to(object_id(entry), dest)
+    mode = stat.S_IMODE(os.stat(dest).st_mode)
+    wanted = mode | (mode & 0o444) >> 2 if is_executable(entry) else mode & ~0o111
+    if wanted != mode:
+        os.chmod(dest, wanted)
+
+def serialize(entries):
+    return json.dumps(entries, sort_keys=True, separators=(",", ":")).encode()
+
+def build(files):
+    """Compute the trees of a flat ``{path: entry}`` mapping; return the root ID and ``{tree ID: entries}``."""
+    root = {}
+    for path, sha in files.items():
+        node = root
+        *dirs, name = path.split("/")
+        for directory in dirs:
+            node = node.setdefault(directory + "/", {})
+        node[name] = sha
+
+    trees = {}
+
+    def seal(node):
+        entries = {name: seal(child) if name.endswith("/") else child for name, child in node.items()}
+        tree_id = hash_bytes(serialize(entries))
+        trees[tree_id] = entries
+        return tree_id
+
+    return seal(root), trees
+
+def write(store, files):
+    """Store the trees of a flat ``{path: entry}`` mapping and return the root tree ID."""
+    root, trees = build(files)
+    for entries in trees.values():
+        store.write_bytes(serialize(entries))
+    return root
+
+def entries(store, tree_id, trees=None):
+    """Return the entries of a tree (None is the empty tree), from ``trees`` if it has it."""
+    if tree_id is None:
+        return {}
+    if trees is not None and tree_id in trees:
+        return trees[tree_id]
+    return json.loads(store.read_bytes(tree_id))
+
+def flatten(store, tree_id, prefix=""):
+    """Return every file under a tree as ``{path: entry}``."""
+    files = {}
+    for name, sha in entries(store, tree_id).items():
+        if name.endswith("/"):
+            files.update(flatten(store, sha, prefix + name))
+        else:
+            files[prefix + name] = sha
+    return files
+
+def lookup(store, tree_id, path):
+    """Return the entry of the file at ``path`` in a tree, reading one tree per directory, or None."""
+    *dirs, name = path.split("/")
+    for directory in dirs:
+        tree_id = entries(store, tree_id).get(directory + "/")
+        if tree_id is None:
+            return None
+    return entries(store, tree_id).get(name)
+
+def diff(store, old, new, trees=None, prefix=""):
+    """Yield ``(path, old entry, new entry)`` for every file that differs between two trees."""
+    if old == new:
+        return
+    a, b = entries(store, old, trees), entries(store, new, trees)
+    for name in sorted(a.keys() | b.keys()):
+        x, y = a.get(name), b.get(name)
+        if x == y:
+            continue
+        if name.endswith("/"):
+            yield from diff(store, x, y, trees, prefix + name)
+        else:
+            yield prefix + name, x, y
+
+def tracked_changes(store, head, files, index):
+    """Yield the paths at which workspace ``files`` differ from tree ``head``, among the files of ``head`` and ``index``."""
+    root, trees = build(files)
+    for path, old, _ in diff(store, head, root, trees):
+        if old is not None or path in index:
+            yield path
+
+def new_objects(store, tree_id, base_id, skip):
+    """Yield the objects of a tree that are not at the same path in tree ``base_id``, trees last."""
+    if tree_id == base_id or skip(tree_id):
+        return
+    base = entries(store, base_id)
+    for name, sha in entries(store, tree_id).items():
+        if base.get(name) == sha:
+            continue
+        if name.endswith("/"):
+            yield from new_objects(store, sha, base.get(name), skip)
+        elif not skip(object_id(sha)):
+            yield object_id(sha)
+    yield tree_id
+
+def repack_hints(store, index, tree_ids):
+    """Map each object to the path it was committed at and how recently.
+
+    ``index`` is the staging area (age 0) and ``tree_ids`` the commit trees, newest first;
+    None stands for a commit that could not be read.
+    """
+    hints = {object_id(sha): (fname, 0) for fname, sha in index.items()}
+    visited = set()
+
+    def visit(tree_id, prefix, age):
+        if tree_id in visited:
+            return
+        visited.add(tree_id)
+        hints.setdefault(tree_id, (prefix, age))
+        for name, sha in entries(store, tree_id).items():
+            if name.endswith("/"):
+                visit(sha, prefix + name, age)
+            else:
+                hints.setdefault(object_id(sha), (prefix + name, age))
+
+    for age, tree_id in enumerate(tree_ids, start=1):
+        if tree_id is not None:
+            visit(tree_id, "", age)
+    return hints
+
+def list_files(root):
+    """Return the paths of all files under the directory ``root``, relative to it, sorted."""
+    paths = []
+    for directory, dirs, names in os.walk(root):
+        dirs.sort()
+        rel = os.path.relpath(directory, root)
+        prefix = "" if rel == "." else rel.replace(os.sep, "/") + "/"
+        paths.extend(prefix + name for name in sorted(names))
+    return paths
+
+def prune_dirs(root, path):
+    """Remove the directories above file ``path`` (relative to ``root``) that are left empty."""
+    directory = os.path.dirname(os.path.join(root, path))
+    while os.path.normpath(directory) != os.path.normpath(root):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            return
+        directory = os.path.dirname(directory)